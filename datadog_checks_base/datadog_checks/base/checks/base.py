@@ -7,22 +7,27 @@ import inspect
 import json
 import logging
 import re
+import time
 import traceback
 import unicodedata
 from collections import defaultdict, deque
 from os.path import basename
 
 import yaml
-from six import PY3, iteritems, text_type
+from six import PY3, iteritems, string_types, text_type
 
 from ..config import is_affirmative
 from ..constants import ServiceCheck
-from ..utils.agent.utils import should_profile_memory
+from ..errors import ConfigurationError
+from ..utils.agent.utils import get_profile_location, should_profile_cpu, should_profile_memory
 from ..utils.common import ensure_bytes, ensure_unicode, to_string
+from ..utils.containers import LRUCache
 from ..utils.http import RequestsWrapper
 from ..utils.limiter import Limiter
 from ..utils.metadata import MetadataManager
+from ..utils.phases import NO_PHASE, PhaseRecorder
 from ..utils.proxy import config_proxy_skip
+from ..utils.tagging import NormalizedTags
 
 try:
     import datadog_agent
@@ -54,6 +59,16 @@ if datadog_agent.get_config('disable_unsafe_yaml'):
 # Metric types for which it's only useful to submit once per set of tags
 ONE_PER_CONTEXT_METRIC_TYPES = [aggregator.GAUGE, aggregator.RATE, aggregator.MONOTONIC_COUNT]
 
+# Metric types accepted by `AgentCheck.submit_metrics`, by name of the equivalent submission method
+BATCH_METRIC_TYPES = {
+    'gauge': aggregator.GAUGE,
+    'count': aggregator.COUNT,
+    'monotonic_count': aggregator.MONOTONIC_COUNT,
+    'rate': aggregator.RATE,
+    'histogram': aggregator.HISTOGRAM,
+    'historate': aggregator.HISTORATE,
+}
+
 
 class __AgentCheck(object):
     """The base class for any Agent based integrations.
@@ -101,6 +116,13 @@ class __AgentCheck(object):
     DOT_UNDERSCORE_CLEANUP = re.compile(br'_*\._*')
     DEFAULT_METRIC_LIMIT = 0
 
+    # Maximum number of metric names, as normalized by `normalize`, kept in memory.
+    # Set to 0 to disable the cache
+    METRIC_NAME_CACHE_SIZE = 1000
+
+    # Number of check runs whose phases are kept in memory when telemetry is enabled, see `phase`
+    PHASE_HISTORY_SIZE = 20
+
     def __init__(self, *args, **kwargs):
         """In general, you don't need to and you should not override anything from the base
         class except the :py:meth:`check` method but sometimes it might be useful for a Check to
@@ -143,6 +165,7 @@ class __AgentCheck(object):
         self.agentConfig = kwargs.get('agentConfig', {})
         self.warnings = []
         self.metric_limiter = None
+        self._metric_name_cache = LRUCache(self.METRIC_NAME_CACHE_SIZE) if self.METRIC_NAME_CACHE_SIZE > 0 else None
 
         if len(args) > 0:
             self.name = args[0]
@@ -232,6 +255,13 @@ class __AgentCheck(object):
         if metric_limit > 0:
             self.metric_limiter = Limiter(self.name, 'metrics', metric_limit, self.warning)
 
+        # Whether to submit debug metrics about the check itself, e.g. the metric name cache usage
+        self._telemetry = is_affirmative(self.instance.get('telemetry', False)) if self.instance else False
+        self._phase_recorder = PhaseRecorder(self.PHASE_HISTORY_SIZE) if self._telemetry else None
+
+        # Number of runs that could have been profiled, used to only profile every `profile_cpu_interval` run
+        self._cpu_profiling_runs = 0
+
         # Functions that will be called exactly once (if successful) before the first check run
         self.check_initializations = deque([self.send_config_metadata])
 
@@ -350,6 +380,75 @@ class __AgentCheck(object):
 
         aggregator.submit_metric(self, self.check_id, mtype, self._format_namespace(name, raw), value, tags, hostname)
 
+    def submit_metrics(self, metric_type, metrics, raw=False):
+        """Sample a batch of metrics of the same type.
+
+        This is equivalent to calling the submission method named ``metric_type`` for every point, but meant for
+        checks sending many points per run: the namespace is formatted once per distinct name, tags that are
+        already normalized are passed as is, and the points are handed to the aggregator in a single call when
+        it supports it.
+
+        :param str metric_type: one of ``gauge``, ``count``, ``monotonic_count``, ``rate``, ``histogram`` or
+            ``historate``.
+        :param metrics: an iterable of ``(name, value, tags, hostname)`` tuples, ``tags`` and ``hostname`` may be
+            ``None``.
+        :param bool raw: (optional) whether to ignore any defined namespace prefix
+        """
+        try:
+            mtype = BATCH_METRIC_TYPES[metric_type]
+        except KeyError:
+            raise ValueError('Unknown metric type: {}'.format(metric_type))
+
+        metric_limiter = self.metric_limiter
+        one_per_context = mtype in ONE_PER_CONTEXT_METRIC_TYPES
+        normalize_tags = self._normalize_tags_type
+        names = {}
+        batch = []
+        for name, value, tags, hostname in metrics:
+            if value is None:
+                # ignore metric sample
+                continue
+
+            tags = normalize_tags(tags, metric_name=name)
+            if hostname is None:
+                hostname = ''
+
+            if metric_limiter:
+                if one_per_context:
+                    if metric_limiter.is_reached():
+                        break
+                elif metric_limiter.is_reached(self._context_uid(mtype, name, tags, hostname)):
+                    continue
+
+            try:
+                value = float(value)
+            except ValueError:
+                err_msg = 'Metric: {} has non float value: {}. Only float values can be submitted as metrics.'.format(
+                    repr(name), repr(value)
+                )
+                if using_stub_aggregator:
+                    raise ValueError(err_msg)
+                self.warning(err_msg)
+                continue
+
+            formatted_name = names.get(name)
+            if formatted_name is None:
+                formatted_name = names[name] = self._format_namespace(name, raw)
+
+            batch.append((formatted_name, value, tags, hostname))
+
+        if not batch:
+            return
+
+        submit_metrics = getattr(aggregator, 'submit_metrics', None)
+        if submit_metrics is not None:
+            submit_metrics(self, self.check_id, mtype, batch)
+        else:
+            submit_metric = aggregator.submit_metric
+            check_id = self.check_id
+            for name, value, tags, hostname in batch:
+                submit_metric(self, check_id, mtype, name, value, tags, hostname)
+
     def gauge(self, name, value, tags=None, hostname=None, device_name=None, raw=False):
         """Sample a gauge metric.
 
@@ -609,6 +708,18 @@ class __AgentCheck(object):
         :param prefix A prefix to to add to the normalized name, default None
         :param fix_case A boolean, indicating whether to make sure that the metric name returned is in "snake_case"
         """
+        cache = self._metric_name_cache
+        if cache is None:
+            return self._normalize_metric_name(metric, prefix, fix_case)
+
+        key = (metric, prefix, fix_case)
+        name = cache.get(key)
+        if name is None:
+            name = self._normalize_metric_name(metric, prefix, fix_case)
+            cache.set(key, name)
+        return name
+
+    def _normalize_metric_name(self, metric, prefix, fix_case):
         if isinstance(metric, text_type):
             metric = unicodedata.normalize('NFKD', metric).encode('ascii', 'ignore')
 
@@ -635,7 +746,107 @@ class __AgentCheck(object):
     def check(self, instance):
         raise NotImplementedError
 
+    def phase(self, name):
+        """
+        Time a phase of the check run, e.g. fetching or parsing a payload, with a context manager. The number of
+        items handled during the phase can be added with its `add` method:
+
+            with self.phase('parse') as phase:
+                for item in items:
+                    phase.add()
+
+        When telemetry is enabled, the total duration and item count of every phase of a run are submitted as
+        `<NAMESPACE>.telemetry.phase.*` metrics tagged by `phase`, and the phases of the last runs are kept in
+        memory, see `get_phase_history`. Otherwise this does nothing.
+
+        Phases may be timed by several threads during a run, e.g. when querying devices concurrently, their
+        durations are then summed.
+        """
+        recorder = self._phase_recorder
+        if recorder is None:
+            return NO_PHASE
+
+        return recorder.phase(name)
+
+    def record_phase(self, name, duration, count=0):
+        """
+        Record a phase of the check run that was timed elsewhere, e.g. by a callback, see `phase`.
+        """
+        recorder = self._phase_recorder
+        if recorder is not None:
+            recorder.record(name, duration, count)
+
+    def get_phase_history(self):
+        """
+        Return the phases of the last `PHASE_HISTORY_SIZE` runs, oldest first, for debugging purposes.
+        """
+        recorder = self._phase_recorder
+        if recorder is None:
+            return []
+
+        return list(recorder.history)
+
+    def _send_telemetry(self, run_duration):
+        namespace = self.__NAMESPACE__ or self.name
+        tags = list(self.instance.get('tags') or [])
+
+        recorder = self._phase_recorder
+        if recorder is not None:
+            run = recorder.finish_run(run_duration)
+            self.gauge('{}.telemetry.run.time'.format(namespace), run_duration, tags=tags, raw=True)
+
+            prefix = '{}.telemetry.phase'.format(namespace)
+            for phase in run['phases']:
+                phase_tags = tags + ['phase:{}'.format(phase['name'])]
+                self.gauge('{}.time'.format(prefix), phase['duration'], tags=phase_tags, raw=True)
+                self.count('{}.calls.count'.format(prefix), phase['calls'], tags=phase_tags, raw=True)
+                self.count('{}.items.count'.format(prefix), phase['count'], tags=phase_tags, raw=True)
+
+        http = self._http
+        if http is not None and http.connection_pooling:
+            prefix = '{}.telemetry.http'.format(namespace)
+            sent, opened = http.pool_stats['requests'], http.pool_stats['connections']
+            self.count('{}.requests.count'.format(prefix), sent, tags=tags, raw=True)
+            self.count('{}.connections.new.count'.format(prefix), opened, tags=tags, raw=True)
+            self.count('{}.connections.reused.count'.format(prefix), max(0, sent - opened), tags=tags, raw=True)
+            http.reset_pool_stats()
+
+        cache = self._metric_name_cache
+        if cache is None:
+            return
+
+        prefix = '{}.telemetry.metric_name_cache'.format(namespace)
+        self.gauge('{}.size'.format(prefix), len(cache), tags=tags, raw=True)
+        self.count('{}.hits.count'.format(prefix), cache.hits, tags=tags, raw=True)
+        self.count('{}.misses.count'.format(prefix), cache.misses, tags=tags, raw=True)
+        self.count('{}.evictions.count'.format(prefix), cache.evictions, tags=tags, raw=True)
+        cache.reset_stats()
+
+    def _should_profile_cpu(self):
+        # A directory to write the profiles to, or a boolean, `true` only sends the metrics
+        value = self.init_config.get('profile_cpu')
+        if value is not None and not isinstance(value, (bool, string_types)):
+            raise ConfigurationError('`profile_cpu` must be a directory or a boolean, got: {!r}'.format(value))
+
+        enabled = get_profile_location(value) is not None or is_affirmative(value)
+        if not enabled and not should_profile_cpu(datadog_agent, self.name):
+            return False
+
+        from ..utils.agent.cpu import DEFAULT_INTERVAL
+
+        interval = int(self.init_config.get('profile_cpu_interval', DEFAULT_INTERVAL))
+        run = self._cpu_profiling_runs
+        self._cpu_profiling_runs += 1
+
+        return interval <= 1 or run % interval == 0
+
+    def _profiling_tags(self, instance):
+        tags = ['check_name:{}'.format(self.name), 'check_version:{}'.format(self.check_version)]
+        tags.extend(instance.get('__memory_profiling_tags', []))
+        return tags
+
     def run(self):
+        started = time.time()
         try:
             while self.check_initializations:
                 initialization = self.check_initializations.popleft()
@@ -660,10 +871,19 @@ class __AgentCheck(object):
                     self.check, self.init_config, namespaces=self.check_id.split(':', 1), args=(instance,)
                 )
 
-                tags = ['check_name:{}'.format(self.name), 'check_version:{}'.format(self.check_version)]
-                tags.extend(instance.get('__memory_profiling_tags', []))
+                tags = self._profiling_tags(instance)
                 for m in metrics:
                     self.gauge(m.name, m.value, tags=tags, raw=True)
+            elif self._should_profile_cpu():
+                from ..utils.agent.cpu import profile_cpu
+
+                metrics = profile_cpu(
+                    self.check, self.init_config, namespaces=self.check_id.split(':', 1), args=(instance,)
+                )
+
+                tags = self._profiling_tags(instance)
+                for m in metrics:
+                    self.gauge(m.name, m.value, tags=tags + m.tags, raw=True)
             else:
                 self.check(instance)
 
@@ -671,6 +891,8 @@ class __AgentCheck(object):
         except Exception as e:
             result = json.dumps([{'message': str(e), 'traceback': traceback.format_exc()}])
         finally:
+            if self._telemetry:
+                self._send_telemetry(time.time() - started)
             if self.metric_limiter:
                 self.metric_limiter.reset()
 
@@ -736,7 +958,11 @@ class __AgentCheckPy3(__AgentCheck):
         - append `device_name` as `device:` tag
         - normalize tags type
         - doesn't mutate the passed list, returns a new list
+        - `NormalizedTags` are returned as is
         """
+        if device_name is None and type(tags) is NormalizedTags:
+            return tags
+
         normalized_tags = []
 
         if device_name:
@@ -798,7 +1024,11 @@ class __AgentCheckPy2(__AgentCheck):
         - append `device_name` as `device:` tag
         - normalize tags type
         - doesn't mutate the passed list, returns a new list
+        - `NormalizedTags` are returned as is
         """
+        if device_name is None and type(tags) is NormalizedTags:
+            return tags
+
         normalized_tags = []
 
         if device_name:
@@ -74,16 +74,18 @@ class Pool(object):
     few different ways
     """
 
-    def __init__(self, nworkers, name="Pool"):
+    def __init__(self, nworkers, name="Pool", daemon=False):
         """
         \param nworkers (integer) number of worker threads to start
         \param name (string) prefix for the worker threads' name
+        \param daemon (boolean) whether the worker threads let the interpreter exit
         """
         self._workq = queue.Queue()
         self._closed = False
         self._workers = []
         for idx in range(nworkers):
             thr = PoolWorker(self._workq, name="Worker-%s-%d" % (name, idx))
+            thr.daemon = daemon
             try:
                 thr.start()
             except:
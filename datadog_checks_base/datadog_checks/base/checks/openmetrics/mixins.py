@@ -2,20 +2,29 @@
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
 
+import hashlib
+import sys
+from collections import Counter, deque
 from fnmatch import fnmatchcase
+from functools import partial
 from math import isinf, isnan
 from os.path import isfile
 
 import requests
-from prometheus_client.parser import text_fd_to_metric_families
-from six import PY3, iteritems, itervalues, string_types
+from six import PY3, get_unbound_function, iteritems, itervalues, reraise, string_types
 from urllib3 import disable_warnings
 from urllib3.exceptions import InsecureRequestWarning
 
 from ...config import is_affirmative
 from ...errors import CheckException
-from ...utils.common import to_string
+from ...utils.common import ensure_bytes, to_string
+from ...utils.containers import LRUCache
+from ...utils.prometheus.label_joins import LabelJoinIndex
+from ...utils.prometheus.parser import text_fd_to_metric_families
+from ...utils.tagging import NormalizedTags
 from .. import AgentCheck
+from ..libs.thread_pool import Pool
+from ..libs.timer import Timer
 
 if PY3:
     long = int
@@ -39,15 +48,45 @@ class OpenMetricsScraperMixin(object):
     TELEMETRY_COUNTER_METRICS_INPUT_COUNT = "metrics.input.count"
     TELEMETRY_COUNTER_METRICS_IGNORE_COUNT = "metrics.ignored.count"
     TELEMETRY_COUNTER_METRICS_PROCESS_COUNT = "metrics.processed.count"
+    TELEMETRY_COUNTER_METRICS_PLAN_CACHE_HIT_COUNT = "metrics.plan_cache.hit.count"
+    TELEMETRY_COUNTER_METRICS_PLAN_CACHE_MISS_COUNT = "metrics.plan_cache.miss.count"
+    TELEMETRY_GAUGE_TAGS_CACHE_SIZE = "tags_cache.size"
+    TELEMETRY_COUNTER_TAGS_CACHE_EVICTION_COUNT = "tags_cache.evictions.count"
+    TELEMETRY_GAUGE_SCRAPE_FETCH_TIME = "scrape.fetch.time"
+    TELEMETRY_GAUGE_SCRAPE_PROCESS_TIME = "scrape.process.time"
+    TELEMETRY_COUNTER_SCRAPE_REPLAY_COUNT = "scrape.replayed.count"
+    TELEMETRY_GAUGE_LABEL_JOINS_SIZE = "label_joins.size"
+    TELEMETRY_COUNTER_LABEL_JOINS_EVICTION_COUNT = "label_joins.evictions.count"
+    TELEMETRY_COUNTER_LABEL_JOINS_EXPIRATION_COUNT = "label_joins.expirations.count"
+
+    DEFAULT_METRIC_TAGS_CACHE_SIZE = 10000
+
+    # outcomes of the metric submission plan, see `_get_metric_plan`
+    PLAN_IGNORE = 0
+    PLAN_MAPPED = 1
+    PLAN_TRANSFORMER = 2
+    PLAN_WILDCARD = 3
+    PLAN_SKIP = 4
 
     METRIC_TYPES = ['counter', 'gauge', 'summary', 'histogram']
 
     KUBERNETES_TOKEN_PATH = '/var/run/secrets/kubernetes.io/serviceaccount/token'
 
+    # Submissions made while processing a metric family are appended here, see `process`
+    _submission_recording = None
+
     def __init__(self, *args, **kwargs):
         # Initialize AgentCheck's base class
         super(OpenMetricsScraperMixin, self).__init__(*args, **kwargs)
 
+        instance = self.instance or {}
+        # Number of threads fetching endpoints concurrently in `process_endpoints`, 0 fetches them one at a time
+        self.scrape_workers = int(instance.get('scrape_workers', 0))
+        # Maximum number of responses fetched by `process_endpoints` but not processed yet, as they are held in memory
+        self.scrape_max_in_flight = int(instance.get('scrape_max_in_flight', self.scrape_workers))
+        # Threads of `process_endpoints`, started by its first concurrent run and kept until `cancel`
+        self._scrape_pool = None
+
     def create_scraper_configuration(self, instance=None):
 
         # We can choose to create a default mixin configuration for an empty instance
@@ -98,6 +137,22 @@ class OpenMetricsScraperMixin(object):
         # `_metrics_wildcards` holds the potential wildcards to match for metrics
         config['_metrics_wildcards'] = None
 
+        # `_metric_plans` memoizes how each metric family name is handled by `process_metric`, example:
+        # self._metric_plans = {
+        #     'process_virtual_memory_bytes': (PLAN_MAPPED, 'process.vm.bytes'),
+        #     'go_gc_duration_seconds': (PLAN_SKIP, None),
+        # }
+        config['_metric_plans'] = {}
+        # The `metrics_mapper` and `ignore_metrics` objects (and a fingerprint of their content)
+        # the plans were compiled from, any change invalidates them
+        config['_metric_plans_sources'] = (None, None)
+        config['_metric_plans_fingerprint'] = None
+        # Plan cache hits and misses since the last telemetry flush
+        config['_metric_plans_stats'] = {'hit': 0, 'miss': 0}
+        # Transformers of the ongoing `process` call. While set, families whose cached plan says they would
+        # be ignored or skipped are dropped by the text parser before their samples are parsed.
+        config['_metric_plans_transformers'] = None
+
         # `prometheus_metrics_prefix` allows to specify a prefix that all
         # prometheus metrics should have. This can be used when the prometheus
         # endpoint we are scrapping allows to add a custom prefix to it's
@@ -117,26 +172,18 @@ class OpenMetricsScraperMixin(object):
         config['label_joins'] = default_instance.get('label_joins', {})
         config['label_joins'].update(instance.get('label_joins', {}))
 
-        # `_label_mapping` holds the additionals label info to add for a specific
-        # label value, example:
-        # self._label_mapping = {
-        #     'pod': {
-        #         'dd-agent-9s1l1': [("node","yolo"),("host_ip","yey")]
-        #     }
-        # }
-        config['_label_mapping'] = {}
+        # Maximum number of label values whose labels are kept for `label_joins`, the least recently
+        # seen are evicted first. Set to 0 to keep all of them
+        config['label_joins_max_size'] = int(
+            instance.get('label_joins_max_size', default_instance.get('label_joins_max_size', 0))
+        )
 
-        # `_active_label_mapping` holds a dictionary of label values found during the run
-        # to cleanup the label_mapping of unused values, example:
-        # self._active_label_mapping = {
-        #     'pod': {
-        #         'dd-agent-9s1l1': True
-        #     }
-        # }
-        config['_active_label_mapping'] = {}
+        # Number of scrapes the labels of a label value are kept for after it was last seen
+        config['label_joins_ttl'] = int(instance.get('label_joins_ttl', default_instance.get('label_joins_ttl', 1)))
 
-        # `_watched_labels` holds the list of label to watch for enrichment
-        config['_watched_labels'] = set()
+        # `_label_join_index` holds the additional labels to add for a specific label value,
+        # built from `label_joins` when first needed, see `_get_label_join_index`
+        config['_label_join_index'] = None
 
         config['_dry_run'] = True
 
@@ -249,6 +296,23 @@ class OpenMetricsScraperMixin(object):
         # Additional tags to be sent with each metric
         config['_metric_tags'] = []
 
+        # Maximum number of distinct label sets whose finished tags are cached between scrapes,
+        # set to 0 to disable the cache
+        config['metric_tags_cache_size'] = int(
+            instance.get(
+                'metric_tags_cache_size',
+                default_instance.get('metric_tags_cache_size', self.DEFAULT_METRIC_TAGS_CACHE_SIZE),
+            )
+        )
+
+        # `_metric_tags_cache` maps the label items of a sample to its finished tags. Tags can only be cached
+        # if `_finalize_tags_to_submit` leaves them untouched, as it may depend on the sample value
+        config['_metric_tags_cache'] = None
+        if config['metric_tags_cache_size'] > 0 and self._has_noop_tags_finalizer():
+            config['_metric_tags_cache'] = LRUCache(config['metric_tags_cache_size'])
+        # Fingerprint of the settings the cached tags were computed from
+        config['_metric_tags_cache_fingerprint'] = None
+
         # List of strings to filter the input text payload on. If any line contains
         # one of these strings, it will be filtered out before being parsed.
         # INTERNAL FEATURE, might be removed in future versions
@@ -269,6 +333,26 @@ class OpenMetricsScraperMixin(object):
         # The service account bearer token to be used for authentication
         config['_bearer_token'] = self._get_bearer_token(config['bearer_token_auth'], config['bearer_token_path'])
 
+        # Response fetched ahead of time by `process_endpoints`, consumed by the next `poll`
+        config['_prefetched_response'] = None
+
+        # Duration of the request of the last `poll`, in seconds
+        config['_fetch_time'] = None
+
+        # Whether to send conditional requests, and to skip parsing payloads identical to the previous one.
+        # When the payload is unchanged, the gauges and service checks of the last scrape are submitted again
+        config['conditional_scrapes'] = is_affirmative(
+            instance.get('conditional_scrapes', default_instance.get('conditional_scrapes', False))
+        )
+        # Digest, conditional request headers and recorded submissions of the last payload fully processed
+        config['_scrape_digest'] = None
+        config['_conditional_headers'] = {}
+        config['_scrape_recording'] = None
+        # Digest and conditional request headers of the payload being processed
+        config['_scrape_pending'] = None
+        # Why the last scrape is replayed instead of processed, if it is
+        config['_scrape_replay'] = None
+
         config['telemetry'] = is_affirmative(instance.get('telemetry', default_instance.get('telemetry', False)))
 
         # The metric name services use to indicate build information
@@ -298,7 +382,16 @@ class OpenMetricsScraperMixin(object):
         if scraper_config['_text_filter_blacklist']:
             input_gen = self._text_filter_input(input_gen, scraper_config)
 
-        for metric in text_fd_to_metric_families(input_gen):
+        family_filter = None
+        skipped = None
+        metric_transformers = scraper_config['_metric_plans_transformers']
+        if metric_transformers is not None:
+            family_filter = partial(
+                self._keep_metric_family, scraper_config=scraper_config, metric_transformers=metric_transformers
+            )
+            skipped = Counter()
+
+        for metric in text_fd_to_metric_families(input_gen, family_filter, skipped):
             self._send_telemetry_counter(
                 self.TELEMETRY_COUNTER_METRICS_INPUT_COUNT, len(metric.samples), scraper_config
             )
@@ -308,6 +401,53 @@ class OpenMetricsScraperMixin(object):
             metric.name = self._remove_metric_prefix(metric.name, scraper_config)
             yield metric
 
+        if skipped and scraper_config['telemetry']:
+            self._send_skipped_families_telemetry(skipped, scraper_config)
+
+    def _keep_metric_family(self, name, typ, scraper_config, metric_transformers):
+        """
+        Tell the text parser whether the samples of a family are worth parsing. Only families with
+        a cached plan telling `process_metric` to ignore or skip them are dropped.
+        """
+        if scraper_config['type_overrides'].get(name, typ) not in self.METRIC_TYPES:
+            return False
+
+        name = self._remove_metric_prefix(name, scraper_config)
+        if name in scraper_config['label_joins']:
+            return True
+
+        plan = self._get_cached_metric_plan(name, scraper_config, metric_transformers)
+        if plan is None or (plan[0] != self.PLAN_IGNORE and plan[0] != self.PLAN_SKIP):
+            return True
+
+        # `process_metric` will not see this family, account for the plan lookup here
+        scraper_config['_metric_plans_stats']['hit'] += 1
+        if plan[0] == self.PLAN_SKIP:
+            self.log.debug(
+                'Skipping metric `%s` as it is not defined in the metrics mapper, '
+                'has no transformer function, nor does it match any wildcards.',
+                name,
+            )
+        return False
+
+    def _send_skipped_families_telemetry(self, skipped, scraper_config):
+        input_count = ignore_count = process_count = 0
+        for (name, typ), count in iteritems(skipped):
+            input_count += count
+            if scraper_config['type_overrides'].get(name, typ) not in self.METRIC_TYPES:
+                continue
+            plan = scraper_config['_metric_plans'].get(self._remove_metric_prefix(name, scraper_config))
+            if plan is not None and plan[0] == self.PLAN_IGNORE:
+                ignore_count += count
+            else:
+                process_count += count
+
+        self._send_telemetry_counter(self.TELEMETRY_COUNTER_METRICS_INPUT_COUNT, input_count, scraper_config)
+        if ignore_count:
+            self._send_telemetry_counter(self.TELEMETRY_COUNTER_METRICS_IGNORE_COUNT, ignore_count, scraper_config)
+        if process_count:
+            self._send_telemetry_counter(self.TELEMETRY_COUNTER_METRICS_PROCESS_COUNT, process_count, scraper_config)
+
     def _text_filter_input(self, input_gen, scraper_config):
         """
         Filters out the text input line by line to avoid parsing and processing
@@ -341,25 +481,21 @@ class OpenMetricsScraperMixin(object):
                 content_len = len(response.content)
             self._send_telemetry_gauge(self.TELEMETRY_GAUGE_MESSAGE_SIZE, content_len, scraper_config)
         try:
+            if scraper_config['conditional_scrapes'] and self._is_payload_unchanged(response, scraper_config):
+                return
+
             # no dry run if no label joins
             if not scraper_config['label_joins']:
                 scraper_config['_dry_run'] = False
-            elif not scraper_config['_watched_labels']:
-                # build the _watched_labels set
-                for val in itervalues(scraper_config['label_joins']):
-                    scraper_config['_watched_labels'].add(val['label_to_match'])
 
             for metric in self.parse_metric_family(response, scraper_config):
                 yield metric
 
             # Set dry run off
             scraper_config['_dry_run'] = False
-            # Garbage collect unused mapping and reset active labels
-            for metric, mapping in list(iteritems(scraper_config['_label_mapping'])):
-                for key in list(mapping):
-                    if key not in scraper_config['_active_label_mapping'][metric]:
-                        del scraper_config['_label_mapping'][metric][key]
-            scraper_config['_active_label_mapping'] = {}
+            # Expire the labels of label values not seen recently
+            if scraper_config['label_joins']:
+                self._expire_label_joins(scraper_config)
         finally:
             response.close()
 
@@ -375,8 +511,211 @@ class OpenMetricsScraperMixin(object):
         if metric_transformers:
             transformers.update(metric_transformers)
 
-        for metric in self.scrape_metrics(scraper_config):
-            self.process_metric(metric, scraper_config, metric_transformers=transformers)
+        self._validate_metric_plans(scraper_config)
+        self._validate_metric_tags_cache(scraper_config)
+
+        # Submissions are not recorded during the dry run, as label joins don't submit anything then
+        recording = None
+        if scraper_config['conditional_scrapes'] and not (scraper_config['_dry_run'] and scraper_config['label_joins']):
+            recording = []
+
+        scraper_config['_metric_plans_transformers'] = transformers
+        try:
+            # Parsing and submission are interleaved, they are timed together
+            with self.phase('process') as phase:
+                for metric in self.scrape_metrics(scraper_config):
+                    # Only record what is computed from the payload, not the health service check nor telemetry
+                    self._submission_recording = recording
+                    self.process_metric(metric, scraper_config, metric_transformers=transformers)
+                    self._submission_recording = None
+                    phase.add()
+        finally:
+            self._submission_recording = None
+            scraper_config['_metric_plans_transformers'] = None
+
+        if scraper_config['conditional_scrapes']:
+            self._finish_conditional_scrape(scraper_config, recording)
+
+        tags_cache = scraper_config['_metric_tags_cache']
+        if tags_cache is not None:
+            self._send_telemetry_gauge(self.TELEMETRY_GAUGE_TAGS_CACHE_SIZE, len(tags_cache), scraper_config)
+            self._send_telemetry_counter(
+                self.TELEMETRY_COUNTER_TAGS_CACHE_EVICTION_COUNT, tags_cache.evictions, scraper_config
+            )
+            tags_cache.reset_stats()
+
+        stats = scraper_config['_metric_plans_stats']
+        self._send_telemetry_counter(self.TELEMETRY_COUNTER_METRICS_PLAN_CACHE_HIT_COUNT, stats['hit'], scraper_config)
+        self._send_telemetry_counter(
+            self.TELEMETRY_COUNTER_METRICS_PLAN_CACHE_MISS_COUNT, stats['miss'], scraper_config
+        )
+        stats['hit'] = 0
+        stats['miss'] = 0
+
+    def _is_payload_unchanged(self, response, scraper_config):
+        """
+        Tell whether a response holds the same payload as the last one fully processed, in which case
+        its submissions can be replayed.
+        """
+        if response.status_code == 304:
+            reason = 'not_modified'
+        else:
+            # The whole payload is read in memory to be hashed, the parser then reads it from there
+            digest = hashlib.sha1(ensure_bytes(response.content)).hexdigest()
+            conditional_headers = {}
+            if response.headers.get('ETag'):
+                conditional_headers['If-None-Match'] = response.headers['ETag']
+            if response.headers.get('Last-Modified'):
+                conditional_headers['If-Modified-Since'] = response.headers['Last-Modified']
+            scraper_config['_scrape_pending'] = (digest, conditional_headers)
+
+            if digest != scraper_config['_scrape_digest']:
+                return False
+            reason = 'unchanged'
+
+        if scraper_config['_scrape_recording'] is None:
+            return False
+
+        scraper_config['_scrape_replay'] = reason
+        return True
+
+    def _finish_conditional_scrape(self, scraper_config, recording):
+        reason = scraper_config['_scrape_replay']
+        if reason is not None:
+            scraper_config['_scrape_replay'] = None
+            for method, args in scraper_config['_scrape_recording']:
+                getattr(self, method)(*args)
+            self._send_telemetry_counter(
+                self.TELEMETRY_COUNTER_SCRAPE_REPLAY_COUNT, 1, scraper_config, extra_tags=['reason:{}'.format(reason)]
+            )
+            return
+
+        pending = scraper_config['_scrape_pending']
+        scraper_config['_scrape_pending'] = None
+        if recording is None or pending is None:
+            scraper_config['_scrape_digest'] = None
+            scraper_config['_conditional_headers'] = {}
+            scraper_config['_scrape_recording'] = None
+        else:
+            scraper_config['_scrape_digest'], scraper_config['_conditional_headers'] = pending
+            scraper_config['_scrape_recording'] = recording
+
+    def gauge(self, name, value, tags=None, hostname=None, device_name=None, raw=False):
+        if self._submission_recording is not None:
+            tags = list(tags) if tags is not None else None
+            self._submission_recording.append(('gauge', (name, value, tags, hostname, device_name, raw)))
+        super(OpenMetricsScraperMixin, self).gauge(name, value, tags, hostname, device_name, raw)
+
+    def submit_metrics(self, metric_type, metrics, raw=False):
+        if self._submission_recording is not None and metric_type == 'gauge':
+            metrics = list(metrics)
+            self._submission_recording.append(('submit_metrics', (metric_type, metrics, raw)))
+        super(OpenMetricsScraperMixin, self).submit_metrics(metric_type, metrics, raw)
+
+    def service_check(self, name, status, tags=None, hostname=None, message=None, raw=False):
+        if self._submission_recording is not None:
+            tags = list(tags) if tags is not None else None
+            self._submission_recording.append(('service_check', (name, status, tags, hostname, message, raw)))
+        super(OpenMetricsScraperMixin, self).service_check(name, status, tags, hostname, message, raw)
+
+    def process_endpoints(self, scrapes):
+        """
+        Process several scraper configurations, one after the other, see `process`.
+
+        If `scrape_workers` is set, the endpoints are fetched ahead of time by that many threads, while metrics
+        are still parsed and submitted by the calling thread, in order. No more than `scrape_max_in_flight`
+        responses are held in memory at once.
+
+        :param scrapes: list of `(scraper_config, metric_transformers)` tuples
+        """
+        if self.scrape_workers < 1 or len(scrapes) < 2:
+            for scraper_config, metric_transformers in scrapes:
+                self._process_scrape(scraper_config, metric_transformers)
+            return
+
+        if self._scrape_pool is None:
+            workers = max(1, min(self.scrape_workers, self.scrape_max_in_flight))
+            self._scrape_pool = Pool(workers, name='{}-scraper'.format(self.name), daemon=True)
+
+        in_flight = max(1, min(self.scrape_max_in_flight, len(scrapes)))
+        fetches = deque()
+        try:
+            for scraper_config, metric_transformers in scrapes:
+                fetch = self._scrape_pool.apply_async(self._fetch, (scraper_config,))
+                fetches.append((scraper_config, metric_transformers, fetch))
+                if len(fetches) == in_flight:
+                    # Process the oldest response to make room for the next one
+                    self._process_scrape(*fetches.popleft())
+
+            while fetches:
+                self._process_scrape(*fetches.popleft())
+        finally:
+            # Release the responses left behind by a failure, the requests are bound by their timeout
+            for _, _, fetch in fetches:
+                response = fetch.get()[0]
+                if response is not None:
+                    response.close()
+
+    def cancel(self):
+        """
+        Stop the threads of `process_endpoints`, called when the check instance is unscheduled.
+        """
+        if self._scrape_pool is not None:
+            self._scrape_pool.terminate()
+            self._scrape_pool = None
+
+    def _fetch(self, scraper_config):
+        """
+        Send the request of a scraper configuration and download the whole response, in a worker thread.
+        Nothing is submitted from here, errors are handed over to the thread processing the response.
+        """
+        timer = Timer()
+        try:
+            response = self.send_request(scraper_config['prometheus_url'], scraper_config)
+        except Exception:
+            return None, sys.exc_info(), timer.total()
+
+        try:
+            # The content is cached by the response, the parser will read it from memory
+            response.content
+        except Exception:
+            response.close()
+            return None, sys.exc_info(), timer.total()
+
+        return response, None, timer.total()
+
+    def _process_scrape(self, scraper_config, metric_transformers, fetch=None):
+        """
+        Process a scraper configuration, with the response of a worker thread if `fetch` is set, and send the time
+        spent fetching and processing the endpoint as telemetry.
+        """
+        scraper_config['_prefetched_response'] = fetch
+        scraper_config['_fetch_time'] = None
+        timer = Timer()
+        try:
+            self.process(scraper_config, metric_transformers=metric_transformers)
+        finally:
+            if scraper_config['_prefetched_response'] is not None:
+                # `process` failed before polling
+                scraper_config['_prefetched_response'] = None
+                response = fetch.get()[0]
+                if response is not None:
+                    response.close()
+
+        if scraper_config['telemetry']:
+            tags = ['endpoint:{}'.format(scraper_config['prometheus_url'])]
+            fetch_time = scraper_config['_fetch_time']
+            process_time = timer.total()
+            if fetch_time is not None:
+                if fetch is None:
+                    # The request was sent by `process`
+                    process_time -= fetch_time
+                self._send_telemetry_gauge(
+                    self.TELEMETRY_GAUGE_SCRAPE_FETCH_TIME, fetch_time, scraper_config, extra_tags=tags
+                )
+            self._send_telemetry_gauge(
+                self.TELEMETRY_GAUGE_SCRAPE_PROCESS_TIME, process_time, scraper_config, extra_tags=tags
+            )
 
     def transform_metadata(self, metric, scraper_config):
         labels = metric.samples[0][self.SAMPLE_LABELS]
@@ -387,13 +726,15 @@ class OpenMetricsScraperMixin(object):
     def _telemetry_metric_name_with_namespace(self, metric_name, scraper_config):
         return '{}.{}.{}'.format(scraper_config['namespace'], 'telemetry', metric_name)
 
-    def _send_telemetry_gauge(self, metric_name, val, scraper_config):
+    def _send_telemetry_gauge(self, metric_name, val, scraper_config, extra_tags=None):
         if scraper_config['telemetry']:
             metric_name_with_namespace = self._telemetry_metric_name_with_namespace(metric_name, scraper_config)
             # Determine the tags to send
             custom_tags = scraper_config['custom_tags']
             tags = list(custom_tags)
             tags.extend(scraper_config['_metric_tags'])
+            if extra_tags:
+                tags.extend(extra_tags)
             self.gauge(metric_name_with_namespace, val, tags=tags)
 
     def _send_telemetry_counter(self, metric_name, val, scraper_config, extra_tags=None):
@@ -407,51 +748,123 @@ class OpenMetricsScraperMixin(object):
                 tags.extend(extra_tags)
             self.count(metric_name_with_namespace, val, tags=tags)
 
+    def _get_label_join_index(self, scraper_config):
+        index = scraper_config['_label_join_index']
+        # Rebuild the index if the label joins were changed since it was built
+        if index is None or index.label_joins != scraper_config['label_joins']:
+            index = scraper_config['_label_join_index'] = LabelJoinIndex(
+                scraper_config['label_joins'],
+                max_size=scraper_config['label_joins_max_size'],
+                ttl=scraper_config['label_joins_ttl'],
+            )
+        return index
+
     def _store_labels(self, metric, scraper_config):
         # If targeted metric, store labels
         if metric.name in scraper_config['label_joins']:
-            matching_label = scraper_config['label_joins'][metric.name]['label_to_match']
+            index = self._get_label_join_index(scraper_config)
             for sample in metric.samples:
                 # metadata-only metrics that are used for label joins are always equal to 1
                 # this is required for metrics where all combinations of a state are sent
                 # but only the active one is set to 1 (others are set to 0)
                 # example: kube_pod_status_phase in kube-state-metrics
-                if sample[self.SAMPLE_VALUE] != 1:
-                    continue
-                label_dict = dict()
-                matching_value = None
-                for label_name, label_value in iteritems(sample[self.SAMPLE_LABELS]):
-                    if label_name == matching_label:
-                        matching_value = label_value
-                    elif label_name in scraper_config['label_joins'][metric.name]['labels_to_get']:
-                        label_dict[label_name] = label_value
-                try:
-                    if scraper_config['_label_mapping'][matching_label].get(matching_value):
-                        scraper_config['_label_mapping'][matching_label][matching_value].update(label_dict)
-                    else:
-                        scraper_config['_label_mapping'][matching_label][matching_value] = label_dict
-                except KeyError:
-                    if matching_value is not None:
-                        scraper_config['_label_mapping'][matching_label] = {matching_value: label_dict}
+                if sample[self.SAMPLE_VALUE] == 1:
+                    index.store(metric.name, sample[self.SAMPLE_LABELS])
 
     def _join_labels(self, metric, scraper_config):
         # Filter metric to see if we can enrich with joined labels
         if scraper_config['label_joins']:
+            join = self._get_label_join_index(scraper_config).join
             for sample in metric.samples:
-                watched_labels = scraper_config['_watched_labels'].intersection(set(sample[self.SAMPLE_LABELS].keys()))
-                for label_name in watched_labels:
-                    # Set this label value as active
-                    if label_name not in scraper_config['_active_label_mapping']:
-                        scraper_config['_active_label_mapping'][label_name] = {}
-                    scraper_config['_active_label_mapping'][label_name][sample[self.SAMPLE_LABELS][label_name]] = True
-                    # If mapping found add corresponding labels
-                    try:
-                        for name, val in iteritems(
-                            scraper_config['_label_mapping'][label_name][sample[self.SAMPLE_LABELS][label_name]]
-                        ):
-                            sample[self.SAMPLE_LABELS][name] = val
-                    except KeyError:
-                        pass
+                join(sample[self.SAMPLE_LABELS])
+
+    def _expire_label_joins(self, scraper_config):
+        index = self._get_label_join_index(scraper_config)
+        index.next_generation()
+
+        self._send_telemetry_gauge(self.TELEMETRY_GAUGE_LABEL_JOINS_SIZE, len(index), scraper_config)
+        self._send_telemetry_counter(self.TELEMETRY_COUNTER_LABEL_JOINS_EVICTION_COUNT, index.evictions, scraper_config)
+        self._send_telemetry_counter(
+            self.TELEMETRY_COUNTER_LABEL_JOINS_EXPIRATION_COUNT, index.expirations, scraper_config
+        )
+        index.reset_stats()
+
+    def _reset_metric_plans(self, scraper_config):
+        """
+        Drop every compiled metric plan, they will be recompiled on the next occurrence of each metric
+        """
+        scraper_config['_metric_plans'] = {}
+        scraper_config['_metrics_wildcards'] = None
+        scraper_config['_metric_plans_sources'] = (scraper_config['metrics_mapper'], scraper_config['ignore_metrics'])
+
+    def _validate_metric_plans(self, scraper_config):
+        """
+        Invalidate the compiled metric plans if the content of `metrics_mapper` or `ignore_metrics`
+        changed since they were compiled. Called once per scrape.
+        """
+        fingerprint = hash(
+            (frozenset(iteritems(scraper_config['metrics_mapper'])), frozenset(scraper_config['ignore_metrics']))
+        )
+        if fingerprint != scraper_config['_metric_plans_fingerprint']:
+            self._reset_metric_plans(scraper_config)
+            scraper_config['_metric_plans_fingerprint'] = fingerprint
+
+    def _get_metric_plan(self, metric_name, scraper_config, metric_transformers=None):
+        """
+        Return the `(outcome, target)` plan telling how `process_metric` handles `metric_name`.
+        The plan is compiled the first time a metric name is seen, subsequent calls are a single dict lookup.
+        """
+        plan = self._get_cached_metric_plan(metric_name, scraper_config, metric_transformers)
+        if plan is not None:
+            scraper_config['_metric_plans_stats']['hit'] += 1
+            return plan
+
+        scraper_config['_metric_plans_stats']['miss'] += 1
+        plan = self._compile_metric_plan(metric_name, scraper_config, metric_transformers)
+        scraper_config['_metric_plans'][metric_name] = plan
+        return plan
+
+    def _get_cached_metric_plan(self, metric_name, scraper_config, metric_transformers=None):
+        sources = scraper_config['_metric_plans_sources']
+        if sources[0] is not scraper_config['metrics_mapper'] or sources[1] is not scraper_config['ignore_metrics']:
+            self._reset_metric_plans(scraper_config)
+
+        plan = scraper_config['_metric_plans'].get(metric_name)
+        if plan is None:
+            return None
+
+        # Transformers are given per call, only trust the plan if they still agree with it
+        outcome = plan[0]
+        has_transformer = metric_transformers is not None and metric_name in metric_transformers
+        if outcome == self.PLAN_TRANSFORMER:
+            valid = has_transformer
+        elif outcome == self.PLAN_WILDCARD or outcome == self.PLAN_SKIP:
+            valid = not has_transformer
+        else:
+            valid = True
+
+        return plan if valid else None
+
+    def _compile_metric_plan(self, metric_name, scraper_config, metric_transformers=None):
+        if metric_name in scraper_config['ignore_metrics']:
+            return self.PLAN_IGNORE, None
+
+        if metric_name in scraper_config['metrics_mapper']:
+            return self.PLAN_MAPPED, scraper_config['metrics_mapper'][metric_name]
+
+        if metric_transformers is not None and metric_name in metric_transformers:
+            return self.PLAN_TRANSFORMER, None
+
+        # build the wildcard list if first pass
+        if scraper_config['_metrics_wildcards'] is None:
+            scraper_config['_metrics_wildcards'] = [x for x in scraper_config['metrics_mapper'] if '*' in x]
+
+        # try matching wildcard
+        for wildcard in scraper_config['_metrics_wildcards']:
+            if fnmatchcase(metric_name, wildcard):
+                return self.PLAN_WILDCARD, None
+
+        return self.PLAN_SKIP, None
 
     def process_metric(self, metric, scraper_config, metric_transformers=None):
         """
@@ -460,12 +873,16 @@ class OpenMetricsScraperMixin(object):
             - call check method with the same name as the metric
             - log some info if none of the above worked
 
+        The outcome of this flow is compiled once per metric name, see `_get_metric_plan`.
+
         `metric_transformers` is a dict of <metric name>:<function to run when the metric name is encountered>
         """
         # If targeted metric, store labels
         self._store_labels(metric, scraper_config)
 
-        if metric.name in scraper_config['ignore_metrics']:
+        outcome, target = self._get_metric_plan(metric.name, scraper_config, metric_transformers)
+
+        if outcome == self.PLAN_IGNORE:
             self._send_telemetry_counter(
                 self.TELEMETRY_COUNTER_METRICS_IGNORE_COUNT, len(metric.samples), scraper_config
             )
@@ -482,29 +899,18 @@ class OpenMetricsScraperMixin(object):
         if scraper_config['_dry_run']:
             return
 
-        try:
-            self.submit_openmetric(scraper_config['metrics_mapper'][metric.name], metric, scraper_config)
-        except KeyError:
-            if metric_transformers is not None and metric.name in metric_transformers:
-                try:
-                    # Get the transformer function for this specific metric
-                    transformer = metric_transformers[metric.name]
-                    transformer(metric, scraper_config)
-                except Exception as err:
-                    self.log.warning('Error handling metric: %s - error: %s', metric.name, err)
-
-                return
-
-            # build the wildcard list if first pass
-            if scraper_config['_metrics_wildcards'] is None:
-                scraper_config['_metrics_wildcards'] = [x for x in scraper_config['metrics_mapper'] if '*' in x]
-
-            # try matching wildcard
-            for wildcard in scraper_config['_metrics_wildcards']:
-                if fnmatchcase(metric.name, wildcard):
-                    self.submit_openmetric(metric.name, metric, scraper_config)
-                    return
-
+        if outcome == self.PLAN_MAPPED:
+            self.submit_openmetric(target, metric, scraper_config)
+        elif outcome == self.PLAN_TRANSFORMER:
+            try:
+                # Get the transformer function for this specific metric
+                transformer = metric_transformers[metric.name]
+                transformer(metric, scraper_config)
+            except Exception as err:
+                self.log.warning('Error handling metric: %s - error: %s', metric.name, err)
+        elif outcome == self.PLAN_WILDCARD:
+            self.submit_openmetric(metric.name, metric, scraper_config)
+        else:
             self.log.debug(
                 'Skipping metric `%s` as it is not defined in the metrics mapper, '
                 'has no transformer function, nor does it match any wildcards.',
@@ -533,7 +939,7 @@ class OpenMetricsScraperMixin(object):
         service_check_tags.extend(scraper_config['custom_tags'])
 
         try:
-            response = self.send_request(endpoint, scraper_config, headers)
+            response = self._get_response(endpoint, scraper_config, headers)
         except requests.exceptions.SSLError:
             self.log.error("Invalid SSL settings for requesting %s endpoint", endpoint)
             raise
@@ -552,6 +958,24 @@ class OpenMetricsScraperMixin(object):
                 self.service_check(service_check_name, AgentCheck.CRITICAL, tags=service_check_tags)
             raise
 
+    def _get_response(self, endpoint, scraper_config, headers=None):
+        fetch = scraper_config['_prefetched_response']
+        if fetch is None:
+            timer = Timer()
+            try:
+                with self.phase('fetch'):
+                    return self.send_request(endpoint, scraper_config, headers)
+            finally:
+                scraper_config['_fetch_time'] = timer.total()
+
+        scraper_config['_prefetched_response'] = None
+        response, exc_info, duration = fetch.get()
+        scraper_config['_fetch_time'] = duration
+        self.record_phase('fetch', duration)
+        if exc_info is not None:
+            reraise(*exc_info)
+        return response
+
     def send_request(self, endpoint, scraper_config, headers=None):
         # Determine the headers
         if headers is None:
@@ -559,6 +983,7 @@ class OpenMetricsScraperMixin(object):
         if 'accept-encoding' not in headers:
             headers['accept-encoding'] = 'gzip'
         headers.update(scraper_config['extra_headers'])
+        headers.update(scraper_config['_conditional_headers'])
 
         # Add the bearer token to headers
         bearer_token = scraper_config['_bearer_token']
@@ -620,6 +1045,14 @@ class OpenMetricsScraperMixin(object):
         """
         if metric.type in ["gauge", "counter", "rate"]:
             metric_name_with_namespace = '{}.{}'.format(scraper_config['namespace'], metric_name)
+            if metric.type == "counter" and scraper_config['send_monotonic_counter']:
+                metric_type = 'monotonic_count'
+            elif metric.type == "rate":
+                metric_type = 'rate'
+            else:
+                metric_type = 'gauge'
+
+            points = []
             for sample in metric.samples:
                 val = sample[self.SAMPLE_VALUE]
                 if not self._is_value_valid(val):
@@ -628,12 +1061,8 @@ class OpenMetricsScraperMixin(object):
                 custom_hostname = self._get_hostname(hostname, sample, scraper_config)
                 # Determine the tags to send
                 tags = self._metric_tags(metric_name, val, sample, scraper_config, hostname=custom_hostname)
-                if metric.type == "counter" and scraper_config['send_monotonic_counter']:
-                    self.monotonic_count(metric_name_with_namespace, val, tags=tags, hostname=custom_hostname)
-                elif metric.type == "rate":
-                    self.rate(metric_name_with_namespace, val, tags=tags, hostname=custom_hostname)
-                else:
-                    self.gauge(metric_name_with_namespace, val, tags=tags, hostname=custom_hostname)
+                points.append((metric_name_with_namespace, val, tags, custom_hostname))
+            self.submit_metrics(metric_type, points)
         elif metric.type == "histogram":
             self._submit_gauges_from_histogram(metric_name, metric, scraper_config)
         elif metric.type == "summary":
@@ -661,6 +1090,8 @@ class OpenMetricsScraperMixin(object):
         """
         Extracts metrics from a prometheus summary metric and sends them as gauges
         """
+        gauges = []
+        counts = []
         for sample in metric.samples:
             val = sample[self.SAMPLE_VALUE]
             if not self._is_value_valid(val):
@@ -669,38 +1100,34 @@ class OpenMetricsScraperMixin(object):
             custom_hostname = self._get_hostname(hostname, sample, scraper_config)
             if sample[self.SAMPLE_NAME].endswith("_sum"):
                 tags = self._metric_tags(metric_name, val, sample, scraper_config, hostname=custom_hostname)
-                self.gauge(
-                    "{}.{}.sum".format(scraper_config['namespace'], metric_name),
-                    val,
-                    tags=tags,
-                    hostname=custom_hostname,
+                gauges.append(
+                    ("{}.{}.sum".format(scraper_config['namespace'], metric_name), val, tags, custom_hostname)
                 )
             elif sample[self.SAMPLE_NAME].endswith("_count"):
                 tags = self._metric_tags(metric_name, val, sample, scraper_config, hostname=custom_hostname)
-                self._submit_distribution_count(
-                    scraper_config['send_distribution_counts_as_monotonic'],
-                    "{}.{}.count".format(scraper_config['namespace'], metric_name),
-                    val,
-                    tags=tags,
-                    hostname=custom_hostname,
+                counts.append(
+                    ("{}.{}.count".format(scraper_config['namespace'], metric_name), val, tags, custom_hostname)
                 )
             else:
                 sample[self.SAMPLE_LABELS]["quantile"] = str(float(sample[self.SAMPLE_LABELS]["quantile"]))
                 tags = self._metric_tags(metric_name, val, sample, scraper_config, hostname=custom_hostname)
-                self.gauge(
-                    "{}.{}.quantile".format(scraper_config['namespace'], metric_name),
-                    val,
-                    tags=tags,
-                    hostname=custom_hostname,
+                gauges.append(
+                    ("{}.{}.quantile".format(scraper_config['namespace'], metric_name), val, tags, custom_hostname)
                 )
 
+        self.submit_metrics('gauge', gauges)
+        self._submit_distribution_counts(scraper_config['send_distribution_counts_as_monotonic'], counts)
+
     def _submit_gauges_from_histogram(self, metric_name, metric, scraper_config, hostname=None):
         """
         Extracts metrics from a prometheus histogram and sends them as gauges
         """
+        bucket_bounds = None
         if scraper_config['non_cumulative_buckets']:
-            self._decumulate_histogram_buckets(metric)
-        for sample in metric.samples:
+            bucket_bounds = self._decumulate_histogram_buckets(metric)
+        gauges = []
+        counts = []
+        for i, sample in enumerate(metric.samples):
             val = sample[self.SAMPLE_VALUE]
             if not self._is_value_valid(val):
                 self.log.debug("Metric value is not supported for metric %s", sample[self.SAMPLE_NAME])
@@ -708,116 +1135,116 @@ class OpenMetricsScraperMixin(object):
             custom_hostname = self._get_hostname(hostname, sample, scraper_config)
             if sample[self.SAMPLE_NAME].endswith("_sum") and not scraper_config['send_distribution_buckets']:
                 tags = self._metric_tags(metric_name, val, sample, scraper_config, hostname)
-                self.gauge(
-                    "{}.{}.sum".format(scraper_config['namespace'], metric_name),
-                    val,
-                    tags=tags,
-                    hostname=custom_hostname,
+                gauges.append(
+                    ("{}.{}.sum".format(scraper_config['namespace'], metric_name), val, tags, custom_hostname)
                 )
             elif sample[self.SAMPLE_NAME].endswith("_count") and not scraper_config['send_distribution_buckets']:
                 tags = self._metric_tags(metric_name, val, sample, scraper_config, hostname)
                 if scraper_config['send_histograms_buckets']:
+                    tags = list(tags)
                     tags.append("upper_bound:none")
-                self._submit_distribution_count(
-                    scraper_config['send_distribution_counts_as_monotonic'],
-                    "{}.{}.count".format(scraper_config['namespace'], metric_name),
-                    val,
-                    tags=tags,
-                    hostname=custom_hostname,
+                counts.append(
+                    ("{}.{}.count".format(scraper_config['namespace'], metric_name), val, tags, custom_hostname)
                 )
             elif scraper_config['send_histograms_buckets'] and sample[self.SAMPLE_NAME].endswith("_bucket"):
                 if scraper_config['send_distribution_buckets']:
-                    self._submit_sample_histogram_buckets(metric_name, sample, scraper_config, hostname)
+                    bounds = bucket_bounds.get(i) if bucket_bounds else None
+                    self._submit_sample_histogram_buckets(metric_name, sample, scraper_config, hostname, bounds=bounds)
                 elif "Inf" not in sample[self.SAMPLE_LABELS]["le"] or scraper_config['non_cumulative_buckets']:
                     sample[self.SAMPLE_LABELS]["le"] = str(float(sample[self.SAMPLE_LABELS]["le"]))
                     tags = self._metric_tags(metric_name, val, sample, scraper_config, hostname)
-                    self._submit_distribution_count(
-                        scraper_config['send_distribution_counts_as_monotonic'],
-                        "{}.{}.count".format(scraper_config['namespace'], metric_name),
-                        val,
-                        tags=tags,
-                        hostname=custom_hostname,
+                    counts.append(
+                        ("{}.{}.count".format(scraper_config['namespace'], metric_name), val, tags, custom_hostname)
                     )
 
-    def _compute_bucket_hash(self, tags):
-        # we need the unique context for all the buckets
-        # hence we remove the "le" tag
-        return hash(frozenset(sorted((k, v) for k, v in iteritems(tags) if k != 'le')))
+        self.submit_metrics('gauge', gauges)
+        self._submit_distribution_counts(scraper_config['send_distribution_counts_as_monotonic'], counts)
 
     def _decumulate_histogram_buckets(self, metric):
         """
         Decumulate buckets in a given histogram metric and adds the lower_bound label (le being upper_bound)
-        """
-        bucket_values_by_context_upper_bound = {}
-        for sample in metric.samples:
-            if sample[self.SAMPLE_NAME].endswith("_bucket"):
-                context_key = self._compute_bucket_hash(sample[self.SAMPLE_LABELS])
-                if context_key not in bucket_values_by_context_upper_bound:
-                    bucket_values_by_context_upper_bound[context_key] = {}
-                bucket_values_by_context_upper_bound[context_key][float(sample[self.SAMPLE_LABELS]["le"])] = sample[
-                    self.SAMPLE_VALUE
-                ]
-
-        sorted_buckets_by_context = {}
-        for context in bucket_values_by_context_upper_bound:
-            sorted_buckets_by_context[context] = sorted(bucket_values_by_context_upper_bound[context])
-
-        # Tuples (lower_bound, upper_bound, value)
-        bucket_tuples_by_context_upper_bound = {}
-        for context in sorted_buckets_by_context:
-            for i, upper_b in enumerate(sorted_buckets_by_context[context]):
-                if i == 0:
-                    if context not in bucket_tuples_by_context_upper_bound:
-                        bucket_tuples_by_context_upper_bound[context] = {}
-                    if upper_b > 0:
-                        # positive buckets start at zero
-                        bucket_tuples_by_context_upper_bound[context][upper_b] = (
-                            0,
-                            upper_b,
-                            bucket_values_by_context_upper_bound[context][upper_b],
-                        )
-                    else:
-                        # negative buckets start at -inf
-                        bucket_tuples_by_context_upper_bound[context][upper_b] = (
-                            self.MINUS_INF,
-                            upper_b,
-                            bucket_values_by_context_upper_bound[context][upper_b],
-                        )
-                    continue
-                tmp = (
-                    bucket_values_by_context_upper_bound[context][upper_b]
-                    - bucket_values_by_context_upper_bound[context][sorted_buckets_by_context[context][i - 1]]
-                )
-                bucket_tuples_by_context_upper_bound[context][upper_b] = (
-                    sorted_buckets_by_context[context][i - 1],
-                    upper_b,
-                    tmp,
-                )
 
-        # modify original metric to inject lower_bound & modified value
-        for i, sample in enumerate(metric.samples):
+        Buckets are grouped by context in a single pass, each context holding the columns of its sample
+        indexes, upper bounds and cumulative values, then deltas are computed in one sorted pass per context.
+
+        Returns a dict of <bucket sample index>:<(lower_bound, upper_bound)> floats
+        """
+        samples = metric.samples
+        columns_by_context = {}
+        for i, sample in enumerate(samples):
             if not sample[self.SAMPLE_NAME].endswith("_bucket"):
                 continue
 
-            context_key = self._compute_bucket_hash(sample[self.SAMPLE_LABELS])
-            matching_bucket_tuple = bucket_tuples_by_context_upper_bound[context_key][
-                float(sample[self.SAMPLE_LABELS]["le"])
-            ]
-            # Replacing the sample tuple
-            sample[self.SAMPLE_LABELS]["lower_bound"] = str(matching_bucket_tuple[0])
-            metric.samples[i] = (sample[self.SAMPLE_NAME], sample[self.SAMPLE_LABELS], matching_bucket_tuple[2])
+            # the unique context for all the buckets is made of all the labels but "le"
+            labels = sample[self.SAMPLE_LABELS]
+            upper_bound = labels["le"]
+            context_key = frozenset(iteritems(labels)).difference((("le", upper_bound),))
+            columns = columns_by_context.get(context_key)
+            if columns is None:
+                columns = columns_by_context[context_key] = ([], [], [])
+            columns[0].append(i)
+            columns[1].append(float(upper_bound))
+            columns[2].append(sample[self.SAMPLE_VALUE])
+
+        bucket_bounds = {}
+        for indexes, upper_bounds, values in itervalues(columns_by_context):
+            # The sort is stable, samples sharing an upper bound stay in payload order
+            order = sorted(range(len(indexes)), key=upper_bounds.__getitem__)
+            size = len(order)
+            previous_upper_bound = previous_value = None
+
+            start = 0
+            while start < size:
+                upper_bound = upper_bounds[order[start]]
+                end = start + 1
+                while end < size and upper_bounds[order[end]] == upper_bound:
+                    end += 1
+                # If an upper bound is repeated, the last sample in the payload wins
+                value = values[order[end - 1]]
+
+                if previous_upper_bound is None:
+                    # positive buckets start at zero, negative buckets start at -inf
+                    lower_bound = 0 if upper_bound > 0 else self.MINUS_INF
+                    bucket_value = value
+                else:
+                    lower_bound = previous_upper_bound
+                    bucket_value = value - previous_value
+
+                # modify original metric to inject lower_bound & modified value
+                lower_bound_label = str(lower_bound)
+                bounds = (float(lower_bound), upper_bound)
+                for position in order[start:end]:
+                    i = indexes[position]
+                    name, labels, _ = samples[i]
+                    labels["lower_bound"] = lower_bound_label
+                    samples[i] = (name, labels, bucket_value)
+                    bucket_bounds[i] = bounds
+
+                previous_upper_bound = upper_bound
+                previous_value = value
+                start = end
+
+        return bucket_bounds
+
+    def _submit_sample_histogram_buckets(self, metric_name, sample, scraper_config, hostname=None, bounds=None):
+        """
+        `bounds` is the `(lower_bound, upper_bound)` returned by `_decumulate_histogram_buckets` for this sample,
+        if not given they are parsed from the sample labels
+        """
+        if bounds is None:
+            if "lower_bound" not in sample[self.SAMPLE_LABELS] or "le" not in sample[self.SAMPLE_LABELS]:
+                self.log.warning(
+                    "Metric: %s was not containing required bucket boundaries labels: %s",
+                    metric_name,
+                    sample[self.SAMPLE_LABELS],
+                )
+                return
+            bounds = (float(sample[self.SAMPLE_LABELS]["lower_bound"]), float(sample[self.SAMPLE_LABELS]["le"]))
 
-    def _submit_sample_histogram_buckets(self, metric_name, sample, scraper_config, hostname=None):
-        if "lower_bound" not in sample[self.SAMPLE_LABELS] or "le" not in sample[self.SAMPLE_LABELS]:
-            self.log.warning(
-                "Metric: %s was not containing required bucket boundaries labels: %s",
-                metric_name,
-                sample[self.SAMPLE_LABELS],
-            )
-            return
-        sample[self.SAMPLE_LABELS]["le"] = str(float(sample[self.SAMPLE_LABELS]["le"]))
-        sample[self.SAMPLE_LABELS]["lower_bound"] = str(float(sample[self.SAMPLE_LABELS]["lower_bound"]))
-        if sample[self.SAMPLE_LABELS]["le"] == sample[self.SAMPLE_LABELS]["lower_bound"]:
+        lower_bound, upper_bound = bounds
+        sample[self.SAMPLE_LABELS]["le"] = str(upper_bound)
+        sample[self.SAMPLE_LABELS]["lower_bound"] = str(lower_bound)
+        if upper_bound == lower_bound:
             # this can happen for -inf/-inf bucket that we don't want to send (always 0)
             self.log.warning(
                 "Metric: %s has bucket boundaries equal, skipping: %s", metric_name, sample[self.SAMPLE_LABELS]
@@ -827,20 +1254,27 @@ class OpenMetricsScraperMixin(object):
         self.submit_histogram_bucket(
             "{}.{}".format(scraper_config['namespace'], metric_name),
             sample[self.SAMPLE_VALUE],
-            float(sample[self.SAMPLE_LABELS]["lower_bound"]),
-            float(sample[self.SAMPLE_LABELS]["le"]),
+            lower_bound,
+            upper_bound,
             True,
             hostname,
             tags,
         )
 
-    def _submit_distribution_count(self, monotonic, metric_name, value, tags=None, hostname=None):
-        if monotonic:
-            self.monotonic_count(metric_name, value, tags=tags, hostname=hostname)
-        else:
-            self.gauge(metric_name, value, tags=tags, hostname=hostname)
+    def _submit_distribution_counts(self, monotonic, points):
+        """
+        Submit the `(name, value, tags, hostname)` points of histogram and summary counts
+        """
+        self.submit_metrics('monotonic_count' if monotonic else 'gauge', points)
 
     def _metric_tags(self, metric_name, val, sample, scraper_config, hostname=None):
+        tags_cache = scraper_config['_metric_tags_cache']
+        if tags_cache is not None:
+            cache_key = tuple(iteritems(sample[self.SAMPLE_LABELS]))
+            tags = tags_cache.get(cache_key)
+            if tags is not None:
+                return tags
+
         custom_tags = scraper_config['custom_tags']
         _tags = list(custom_tags)
         _tags.extend(scraper_config['_metric_tags'])
@@ -848,10 +1282,48 @@ class OpenMetricsScraperMixin(object):
             if label_name not in scraper_config['exclude_labels']:
                 tag_name = scraper_config['labels_mapper'].get(label_name, label_name)
                 _tags.append('{}:{}'.format(to_string(tag_name), to_string(label_value)))
-        return self._finalize_tags_to_submit(
+        _tags = self._finalize_tags_to_submit(
             _tags, metric_name, val, sample, custom_tags=custom_tags, hostname=hostname
         )
 
+        if tags_cache is not None:
+            _tags = NormalizedTags(self._normalize_tags_type(_tags, metric_name=metric_name))
+            tags_cache.set(cache_key, _tags)
+
+        return _tags
+
+    def _has_noop_tags_finalizer(self):
+        """
+        Whether `_finalize_tags_to_submit` is the default one, which returns the tags untouched
+        """
+        # Avoid a circular import, the base check is built on top of this mixin
+        from .base_check import OpenMetricsBaseCheck
+
+        finalizer = getattr(type(self), '_finalize_tags_to_submit', None)
+        return finalizer is not None and get_unbound_function(finalizer) is get_unbound_function(
+            OpenMetricsBaseCheck._finalize_tags_to_submit
+        )
+
+    def _validate_metric_tags_cache(self, scraper_config):
+        """
+        Clear the cached tags if any setting they are computed from changed since the last scrape
+        """
+        tags_cache = scraper_config['_metric_tags_cache']
+        if tags_cache is None:
+            return
+
+        fingerprint = hash(
+            (
+                tuple(scraper_config['custom_tags']),
+                tuple(scraper_config['_metric_tags']),
+                frozenset(iteritems(scraper_config['labels_mapper'])),
+                frozenset(scraper_config['exclude_labels']),
+            )
+        )
+        if fingerprint != scraper_config['_metric_tags_cache_fingerprint']:
+            tags_cache.clear()
+            scraper_config['_metric_tags_cache_fingerprint'] = fingerprint
+
     def _is_value_valid(self, val):
         return not (isnan(val) or isinf(val))
 
@@ -70,6 +70,9 @@ class PrometheusScraper(PrometheusScraperMixin):
     def _submit_service_check(self, *args, **kwargs):
         self.check.service_check(*args, **kwargs)
 
+    def phase(self, name):
+        return self.check.phase(name)
+
 
 class GenericPrometheusCheck(AgentCheck):
     """
@@ -8,13 +8,13 @@ from fnmatch import fnmatchcase
 from math import isinf, isnan
 
 import requests
-from google.protobuf.internal.decoder import _DecodeVarint32  # pylint: disable=E0611,E0401
 from prometheus_client.parser import text_fd_to_metric_families
 from six import PY3, iteritems, itervalues, string_types
 from urllib3 import disable_warnings
 from urllib3.exceptions import InsecureRequestWarning
 
 from ...utils.prometheus import metrics_pb2
+from ...utils.prometheus.functions import parse_metric_family_stream
 from .. import AgentCheck
 
 if PY3:
@@ -170,8 +170,9 @@ class PrometheusScraperMixin(object):
 
         The text format uses iter_lines() generator.
 
-        The protobuf format directly parse the response.content property searching for Prometheus messages of type
-        MetricFamily [0] delimited by a varint32 [1] when the content-type is a `application/vnd.google.protobuf`.
+        The protobuf format streams the response content searching for Prometheus messages of type MetricFamily [0]
+        delimited by a varint32 [1] when the content-type is a `application/vnd.google.protobuf`. Families listed in
+        `ignore_metrics` are skipped before being parsed.
 
         [0] https://github.com/prometheus/client_model/blob/086fe7ca28bde6cec2acd5223423c1475a362858/metrics.proto#L76-%20%20L81  # noqa: E501
         [1] https://developers.google.com/protocol-buffers/docs/reference/java/com/google/protobuf/AbstractMessageLite#writeDelimitedTo(java.io.OutputStream)  # noqa: E501
@@ -180,16 +181,8 @@ class PrometheusScraperMixin(object):
         :return: metrics_pb2.MetricFamily()
         """
         if 'application/vnd.google.protobuf' in response.headers['Content-Type']:
-            n = 0
-            buf = response.content
-            while n < len(buf):
-                msg_len, new_pos = _DecodeVarint32(buf, n)
-                n = new_pos
-                msg_buf = buf[n : n + msg_len]
-                n += msg_len
-
-                message = metrics_pb2.MetricFamily()
-                message.ParseFromString(msg_buf)
+            chunks = response.iter_content(chunk_size=self.REQUESTS_CHUNK_SIZE)
+            for message in parse_metric_family_stream(chunks, self._keep_protobuf_family):
                 message.name = self.remove_metric_prefix(message.name)
 
                 # Lookup type overrides:
@@ -236,6 +229,13 @@ class PrometheusScraperMixin(object):
         else:
             raise UnknownFormatError('Unsupported content-type provided: {}'.format(response.headers['Content-Type']))
 
+    def _keep_protobuf_family(self, name):
+        """
+        Families in `ignore_metrics` are dropped by `process_metric` anyway, unless they are label join sources.
+        """
+        name = self.remove_metric_prefix(name)
+        return name not in self.ignore_metrics or name in self.label_joins
+
     def _text_filter_input(self, input_gen):
         """
         Filters out the text input line by line to avoid parsing and processing
@@ -395,8 +395,11 @@ class PrometheusScraperMixin(object):
         if instance:
             kwargs['custom_tags'] = instance.get('tags', [])
 
-        for metric in self.scrape_metrics(endpoint):
-            self.process_metric(metric, **kwargs)
+        # Parsing and submission are interleaved, they are timed together
+        with self.phase('process') as phase:
+            for metric in self.scrape_metrics(endpoint):
+                self.process_metric(metric, **kwargs)
+                phase.add()
 
     def store_labels(self, message):
         # If targeted metric, store labels
@@ -529,9 +532,10 @@ class PrometheusScraperMixin(object):
             disable_warnings(InsecureRequestWarning)
             verify = False
         try:
-            response = requests.get(
-                endpoint, headers=headers, stream=False, timeout=self.prometheus_timeout, cert=cert, verify=verify
-            )
+            with self.phase('fetch'):
+                response = requests.get(
+                    endpoint, headers=headers, stream=True, timeout=self.prometheus_timeout, cert=cert, verify=verify
+                )
         except requests.exceptions.SSLError:
             self.log.error("Invalid SSL settings for requesting %s endpoint", endpoint)
             raise
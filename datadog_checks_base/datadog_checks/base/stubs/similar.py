@@ -21,7 +21,7 @@ def build_similar_elements_msg(expected, submitted_elements):
 
     for score, metric_stub in similar_metrics[:MAX_SIMILAR_TO_DISPLAY]:
         if metric_stub.tags:
-            metric_stub.tags.sort()
+            metric_stub = metric_stub._replace(tags=sorted(metric_stub.tags))
         similar_metrics_to_print.append("{:.2f}    {}".format(score, metric_stub))
 
     return (
@@ -1,4 +1,38 @@
 # (C) Datadog, Inc. 2019
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
+import os
+from datetime import datetime
+
 METRIC_PROFILE_NAMESPACE = 'datadog.agent.profile'
+
+# The order matters
+VALID_PACKAGE_ROOTS = ('datadog_checks', 'site-packages', 'lib', 'Lib')
+
+
+def get_timestamp_filename(prefix):
+    return '{}_{}'.format(prefix, datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%S_%f'))
+
+
+def parse_package_path(path):
+    # If possible, replace `/path/to/<PACKAGES_ROOT>/package/file.py` with `package/file.py`
+    # where the root is either:
+    #
+    # 1. datadog_checks namespace
+    # 2. site-packages
+    # 3. stdlib
+    path_parts = path.split(os.sep)
+
+    # We reuse the already split path to avoid a complex regular expression
+    package_root = None
+    for valid_root in VALID_PACKAGE_ROOTS:
+        if valid_root in path_parts:
+            package_root = valid_root
+            break
+
+    if package_root:
+        check_package_parts = path_parts[path_parts.index(package_root) + 1 :]
+        if check_package_parts:
+            path = os.sep.join(check_package_parts)
+
+    return path
@@ -0,0 +1,117 @@
+# (C) Datadog, Inc. 2020
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+import os
+import pstats
+from cProfile import Profile
+
+from .common import METRIC_PROFILE_NAMESPACE, get_timestamp_filename, parse_package_path
+from .utils import get_profile_location
+
+DEFAULT_INTERVAL = 10
+DEFAULT_KEY_LIMIT = 10
+DEFAULT_SORT_KEY = 'cumulative'
+
+# Builtin functions have no file and no line number
+BUILTIN_FILENAME = '~'
+
+# Entries of the pstats `stats` dictionary
+SELF_TIME = 2
+CUMULATIVE_TIME = 3
+
+
+class CpuProfileMetric(object):
+    __slots__ = ('name', 'value', 'tags')
+
+    def __init__(self, name, value, tags=None):
+        self.name = '{}.cpu.{}'.format(METRIC_PROFILE_NAMESPACE, name)
+        self.value = float(value)
+        self.tags = tags or []
+
+
+def format_function(key):
+    filename, lineno, function = key
+    if filename == BUILTIN_FILENAME:
+        return function
+
+    return '{}:{}({})'.format(parse_package_path(filename), lineno, function)
+
+
+def gather_top(metrics, stats, limit):
+    entries = [
+        (key, entry)
+        for key, entry in stats.stats.items()
+        # The call disabling the profiler is recorded too
+        if '_lsprof.Profiler' not in key[2]
+    ]
+
+    metrics.append(CpuProfileMetric('check_run_time', sum(entry[SELF_TIME] for _, entry in entries)))
+
+    for metric_name, index in (('cumulative_time', CUMULATIVE_TIME), ('self_time', SELF_TIME)):
+        top = sorted(entries, key=lambda item: item[1][index], reverse=True)[:limit]
+        for key, entry in top:
+            metrics.append(CpuProfileMetric(metric_name, entry[index], ['function:{}'.format(format_function(key))]))
+
+
+def profile_cpu(f, config, namespaces=None, args=(), kwargs=None):
+    """
+    This will run function ``f`` under the deterministic profiler of the standard library and
+    gather the functions in which most of the time was spent. If the ``config`` dictionary has an
+    entry ``profile_cpu`` that points to a directory, the raw profile and a report are written there
+    for later consumption, the raw profile can be read with the ``pstats`` module or tools such as
+    snakeviz or gprof2dot. Set it to ``true`` to only gather the metrics.
+
+    The available options (without prefix) are:
+
+      - limit: the number of functions to report, for both the cumulative and self time
+      - sort: what to sort the written report by, any sort key supported by ``pstats``
+
+    :param f: the function to profile
+    :param config: a dictionary of options prefixed by ``profile_cpu_``
+    :param namespaces: if specified, additional sub-directories under ``profile_cpu`` root directory
+    :param args: arguments to pass to function ``f``
+    :param kwargs: keyword arguments to pass to function ``f``
+    :return:
+    """
+    if kwargs is None:
+        kwargs = {}
+
+    profiler = Profile()
+    profiler.enable()
+    try:
+        f(*args, **kwargs)
+    finally:
+        profiler.disable()
+
+    stats = pstats.Stats(profiler)
+    limit = int(config.get('profile_cpu_limit', DEFAULT_KEY_LIMIT))
+
+    # Metrics to send
+    metrics = []
+    gather_top(metrics, stats, limit)
+
+    # We're running on a live Agent, or only the metrics were requested
+    location = get_profile_location(config.get('profile_cpu'))
+    if location is None:
+        return metrics
+
+    if namespaces:
+        # Colons can't be part of Windows file paths
+        namespaces = [n.replace(':', '_') for n in namespaces]
+        location = os.path.join(location, *namespaces)
+
+    stats_dir = os.path.join(location, 'stats')
+    if not os.path.isdir(stats_dir):
+        os.makedirs(stats_dir)
+
+    report_dir = os.path.join(location, 'reports')
+    if not os.path.isdir(report_dir):
+        os.makedirs(report_dir)
+
+    stats.dump_stats(os.path.join(stats_dir, get_timestamp_filename('stats') + '.pstats'))
+
+    with open(os.path.join(report_dir, get_timestamp_filename('report')), 'w') as f:
+        stats.stream = f
+        stats.sort_stats(config.get('profile_cpu_sort', DEFAULT_SORT_KEY)).print_stats(limit)
+
+    return metrics
@@ -4,11 +4,10 @@
 import gc
 import linecache
 import os
-from datetime import datetime
 
 from binary import BinaryUnits, convert_units
 
-from .common import METRIC_PROFILE_NAMESPACE
+from .common import METRIC_PROFILE_NAMESPACE, get_timestamp_filename, parse_package_path
 
 try:
     import tracemalloc
@@ -24,9 +23,6 @@ DEFAULT_DIFF_ORDER = 'absolute'
 DEFAULT_UNIT = 'dynamic'
 DEFAULT_VERBOSITY = False
 
-# The order matters
-VALID_PACKAGE_ROOTS = ('datadog_checks', 'site-packages', 'lib', 'Lib')
-
 # Starting in Python 3.7 frames are sorted from the oldest to the most recent
 MOST_RECENT_FRAME = -1
 
@@ -43,34 +39,6 @@ def get_sign(n):
     return '-' if n < 0 else '+'
 
 
-def get_timestamp_filename(prefix):
-    return '{}_{}'.format(prefix, datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%S_%f'))
-
-
-def parse_package_path(path):
-    # If possible, replace `/path/to/<PACKAGES_ROOT>/package/file.py` with `package/file.py`
-    # where the root is either:
-    #
-    # 1. datadog_checks namespace
-    # 2. site-packages
-    # 3. stdlib
-    path_parts = path.split(os.sep)
-
-    # We reuse the already split path to avoid a complex regular expression
-    package_root = None
-    for valid_root in VALID_PACKAGE_ROOTS:
-        if valid_root in path_parts:
-            package_root = valid_root
-            break
-
-    if package_root:
-        check_package_parts = path_parts[path_parts.index(package_root) + 1 :]
-        if check_package_parts:
-            path = os.sep.join(check_package_parts)
-
-    return path
-
-
 def get_unit(unit):
     return getattr(BinaryUnits, unit.upper().replace('I', ''), BinaryUnits.B)
 
@@ -1,19 +1,38 @@
 # (C) Datadog, Inc. 2019
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
+from six import string_types
 
+# Values of `profile_cpu` that are booleans rather than a directory
+BOOLEAN_STRINGS = frozenset(('', 'true', 'false', 'yes', 'no', 'y', 'n', 'on', 'off', '1', '0'))
 
-def should_profile_memory(datadog_agent, check_name):
-    tracemalloc_whitelist = datadog_agent.get_config('tracemalloc_whitelist') or ''
-    if tracemalloc_whitelist:
-        tracemalloc_whitelist = [check.strip() for check in tracemalloc_whitelist.split(',')]
-        tracemalloc_whitelist = [check for check in tracemalloc_whitelist if check]
 
-    tracemalloc_blacklist = datadog_agent.get_config('tracemalloc_blacklist') or ''
-    if tracemalloc_blacklist:
-        tracemalloc_blacklist = [check.strip() for check in tracemalloc_blacklist.split(',')]
-        tracemalloc_blacklist = [check for check in tracemalloc_blacklist if check]
+def get_check_list(datadog_agent, option):
+    checks = datadog_agent.get_config(option) or ''
+    if checks:
+        checks = [check.strip() for check in checks.split(',')]
+        checks = [check for check in checks if check]
+
+    return checks
+
+
+def should_profile_memory(datadog_agent, check_name):
+    tracemalloc_whitelist = get_check_list(datadog_agent, 'tracemalloc_whitelist')
+    tracemalloc_blacklist = get_check_list(datadog_agent, 'tracemalloc_blacklist')
 
     return check_name not in tracemalloc_blacklist and (
         check_name in tracemalloc_whitelist if tracemalloc_whitelist else True
     )
+
+
+def should_profile_cpu(datadog_agent, check_name):
+    # CPU profiling is opt-in, the overhead of the deterministic profiler is too high to enable it for every check
+    return check_name in get_check_list(datadog_agent, 'cpu_profiling_checks')
+
+
+def get_profile_location(value):
+    """
+    Return the directory a `profile_cpu` option points to, or `None` if it is unset or a boolean.
+    """
+    if isinstance(value, string_types) and value.strip().lower() not in BOOLEAN_STRINGS:
+        return value
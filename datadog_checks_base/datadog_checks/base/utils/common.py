@@ -7,10 +7,17 @@ import os
 import re
 from decimal import ROUND_HALF_UP, Decimal
 
-from six import PY3, iteritems, text_type
+from six import PY3, iteritems, string_types, text_type
 from six.moves.urllib.parse import urlparse
 
 from .constants import MILLISECOND
+from .containers import LRUCache
+
+# Number of keys whose decision is cached by a `PatternFilter`
+DEFAULT_PATTERN_FILTER_CACHE_SIZE = 10000
+
+# Numbered or named backreference in a regular expression
+BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
 
 
 def ensure_bytes(s):
@@ -62,29 +69,81 @@ def pattern_filter(items, whitelist=None, blacklist=None, key=None):
     """This filters `items` by a regular expression `whitelist` and/or
     `blacklist`, with the `blacklist` taking precedence. An optional `key`
     function can be provided that will be passed each item.
-    """
-    key = key or __return_self
-    if whitelist:
-        whitelisted = _filter(items, whitelist, key)
-
-        if blacklist:
-            blacklisted = _filter(items, blacklist, key)
-            # Remove any blacklisted items from the whitelisted ones.
-            whitelisted.difference_update(blacklisted)
 
-        return [item for item in items if key(item) in whitelisted]
-
-    elif blacklist:
-        blacklisted = _filter(items, blacklist, key)
-        return [item for item in items if key(item) not in blacklisted]
-
-    else:
-        return items
+    Use a `PatternFilter` to filter items repeatedly with the same patterns.
+    """
+    return PatternFilter(whitelist, blacklist, key=key, cache_size=0).filter(items)
 
 
-def _filter(items, pattern_list, key):
-    return {key(item) for pattern in pattern_list for item in items if re.search(pattern, key(item))}
+class PatternFilter(object):
+    """Reusable `pattern_filter`, meant to be built once per instance.
 
+    The patterns of the `whitelist` and of the `blacklist` are each compiled into a
+    single regular expression, and the decision for the last `cache_size` keys is
+    cached. Set `cache_size` to 0 to disable the cache.
+    """
 
-def __return_self(obj):
-    return obj
+    def __init__(self, whitelist=None, blacklist=None, key=None, cache_size=DEFAULT_PATTERN_FILTER_CACHE_SIZE):
+        self.key = key
+        self._whitelist = _compile_patterns(whitelist)
+        self._blacklist = _compile_patterns(blacklist)
+        self._decisions = LRUCache(cache_size) if cache_size > 0 else None
+
+    def is_allowed(self, value):
+        """Return whether a key, not an item, passes the filter."""
+        decisions = self._decisions
+        if decisions is not None:
+            allowed = decisions.get(value)
+            if allowed is not None:
+                return allowed
+
+        allowed = (self._whitelist is None or self._whitelist(value) is not None) and (
+            self._blacklist is None or self._blacklist(value) is None
+        )
+
+        if decisions is not None:
+            decisions.set(value, allowed)
+
+        return allowed
+
+    def filter(self, items):
+        """Return the items that pass the filter, in order. `items` is returned as is if there are no patterns."""
+        if self._whitelist is None and self._blacklist is None:
+            return items
+
+        is_allowed = self.is_allowed
+        key = self.key
+        if key is None:
+            return [item for item in items if is_allowed(item)]
+
+        return [item for item in items if is_allowed(key(item))]
+
+
+def _compile_patterns(patterns):
+    """Return a function searching for any of the patterns, like the `search` method of a compiled pattern."""
+    if not patterns:
+        return None
+
+    compiled = [re.compile(pattern) for pattern in patterns]
+
+    # Already compiled patterns may have flags, and global flags or backreferences would apply to or refer
+    # to the other patterns once combined, such patterns are searched for one after the other
+    if all(
+        isinstance(pattern, string_types)
+        and compiled_pattern.flags == re.compile(pattern[:0]).flags
+        and not BACKREFERENCE.search(pattern)
+        for pattern, compiled_pattern in zip(patterns, compiled)
+    ):
+        try:
+            return re.compile('|'.join('(?:{})'.format(pattern) for pattern in patterns)).search
+        except re.error:
+            # e.g. the same group name in several patterns
+            pass
+
+    def search(value):
+        for pattern in compiled:
+            match = pattern.search(value)
+            if match is not None:
+                return match
+
+    return search
@@ -1,7 +1,10 @@
 # (C) Datadog, Inc. 2010-2019
 # All rights reserved
 # Licensed under Simplified BSD License (see LICENSE)
-from six import iteritems
+import threading
+from collections import OrderedDict
+
+from six import PY3, iteritems
 
 
 def freeze(o):
@@ -37,3 +40,64 @@ def iter_unique(*iterables):
 
             seen.add(item_id)
             yield item
+
+
+class LRUCache(object):
+    """
+    Mapping bounded to `maxsize` entries, the least recently used entry is evicted first.
+    Hits, misses and evictions are counted until `reset_stats` is called.
+
+    The cache can be shared by threads, e.g. the metric name cache of a check submitting from a pool.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._mark_used(key)
+            self.hits += 1
+            return value
+
+    def _mark_used(self, key):
+        if PY3:
+            self._data.move_to_end(key)
+        else:
+            # Re-insert to mark as most recently used
+            self._data[key] = self._data.pop(key)
+
+    def set(self, key, value):
+        with self._lock:
+            if key in self._data:
+                del self._data[key]
+            elif len(self._data) >= self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+            self._data[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
@@ -4,11 +4,13 @@
 import logging
 import os
 import threading
+import time
 import warnings
 from contextlib import contextmanager
 
 import requests
 from six import iteritems, string_types
+from six.moves.http_cookiejar import DefaultCookiePolicy
 from six.moves.urllib.parse import urlparse
 from urllib3.exceptions import InsecureRequestWarning
 
@@ -37,9 +39,23 @@ LOGGER = logging.getLogger(__file__)
 # https://tools.ietf.org/html/rfc2988
 DEFAULT_TIMEOUT = 10
 
+# Same as `requests`
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+
+# Pooled connections of sessions unused for that many seconds are closed
+DEFAULT_POOL_IDLE_TIMEOUT = 300
+
+# Maximum number of requests of a batch sent at once
+DEFAULT_BATCH_CONCURRENCY = 10
+
 STANDARD_FIELDS = {
     'auth_type': '',
     'connect_timeout': None,
+    'connection_pool_connections': DEFAULT_POOL_CONNECTIONS,
+    'connection_pool_idle_timeout': DEFAULT_POOL_IDLE_TIMEOUT,
+    'connection_pool_maxsize': DEFAULT_POOL_MAXSIZE,
+    'connection_pooling': False,
     'extra_headers': None,
     'headers': None,
     'kerberos_auth': None,
@@ -82,15 +98,60 @@ PROXY_SETTINGS_DISABLED = {
 KERBEROS_STRATEGIES = {}
 
 
+class SessionPool(object):
+    """
+    Sessions used for connection pooling, shared by the wrappers with the same pool and TLS settings.
+
+    Their connections are reused across requests, and across instances, but not their cookies. Sessions
+    that were not used for their idle timeout are closed, they are created again on their next use.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> [session, last use, idle timeout]
+        self._sessions = {}
+
+    def get(self, key, pool_connections, pool_maxsize, idle_timeout):
+        now = time.time()
+        with self._lock:
+            for session_key, (session, last_use, session_idle_timeout) in list(iteritems(self._sessions)):
+                if session_idle_timeout and now - last_use > session_idle_timeout:
+                    # Only idle connections are closed, the ones still in use are discarded once released
+                    del self._sessions[session_key]
+                    session.close()
+
+            entry = self._sessions.get(key)
+            if entry is None:
+                entry = self._sessions[key] = [create_pooled_session(pool_connections, pool_maxsize), now, idle_timeout]
+            else:
+                entry[1] = now
+
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            for session, _, _ in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+SESSION_POOL = SessionPool()
+
+
 class RequestsWrapper(object):
     __slots__ = (
+        '_pooled_session',
         '_session',
+        'connection_pooling',
         'ignore_tls_warning',
         'log_requests',
         'logger',
         'no_proxy_uris',
         'options',
         'persist_connections',
+        'pool_key',
+        'pool_settings',
+        'pool_stats',
         'request_hooks',
     )
 
@@ -106,6 +167,13 @@ class RequestsWrapper(object):
         default_fields['log_requests'] = init_config.get('log_requests', default_fields['log_requests'])
         default_fields['skip_proxy'] = init_config.get('skip_proxy', default_fields['skip_proxy'])
         default_fields['timeout'] = init_config.get('timeout', default_fields['timeout'])
+        for field in (
+            'connection_pooling',
+            'connection_pool_connections',
+            'connection_pool_maxsize',
+            'connection_pool_idle_timeout',
+        ):
+            default_fields[field] = init_config.get(field, default_fields[field])
 
         # Populate with the default values
         config = {field: instance.get(field, value) for field, value in iteritems(default_fields)}
@@ -272,6 +340,22 @@ class RequestsWrapper(object):
         self.persist_connections = is_affirmative(config['persist_connections'])
         self._session = None
 
+        # For connection pooling without cookie persistence, the session is shared with the wrappers having the
+        # same settings. Authentication such as NTLM is bound to connections, such sessions are never shared
+        self.connection_pooling = is_affirmative(config['connection_pooling'])
+        self.pool_settings = (
+            int(config['connection_pool_connections']),
+            int(config['connection_pool_maxsize']),
+            float(config['connection_pool_idle_timeout']),
+        )
+        self.pool_key = None
+        if auth is None or isinstance(auth, tuple):
+            self.pool_key = (auth, verify, cert, self.pool_settings)
+        self._pooled_session = None
+
+        # Number of requests sent with connection pooling, and of connections opened for them
+        self.pool_stats = {'requests': 0, 'connections': 0}
+
         # Whether or not to log request information like method and url
         self.log_requests = is_affirmative(config['log_requests'])
 
@@ -301,7 +385,62 @@ class RequestsWrapper(object):
     def delete(self, url, **options):
         return self._request('delete', url, options)
 
+    def batch(self, request_list, concurrency=DEFAULT_BATCH_CONCURRENCY):
+        """
+        Send several requests from worker threads, no more than `concurrency` at once, and wait for all of them.
+
+        Every request is a `(method, url)` or `(method, url, options)` tuple, the options being the keyword
+        arguments that would be passed to e.g. `get`. A list of `(response, exception)` tuples is returned, in
+        the order of the requests, one of the two being None.
+
+        The request hooks, e.g. to use a Kerberos cache, are entered once around the whole batch.
+        """
+        prepared = []
+        for request in request_list:
+            method, url = request[:2]
+            options = dict(request[2]) if len(request) > 2 else {}
+            prepared.append((method, url, options, self._prepare_request(method, url, options)))
+
+        if not prepared:
+            return []
+
+        # Create the sessions before they are shared by the worker threads
+        if any(persist for _, _, _, persist in prepared):
+            self.session
+        if self.connection_pooling:
+            self.pooled_session
+
+        concurrency = min(concurrency, len(prepared))
+        with ExitStack() as stack:
+            for hook in self.request_hooks:
+                stack.enter_context(hook())
+
+            if concurrency <= 1:
+                return [self._send_safely(*request) for request in prepared]
+
+            # Imported lazily, the checks package depends on this module
+            from ..checks.libs.thread_pool import Pool
+
+            pool = Pool(concurrency, name='http-batch')
+            try:
+                results = [pool.apply_async(self._send_safely, request) for request in prepared]
+                return [result.get() for result in results]
+            finally:
+                pool.terminate()
+
     def _request(self, method, url, options):
+        persist = self._prepare_request(method, url, options)
+
+        with ExitStack() as stack:
+            for hook in self.request_hooks:
+                stack.enter_context(hook())
+
+            return self._send(method, url, options, persist)
+
+    def _prepare_request(self, method, url, options):
+        """
+        Log the request and update its options, return whether it should use the persistent session.
+        """
         if self.log_requests:
             self.logger.debug(u'Sending %s request to %s', method.upper(), url)
 
@@ -317,14 +456,47 @@ class RequestsWrapper(object):
         if persist is None:
             persist = self.persist_connections
 
-        with ExitStack() as stack:
-            for hook in self.request_hooks:
-                stack.enter_context(hook())
+        return persist
 
-            if persist:
-                return getattr(self.session, method)(url, **self.populate_options(options))
-            else:
-                return getattr(requests, method)(url, **self.populate_options(options))
+    def _send(self, method, url, options, persist):
+        if persist:
+            return getattr(self.session, method)(url, **self.populate_options(options))
+        elif self.connection_pooling:
+            return self._pooled_request(method, url, options)
+        else:
+            return getattr(requests, method)(url, **self.populate_options(options))
+
+    def _send_safely(self, method, url, options, persist):
+        try:
+            return self._send(method, url, options, persist), None
+        except Exception as e:
+            return None, e
+
+    def _pooled_request(self, method, url, options):
+        session = self.pooled_session
+        connections = count_pool_connections(session)
+
+        response = getattr(session, method)(url, **self.populate_options(options))
+
+        # Connections opened concurrently for other requests sharing the session are counted too
+        self.pool_stats['requests'] += 1
+        self.pool_stats['connections'] += max(0, count_pool_connections(session) - connections)
+
+        return response
+
+    @property
+    def pooled_session(self):
+        if self.pool_key is not None:
+            return SESSION_POOL.get(self.pool_key, *self.pool_settings)
+
+        if self._pooled_session is None:
+            self._pooled_session = create_pooled_session(*self.pool_settings[:2])
+
+        return self._pooled_session
+
+    def reset_pool_stats(self):
+        self.pool_stats['requests'] = 0
+        self.pool_stats['connections'] = 0
 
     def populate_options(self, options):
         # Avoid needless dictionary update if there are no options
@@ -359,12 +531,44 @@ class RequestsWrapper(object):
         return self._session
 
     def __del__(self):  # no cov
-        try:
-            self._session.close()
-        except AttributeError:
-            # A persistent connection was never used or an error occurred during instantiation
-            # before _session was ever defined (since __del__ executes even if __init__ fails).
-            pass
+        for session_attribute in ('_session', '_pooled_session'):
+            try:
+                getattr(self, session_attribute).close()
+            except AttributeError:
+                # A persistent connection was never used or an error occurred during instantiation
+                # before the session was ever defined (since __del__ executes even if __init__ fails).
+                pass
+
+
+def create_pooled_session(pool_connections, pool_maxsize):
+    session = requests.Session()
+
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    # Cookies would otherwise be shared by every wrapper using the session
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    return session
+
+
+def count_pool_connections(session):
+    """
+    Return the number of connections opened so far by the connection pools of a session that are still open.
+    """
+    connections = 0
+    for adapter in set(session.adapters.values()):
+        managers = [adapter.poolmanager]
+        managers.extend(adapter.proxy_manager.values())
+        for manager in managers:
+            pools = manager.pools
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is not None:
+                    connections += pool.num_connections
+
+    return connections
 
 
 @contextmanager
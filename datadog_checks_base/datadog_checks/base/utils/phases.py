@@ -0,0 +1,100 @@
+# (C) Datadog, Inc. 2020
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class Phase(object):
+    """
+    Context manager timing one occurrence of a phase of a check run, see `AgentCheck.phase`.
+    """
+
+    __slots__ = ('recorder', 'name', 'count', 'started')
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+        self.count = 0
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.record(self.name, time.time() - self.started, self.count)
+
+    def add(self, count=1):
+        """
+        Add to the number of items handled during the phase.
+        """
+        self.count += count
+
+
+class NoPhase(object):
+    """
+    Stand-in for `Phase` when phases are not recorded, it is shared and does nothing.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def add(self, count=1):
+        pass
+
+
+NO_PHASE = NoPhase()
+
+
+class PhaseRecorder(object):
+    """
+    Aggregates the duration and item count of the phases of the current check run, and keeps
+    the phases of the last `history_size` runs.
+
+    Phases may be recorded by several threads, their durations are then summed.
+    """
+
+    def __init__(self, history_size):
+        self.history = deque(maxlen=history_size)
+        # phase name -> [calls, duration, count], in the order the phases first ran
+        self.phases = OrderedDict()
+        self._lock = threading.Lock()
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def record(self, name, duration, count=0):
+        with self._lock:
+            stats = self.phases.get(name)
+            if stats is None:
+                self.phases[name] = [1, duration, count]
+            else:
+                stats[0] += 1
+                stats[1] += duration
+                stats[2] += count
+
+    def finish_run(self, duration):
+        """
+        Close the current run, add it to the history and return it.
+        """
+        with self._lock:
+            phases, self.phases = self.phases, OrderedDict()
+
+        run = {
+            'timestamp': time.time(),
+            'duration': duration,
+            'phases': [
+                {'name': name, 'calls': calls, 'duration': phase_duration, 'count': count}
+                for name, (calls, phase_duration, count) in phases.items()
+            ],
+        }
+        self.history.append(run)
+
+        return run
@@ -2,27 +2,126 @@
 # All rights reserved
 # Licensed under Simplified BSD License (see LICENSE)
 
-from google.protobuf.internal.decoder import _DecodeVarint32  # pylint: disable=E0611,E0401
+from google.protobuf.internal.decoder import _DecodeVarint, _DecodeVarint32  # pylint: disable=E0611,E0401
+from google.protobuf.message import DecodeError
+from six import PY3
 
 from . import metrics_pb2
 
+# Key of the `name` field of a MetricFamily message: field number 1, length-delimited wire type
+FAMILY_NAME_KEY = (1 << 3) | 2
+
 
 # Deprecated, please use the PrometheusCheck class
-def parse_metric_family(buf):
+def parse_metric_family(buf, family_filter=None):
     """
     Parse the binary buffer in input, searching for Prometheus messages
     of type MetricFamily [0] delimited by a varint32 [1].
 
+    Messages are decoded from a memoryview over the buffer, so it is never copied. If `family_filter` is
+    given, it is called with the name of every family before it is parsed, families for which it returns
+    a falsy value are skipped.
+
     [0] https://github.com/prometheus/client_model/blob/086fe7ca28bde6cec2acd5223423c1475a362858/metrics.proto#L76-%20%20L81  # noqa: E501
     [1] https://developers.google.com/protocol-buffers/docs/reference/java/com/google/protobuf/AbstractMessageLite#writeDelimitedTo(java.io.OutputStream)  # noqa: E501
     """
+    view = memoryview(buf)
     n = 0
-    while n < len(buf):
-        msg_len, new_pos = _DecodeVarint32(buf, n)
-        n = new_pos
-        msg_buf = buf[n : n + msg_len]
+    while n < len(view):
+        msg_len, n = _DecodeVarint32(view, n)
+        message = _parse_family(view[n : n + msg_len], family_filter)
         n += msg_len
+        if message is not None:
+            yield message
+
+
+def parse_metric_family_stream(chunks, family_filter=None):
+    """
+    Same as `parse_metric_family`, but reading from an iterable of bytes chunks such as
+    `requests.Response.iter_content()`. Only the chunks holding a message that is not complete yet are buffered.
+    """
+    buf = b''
+    pending = []
+    available = 0
+    # Number of bytes needed at the start of `buf` before the next message can be decoded
+    required = 0
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+        pending.append(chunk)
+        available += len(chunk)
+        if available < required:
+            continue
+
+        if buf:
+            pending.insert(0, buf)
+        buf = pending[0] if len(pending) == 1 else b''.join(pending)
+        pending = []
+
+        view = memoryview(buf)
+        size = len(view)
+        n = 0
+        while n < size:
+            try:
+                msg_len, start = _DecodeVarint32(view, n)
+            except IndexError:
+                # The length prefix itself is split across chunks
+                required = size - n + 1
+                break
+            if start + msg_len > size:
+                required = start + msg_len - n
+                break
+
+            message = _parse_family(view[start : start + msg_len], family_filter)
+            n = start + msg_len
+            if message is not None:
+                yield message
+        else:
+            required = 0
+
+        buf = buf[n:]
+        available = len(buf)
+
+    if buf or pending:
+        raise DecodeError('Truncated message.')
+
+
+def _parse_family(view, family_filter):
+    if family_filter is not None:
+        name = _peek_family_name(view)
+        if name is not None and not family_filter(name):
+            return None
+
+    message = metrics_pb2.MetricFamily()
+    # The pure Python implementation only accepts memoryviews on Python 3
+    message.ParseFromString(view if PY3 else view.tobytes())
+    return message
+
+
+def _peek_family_name(view):
+    """
+    Return the name of a serialized MetricFamily without parsing the rest of it, or None if it can't be found.
+    """
+    pos = 0
+    size = len(view)
+    while pos < size:
+        key, pos = _DecodeVarint32(view, pos)
+        wire_type = key & 0x7
+        if wire_type == 2:
+            length, pos = _DecodeVarint32(view, pos)
+            if key == FAMILY_NAME_KEY:
+                return view[pos : pos + length].tobytes().decode('utf-8')
+            pos += length
+        elif wire_type == 0:
+            _, pos = _DecodeVarint(view, pos)
+        elif wire_type == 1:
+            pos += 8
+        elif wire_type == 5:
+            pos += 4
+        else:
+            # Groups are not used by MetricFamily, let the full parse deal with it
+            return None
 
-        message = metrics_pb2.MetricFamily()
-        message.ParseFromString(msg_buf)
-        yield message
+    # The name is not serialized when empty
+    return ''
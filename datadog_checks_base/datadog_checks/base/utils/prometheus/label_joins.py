@@ -0,0 +1,144 @@
+# (C) Datadog, Inc. 2020
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+from collections import deque
+from copy import deepcopy
+
+from six import iteritems
+
+
+class LabelJoinIndex(object):
+    """
+    Labels to add to samples, indexed by the value of the label they are joined on, built from a
+    `label_joins` configuration:
+
+        {
+            'kube_pod_info': {'label_to_match': 'pod', 'labels_to_get': ['node', 'host_ip']},
+        }
+
+    Every scrape is a generation: entries that were neither stored nor joined during the last `ttl` generations
+    expire when `next_generation` is called. Only the entries refreshed during the expired generations are
+    looked at, the whole index is never swept. If `max_size` is set, the least recently refreshed entries are
+    evicted to make room for new ones.
+    """
+
+    def __init__(self, label_joins, max_size=0, ttl=1):
+        self.label_joins = deepcopy(label_joins)
+        self.max_size = max_size
+        self.ttl = max(1, ttl)
+        self.generation = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._size = 0
+
+        # label to match -> {label value -> labels to add}
+        self.mappings = {}
+        # label to match -> {label value -> generation it was last stored or joined in}
+        self._last_seen = {}
+        # metric name -> (label to match, labels to get)
+        self._sources = {}
+        for metric_name, join in iteritems(label_joins):
+            label_to_match = join['label_to_match']
+            labels_to_get = frozenset(join['labels_to_get']).difference((label_to_match,))
+            self._sources[metric_name] = (label_to_match, labels_to_get)
+            self.mappings.setdefault(label_to_match, {})
+            self._last_seen.setdefault(label_to_match, {})
+
+        # Precomputed lookups for `join`, sorted for the joined labels to be deterministic
+        self._watched = tuple(
+            (label_to_match, self.mappings[label_to_match], self._last_seen[label_to_match])
+            for label_to_match in sorted(self.mappings)
+        )
+
+        # (generation, keys refreshed during it), oldest first. A key may be listed again in a later
+        # generation, only its last occurrence is relevant
+        self._generations = deque([(self.generation, deque())])
+
+    def __len__(self):
+        return self._size
+
+    def store(self, metric_name, labels):
+        """
+        Index the labels of a sample of the `metric_name` label join source.
+        """
+        label_to_match, labels_to_get = self._sources[metric_name]
+        value = labels.get(label_to_match)
+        if value is None:
+            return
+
+        joined = {name: label_value for name, label_value in iteritems(labels) if name in labels_to_get}
+        mapping = self.mappings[label_to_match]
+        existing = mapping.get(value)
+        if existing is not None:
+            existing.update(joined)
+            self._touch(label_to_match, value, self._last_seen[label_to_match])
+            return
+
+        mapping[value] = joined
+        self._size += 1
+        self._touch(label_to_match, value, self._last_seen[label_to_match])
+        if self.max_size and self._size > self.max_size:
+            self._evict()
+
+    def join(self, labels):
+        """
+        Add the indexed labels to the labels of a sample, in place.
+        """
+        generation = self.generation
+        for label_to_match, mapping, last_seen in self._watched:
+            value = labels.get(label_to_match)
+            if value is None:
+                continue
+
+            joined = mapping.get(value)
+            if joined is None:
+                continue
+
+            if last_seen[value] != generation:
+                last_seen[value] = generation
+                self._generations[-1][1].append((label_to_match, value))
+            labels.update(joined)
+
+    def next_generation(self):
+        """
+        Expire the entries that were not refreshed during the last `ttl` generations, and start a new one.
+        """
+        oldest_kept = self.generation - self.ttl + 1
+        while self._generations and self._generations[0][0] < oldest_kept:
+            generation, keys = self._generations.popleft()
+            for label_to_match, value in keys:
+                if self._last_seen[label_to_match].get(value) == generation:
+                    self._remove(label_to_match, value)
+                    self.expirations += 1
+
+        self.generation += 1
+        self._generations.append((self.generation, deque()))
+
+    def reset_stats(self):
+        self.evictions = 0
+        self.expirations = 0
+
+    def _touch(self, label_to_match, value, last_seen):
+        if last_seen.get(value) != self.generation:
+            last_seen[value] = self.generation
+            self._generations[-1][1].append((label_to_match, value))
+
+    def _evict(self):
+        while True:
+            generation, keys = self._generations[0]
+            while keys:
+                label_to_match, value = keys.popleft()
+                if self._last_seen[label_to_match].get(value) == generation:
+                    self._remove(label_to_match, value)
+                    self.evictions += 1
+                    return
+
+            # Never drop the current generation, new keys are appended to it
+            if len(self._generations) == 1:
+                return
+            self._generations.popleft()
+
+    def _remove(self, label_to_match, value):
+        del self._last_seen[label_to_match][value]
+        del self.mappings[label_to_match][value]
+        self._size -= 1
@@ -0,0 +1,217 @@
+# (C) Datadog, Inc. 2020
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+from prometheus_client.core import Metric
+
+# Sample name suffixes belonging to a family, depending on its declared type
+FAMILY_SUFFIXES = {
+    'counter': ('',),
+    'gauge': ('',),
+    'summary': ('_count', '_sum', ''),
+    'histogram': ('_count', '_sum', '_bucket'),
+}
+
+
+def text_fd_to_metric_families(fd, family_filter=None, skipped=None):
+    """
+    Parse the Prometheus text format from an iterable of lines, yielding `core.Metric` objects.
+
+    This is a drop-in replacement for `prometheus_client.parser.text_fd_to_metric_families`: it groups
+    samples into families with the same rules, but streams over the input and can drop whole families
+    before their samples are parsed.
+
+    :param fd: iterable of text lines, e.g. `requests.Response.iter_lines(decode_unicode=True)`
+    :param family_filter: optional callable `(name, type) -> bool`, called once per family before its
+                          first sample is parsed. Families for which it returns a falsy value are not
+                          parsed nor yielded.
+    :param skipped: optional `collections.Counter`, incremented by the number of samples of every
+                    dropped family, keyed by `(name, type)`
+    """
+    name = ''
+    documentation = ''
+    typ = 'untyped'
+    samples = []
+    allowed_names = ()
+    # None until the filter has been consulted for the current family
+    keep = None
+
+    for line in fd:
+        line = line.strip()
+        if not line:
+            continue
+
+        if line[0] == '#':
+            parts = line.split(None, 3)
+            if len(parts) < 2:
+                continue
+            if parts[1] == 'HELP':
+                if parts[2] != name:
+                    if name != '' and _keep_family(family_filter, keep, name, typ):
+                        yield _build_metric(name, documentation, typ, samples)
+                    # New metric
+                    name = parts[2]
+                    typ = 'untyped'
+                    samples = []
+                    allowed_names = (name,)
+                    keep = None
+                if len(parts) == 4:
+                    documentation = _replace_help_escaping(parts[3])
+                else:
+                    documentation = ''
+            elif parts[1] == 'TYPE':
+                if parts[2] != name:
+                    if name != '' and _keep_family(family_filter, keep, name, typ):
+                        yield _build_metric(name, documentation, typ, samples)
+                    # New metric
+                    name = parts[2]
+                    documentation = ''
+                    samples = []
+                    keep = None
+                typ = parts[3]
+                allowed_names = tuple(name + suffix for suffix in FAMILY_SUFFIXES.get(typ, ('',)))
+            continue
+
+        # Only the sample name is needed to know which family the line belongs to
+        name_end = line.find('{')
+        has_labels = name_end != -1
+        if has_labels:
+            sample_name = line[:name_end].rstrip()
+        else:
+            name_end = line.find(' ')
+            if name_end == -1:
+                name_end = line.find('\t')
+                if name_end == -1:
+                    raise ValueError('Invalid sample: {}'.format(line))
+            sample_name = line[:name_end]
+
+        if sample_name in allowed_names:
+            if keep is None:
+                keep = family_filter is None or family_filter(name, typ)
+            if keep:
+                samples.append(_parse_sample(line, sample_name, name_end, has_labels))
+            elif skipped is not None:
+                skipped[(name, typ)] += 1
+            continue
+
+        if name != '' and _keep_family(family_filter, keep, name, typ):
+            yield _build_metric(name, documentation, typ, samples)
+        # New metric, yield immediately as untyped singleton
+        name = ''
+        documentation = ''
+        typ = 'untyped'
+        samples = []
+        allowed_names = ()
+        keep = None
+        if family_filter is None or family_filter(sample_name, 'untyped'):
+            yield _build_metric(sample_name, '', 'untyped', [_parse_sample(line, sample_name, name_end, has_labels)])
+        elif skipped is not None:
+            skipped[(sample_name, 'untyped')] += 1
+
+    if name != '' and _keep_family(family_filter, keep, name, typ):
+        yield _build_metric(name, documentation, typ, samples)
+
+
+def _keep_family(family_filter, keep, name, typ):
+    # Families without samples have not been through the filter yet
+    if keep is None:
+        return family_filter is None or family_filter(name, typ)
+    return keep
+
+
+def _build_metric(name, documentation, typ, samples):
+    metric = Metric(name, documentation, typ)
+    metric.samples = samples
+    return metric
+
+
+def _parse_sample(line, name, name_end, has_labels):
+    if has_labels:
+        labels_end = line.rfind('}')
+        if labels_end > name_end:
+            return name, _parse_labels(line[name_end + 1 : labels_end]), float(_parse_value(line[labels_end + 1 :]))
+
+    return name, {}, float(_parse_value(line[name_end:]))
+
+
+def _parse_value(text):
+    # If we have multiple values (i.e. a timestamp) only consider the first
+    text = text.lstrip()
+    end = text.find(' ')
+    if end == -1:
+        end = text.find('\t')
+        if end == -1:
+            return text
+    return text[:end]
+
+
+def _parse_labels(text):
+    if '=' not in text:
+        return {}
+    if '\\' in text:
+        return _parse_escaped_labels(text)
+
+    # Without backslashes no label value can contain a quote, so quotes alternate between opening and closing
+    parts = text.split('"')
+    if not len(parts) % 2:
+        raise ValueError('Invalid labels: {}'.format(text))
+
+    labels = {}
+    for i in range(0, len(parts) - 1, 2):
+        label_name = parts[i]
+        if i:
+            # Everything up to the comma separating it from the previous label
+            label_name = label_name[label_name.find(',') + 1 :]
+        value_start = label_name.find('=')
+        if value_start == -1:
+            raise ValueError('Invalid labels: {}'.format(text))
+        labels[label_name[:value_start].strip()] = parts[i + 1].strip()
+
+    trailing = parts[-1]
+    if trailing[trailing.find(',') + 1 :].strip():
+        raise ValueError('Invalid labels: {}'.format(text))
+
+    return labels
+
+
+def _parse_escaped_labels(text):
+    labels = {}
+    sub_labels = text
+    try:
+        # Process one label at a time
+        while sub_labels:
+            # The label name is before the equal
+            value_start = sub_labels.index('=')
+            label_name = sub_labels[:value_start]
+            sub_labels = sub_labels[value_start + 1 :].lstrip()
+            # Find the first quote after the equal
+            quote_start = sub_labels.index('"') + 1
+            value_substr = sub_labels[quote_start:]
+
+            # Find the first unescaped quote
+            i = 0
+            while i < len(value_substr):
+                i = value_substr.index('"', i)
+                if value_substr[i - 1] != '\\':
+                    break
+                i += 1
+
+            # The label value is in between the opening and closing quotes
+            quote_end = quote_start + i
+            labels[label_name.strip()] = _replace_escaping(sub_labels[quote_start:quote_end]).strip()
+
+            # Remove the processed label from the sub-slice for next iteration
+            sub_labels = sub_labels[quote_end + 1 :]
+            next_comma = sub_labels.find(',') + 1
+            sub_labels = sub_labels[next_comma:].lstrip()
+
+        return labels
+    except ValueError:
+        raise ValueError('Invalid labels: {}'.format(text))
+
+
+def _replace_help_escaping(text):
+    return text.replace('\\n', '\n').replace('\\\\', '\\')
+
+
+def _replace_escaping(text):
+    return text.replace('\\n', '\n').replace('\\\\', '\\').replace('\\"', '"')
@@ -6,3 +6,12 @@ try:
     import tagger
 except ImportError:
     from ..stubs import tagger  # noqa: F401
+
+
+class NormalizedTags(tuple):
+    """
+    Immutable sequence of tags that have already gone through `AgentCheck._normalize_tags_type`,
+    submitting it skips the normalization. Use it to share tags between many submissions.
+    """
+
+    __slots__ = ()
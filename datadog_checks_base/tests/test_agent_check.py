@@ -13,6 +13,7 @@ from six import PY3
 from datadog_checks.base import AgentCheck
 from datadog_checks.base import __version__ as base_package_version
 from datadog_checks.base.checks.base import datadog_agent
+from datadog_checks.base.utils.tagging import NormalizedTags
 
 
 def test_instance():
@@ -305,6 +306,28 @@ class TestMetricNormalization:
 
         assert check.normalize(metric_name) == normalized_metric_name
 
+    def test_cache(self):
+        check = AgentCheck()
+        metric_name = u'Klüft inför på fédéral'
+
+        assert check.normalize(metric_name) == 'Kluft_infor_pa_federal'
+        assert check.normalize(metric_name, fix_case=True) == 'kluft_infor_pa_federal'
+        assert check.normalize(metric_name, prefix='prefix', fix_case=True) == 'prefix.kluft_infor_pa_federal'
+        assert check.normalize(metric_name) == 'Kluft_infor_pa_federal'
+
+        cache = check._metric_name_cache
+        assert len(cache) == 3
+        assert (cache.hits, cache.misses) == (1, 3)
+
+    def test_cache_disabled(self):
+        class NoCacheCheck(AgentCheck):
+            METRIC_NAME_CACHE_SIZE = 0
+
+        check = NoCacheCheck()
+
+        assert check._metric_name_cache is None
+        assert check.normalize(u'some_.dots._and_._underscores') == 'some.dots.and.underscores'
+
 
 class TestMetrics:
     def test_namespace(self, aggregator):
@@ -325,6 +348,45 @@ class TestMetrics:
 
         aggregator.assert_metric('metric', count=len(methods))
 
+    def test_namespace_changed(self, aggregator):
+        check = AgentCheck()
+        check.__NAMESPACE__ = 'test'
+        check.gauge('metric', 0)
+        check.gauge('metric', 1)
+        check.__NAMESPACE__ = 'other'
+        check.gauge('metric', 2)
+
+        aggregator.assert_metric('test.metric', count=2)
+        aggregator.assert_metric('other.metric', value=2, count=1)
+        # Only normalized names are cached
+        assert len(check._metric_name_cache) == 0
+
+    def test_metric_name_cache_telemetry(self, aggregator):
+        class TestCheck(AgentCheck):
+            __NAMESPACE__ = 'test'
+            METRIC_NAME_CACHE_SIZE = 1
+
+            def check(self, _):
+                self.normalize('metric1')
+                self.normalize('metric1')
+                self.normalize('metric2')
+
+        check = TestCheck('test', {}, [{'telemetry': True, 'tags': ['foo:bar']}])
+        check.run()
+
+        tags = ['foo:bar']
+        aggregator.assert_metric('test.telemetry.metric_name_cache.size', value=1, tags=tags)
+        aggregator.assert_metric('test.telemetry.metric_name_cache.hits.count', value=1, tags=tags)
+        aggregator.assert_metric('test.telemetry.metric_name_cache.misses.count', value=2, tags=tags)
+        aggregator.assert_metric('test.telemetry.metric_name_cache.evictions.count', value=1, tags=tags)
+
+    def test_metric_name_cache_telemetry_disabled(self, aggregator):
+        check = AgentCheck('test', {}, [{}])
+        check.check = lambda _: None
+        check.run()
+
+        assert not aggregator.metric_names
+
     def test_non_float_metric(self, aggregator):
         check = AgentCheck()
         metric_name = 'test_metric'
@@ -332,6 +394,64 @@ class TestMetrics:
             check.gauge(metric_name, '85k')
         aggregator.assert_metric(metric_name, count=0)
 
+    def test_submit_metrics(self, aggregator):
+        # Like the Agent's aggregator, the stub has no batch method and gets the points one by one
+        check = AgentCheck()
+        check.__NAMESPACE__ = 'test'
+
+        methods = ('gauge', 'count', 'monotonic_count', 'rate', 'histogram', 'historate')
+        for method in methods:
+            check.submit_metrics(
+                method,
+                [
+                    ('metric.{}'.format(method), 1, ['foo:bar'], None),
+                    ('metric.{}'.format(method), None, ['foo:bar'], None),
+                    ('metric.{}'.format(method), '2', None, 'host'),
+                ],
+            )
+            getattr(check, method)('single.{}'.format(method), 1, tags=['foo:bar'])
+            getattr(check, method)('single.{}'.format(method), '2', hostname='host')
+
+        for method in methods:
+            batch = aggregator.metrics('test.metric.{}'.format(method))
+            single = aggregator.metrics('test.single.{}'.format(method))
+            assert [m[1:] for m in batch] == [m[1:] for m in single]
+            assert [(m.value, m.tags, m.hostname) for m in batch] == [(1.0, ['foo:bar'], ''), (2.0, [], 'host')]
+
+        check.submit_metrics('gauge', [('raw.metric', 1, None, None)], raw=True)
+        aggregator.assert_metric('raw.metric', count=1)
+
+    def test_submit_metrics_batch(self, aggregator, monkeypatch):
+        # Aggregators with a batch method get all the points at once
+        submit_metrics = mock.Mock()
+        monkeypatch.setattr(aggregator, 'submit_metrics', submit_metrics, raising=False)
+        check = AgentCheck()
+        check.__NAMESPACE__ = 'test'
+
+        check.submit_metrics('gauge', [('metric', 1, ['foo:bar'], None), ('metric', 2, None, 'host')])
+        check.submit_metrics('count', [('metric', 3, None, None)], raw=True)
+
+        assert submit_metrics.call_args_list == [
+            mock.call(
+                check,
+                check.check_id,
+                aggregator.GAUGE,
+                [('test.metric', 1.0, ['foo:bar'], ''), ('test.metric', 2.0, [], 'host')],
+            ),
+            mock.call(check, check.check_id, aggregator.COUNT, [('metric', 3.0, [], '')]),
+        ]
+        assert not aggregator.metric_names
+
+    def test_submit_metrics_errors(self, aggregator):
+        check = AgentCheck()
+
+        with pytest.raises(ValueError):
+            check.submit_metrics('service_check', [('metric', 1, None, None)])
+
+        with pytest.raises(ValueError):
+            check.submit_metrics('gauge', [('metric', 1, None, None), ('metric', '85k', None, None)])
+        aggregator.assert_metric('metric', count=0)
+
 
 class TestEvents:
     def test_valid_event(self, aggregator):
@@ -481,6 +601,13 @@ class TestTags:
         assert normalized_tags == ['tag:foo']
         assert 'Error encoding tag' not in caplog.text
 
+    def test_normalized_tags(self):
+        check = AgentCheck()
+        tags = NormalizedTags(['tag:foo'])
+
+        assert check._normalize_tags_type(tags, None) is tags
+        assert check._normalize_tags_type(tags, 'foo') == ['device:foo', 'tag:foo']
+
     def test_external_host_tag_normalization(self):
         """
         Tests that the external_host_tag modifies in place the list of tags in the provided object
@@ -552,6 +679,19 @@ class TestLimits:
         assert len(check.get_warnings()) == 1
         assert len(aggregator.metrics("metric")) == 29
 
+    def test_metric_limit_submit_metrics(self, aggregator):
+        check = LimitedCheck()
+
+        check.submit_metrics('gauge', [('metric', 0, None, None)] * 20)
+        assert len(check.get_warnings()) == 1
+        assert len(aggregator.metrics("metric")) == 10
+
+        check = LimitedCheck()
+        check.submit_metrics('count', [('count', 0, None, 'host-single')] * 20)
+        check.submit_metrics('count', [('count', 0, None, 'host-{}'.format(i)) for i in range(20)])
+        assert len(check.get_warnings()) == 1
+        assert len(aggregator.metrics("count")) == 29
+
     def test_metric_limit_instance_config(self, aggregator):
         instances = [{"max_returned_metrics": 42}]
         check = AgentCheck("test", {}, instances)
@@ -669,3 +809,178 @@ class TestCheckInitializations:
         check.run()
 
         assert check.initialize.call_count == 2
+
+
+class TestProfileCpu:
+    @staticmethod
+    def busy_check():
+        class TestCheck(AgentCheck):
+            def check(self, _):
+                self.compute()
+
+            def compute(self):
+                return sum(i * i for i in range(10000))
+
+        return TestCheck
+
+    def test_metrics(self, aggregator):
+        check = self.busy_check()('test', {'profile_cpu_limit': 3}, [{}])
+
+        with mock.patch('datadog_checks.base.checks.base.should_profile_cpu', return_value=True):
+            assert check.run() == ''
+
+        tags = ['check_name:test', 'check_version:{}'.format(check.check_version)]
+        aggregator.assert_metric('datadog.agent.profile.cpu.check_run_time', count=1, tags=tags)
+        aggregator.assert_metric('datadog.agent.profile.cpu.cumulative_time', count=3)
+        aggregator.assert_metric('datadog.agent.profile.cpu.self_time', count=3)
+
+        function_tags = [
+            tag
+            for metric in aggregator.metrics('datadog.agent.profile.cpu.cumulative_time')
+            for tag in metric.tags
+            if tag.startswith('function:')
+        ]
+        assert any(tag.endswith('(compute)') for tag in function_tags)
+        assert not any('_lsprof' in tag for tag in function_tags)
+
+    def test_profiling_tags(self, aggregator):
+        check = self.busy_check()('test', {'profile_cpu': True}, [{'__memory_profiling_tags': ['foo:bar']}])
+        check.run()
+
+        tags = ['check_name:test', 'check_version:{}'.format(check.check_version), 'foo:bar']
+        aggregator.assert_metric('datadog.agent.profile.cpu.check_run_time', count=1, tags=tags)
+
+    def test_metrics_only(self, aggregator, tmpdir):
+        check = self.busy_check()('test', {'profile_cpu': True}, [{}])
+        with tmpdir.as_cwd():
+            assert check.run() == ''
+
+        aggregator.assert_metric('datadog.agent.profile.cpu.check_run_time', count=1)
+        assert not tmpdir.listdir()
+
+    @pytest.mark.parametrize('value', ['false', 'False', 'no', '0', ''])
+    def test_disabled_string(self, aggregator, tmpdir, value):
+        check = self.busy_check()('test', {'profile_cpu': value}, [{}])
+        with tmpdir.as_cwd():
+            assert check.run() == ''
+
+        assert not aggregator.metric_names
+        assert not tmpdir.listdir()
+
+    def test_enabled_string(self, aggregator, tmpdir):
+        check = self.busy_check()('test', {'profile_cpu': 'True'}, [{}])
+        with tmpdir.as_cwd():
+            assert check.run() == ''
+
+        aggregator.assert_metric('datadog.agent.profile.cpu.check_run_time', count=1)
+        assert not tmpdir.listdir()
+
+    def test_invalid_location(self, aggregator):
+        check = self.busy_check()('test', {'profile_cpu': 1}, [{}])
+        result = json.loads(check.run())
+
+        assert result[0]['message'] == '`profile_cpu` must be a directory or a boolean, got: 1'
+        assert not aggregator.metric_names
+
+    def test_disabled(self, aggregator):
+        check = self.busy_check()('test', {}, [{}])
+        check.run()
+
+        assert not aggregator.metric_names
+
+    def test_interval(self, aggregator):
+        check = self.busy_check()('test', {'profile_cpu': 'true', 'profile_cpu_interval': 3}, [{}])
+        for _ in range(7):
+            check.run()
+
+        aggregator.assert_metric('datadog.agent.profile.cpu.check_run_time', count=3)
+
+    def test_error(self, aggregator):
+        class TestCheck(AgentCheck):
+            def check(self, _):
+                raise Exception('boom')
+
+        check = TestCheck('test', {'profile_cpu': True}, [{}])
+        result = json.loads(check.run())
+
+        assert result[0]['message'] == 'boom'
+        assert not aggregator.metric_names
+
+    def test_write_stats(self, aggregator, tmpdir):
+        import pstats
+
+        location = str(tmpdir)
+        check = self.busy_check()('test', {'profile_cpu': location, 'profile_cpu_interval': 1}, [{}])
+        check.check_id = 'test:123'
+        check.run()
+        check.run()
+
+        stats_dir = tmpdir.join('test', '123', 'stats')
+        report_dir = tmpdir.join('test', '123', 'reports')
+        assert len(stats_dir.listdir()) == 2
+        assert len(report_dir.listdir()) == 2
+
+        stats = pstats.Stats(str(stats_dir.listdir()[0]))
+        assert any(function == 'compute' for _, _, function in stats.stats)
+        assert 'function calls' in report_dir.listdir()[0].read()
+
+
+class TestPhases:
+    @staticmethod
+    def phased_check():
+        class TestCheck(AgentCheck):
+            def check(self, _):
+                with self.phase('fetch'):
+                    pass
+                for _ in range(2):
+                    with self.phase('parse') as phase:
+                        phase.add(3)
+                self.record_phase('fetch', 0.5, 4)
+
+        return TestCheck
+
+    def test_disabled(self, aggregator):
+        check = self.phased_check()('test', {}, [{}])
+        check.run()
+
+        assert check.get_phase_history() == []
+        assert not aggregator.metric_names
+
+    def test_metrics(self, aggregator):
+        check = self.phased_check()('test', {}, [{'telemetry': True, 'tags': ['foo:bar']}])
+        check.run()
+
+        aggregator.assert_metric('test.telemetry.run.time', count=1, tags=['foo:bar'])
+        for phase, calls, items in (('fetch', 2, 4), ('parse', 2, 6)):
+            tags = ['foo:bar', 'phase:{}'.format(phase)]
+            aggregator.assert_metric('test.telemetry.phase.time', count=1, tags=tags)
+            aggregator.assert_metric('test.telemetry.phase.calls.count', value=calls, tags=tags)
+            aggregator.assert_metric('test.telemetry.phase.items.count', value=items, tags=tags)
+
+        fetch_time = [m.value for m in aggregator.metrics('test.telemetry.phase.time') if 'phase:fetch' in m.tags]
+        assert fetch_time[0] >= 0.5
+
+    def test_history(self):
+        class TestCheck(self.phased_check()):
+            PHASE_HISTORY_SIZE = 2
+
+        check = TestCheck('test', {}, [{'telemetry': True}])
+        for _ in range(3):
+            check.run()
+
+        history = check.get_phase_history()
+        assert len(history) == 2
+        assert [phase['name'] for phase in history[-1]['phases']] == ['fetch', 'parse']
+        assert history[-1]['phases'][1]['count'] == 6
+        json.dumps(history)
+
+    def test_error(self):
+        class TestCheck(AgentCheck):
+            def check(self, _):
+                with self.phase('fetch'):
+                    raise Exception('boom')
+
+        check = TestCheck('test', {}, [{'telemetry': True}])
+        check.run()
+
+        assert check.get_phase_history()[0]['phases'][0]['name'] == 'fetch'
@@ -0,0 +1,138 @@
+# (C) Datadog, Inc. 2020
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+import re
+
+import mock
+import pytest
+from prometheus_client.parser import text_fd_to_metric_families as legacy_text_fd_to_metric_families
+
+from datadog_checks.base import OpenMetricsBaseCheck
+from datadog_checks.base.utils.common import PatternFilter, pattern_filter
+
+PAYLOAD_SIZE = 50 * 1024 * 1024
+
+CADVISOR_FAMILIES = [
+    ('container_cpu_usage_seconds_total', 'counter'),
+    ('container_cpu_cfs_throttled_seconds_total', 'counter'),
+    ('container_fs_reads_bytes_total', 'counter'),
+    ('container_fs_writes_bytes_total', 'counter'),
+    ('container_memory_usage_bytes', 'gauge'),
+    ('container_memory_working_set_bytes', 'gauge'),
+    ('container_network_receive_bytes_total', 'counter'),
+    ('container_network_transmit_bytes_total', 'counter'),
+    ('container_spec_cpu_shares', 'gauge'),
+    ('container_spec_memory_limit_bytes', 'gauge'),
+    ('container_last_seen', 'gauge'),
+]
+
+INSTANCE = {
+    'prometheus_url': 'http://localhost:4194/metrics',
+    'namespace': 'cadvisor',
+    'metrics': [{'container_cpu_usage_seconds_total': 'cpu.usage', 'container_memory_usage_bytes': 'memory.usage'}],
+    'ignore_metrics': ['container_last_seen'],
+}
+
+
+def generate_cadvisor_payload(size):
+    """
+    Build a cAdvisor-like text payload of roughly `size` bytes, most of which is never submitted.
+    """
+    sample = (
+        '{name}{{container="container-{i}",id="/kubepods/burstable/pod{i:08x}/{i:064x}",'
+        'image="gcr.io/project/image-{i}:1.0.0",name="k8s_container-{i}_pod-{i}_default_{i:08x}_0",'
+        'namespace="default",pod="pod-{i}"}} {i} 1580000000000'
+    )
+    series_size = sum(len(sample.format(name=name, i=0)) + 1 for name, _ in CADVISOR_FAMILIES)
+    series = size // series_size
+
+    lines = []
+    for name, typ in CADVISOR_FAMILIES:
+        lines.append('# HELP {} Synthetic cAdvisor metric.'.format(name))
+        lines.append('# TYPE {} {}'.format(name, typ))
+        lines.extend(sample.format(name=name, i=i) for i in range(series))
+    return lines
+
+
+class MockResponse(object):
+    def __init__(self, lines):
+        self.lines = lines
+        self.headers = {'Content-Type': 'text/plain'}
+
+    def iter_lines(self, **_):
+        return iter(self.lines)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(scope='module')
+def cadvisor_payload():
+    return generate_cadvisor_payload(PAYLOAD_SIZE)
+
+
+@pytest.mark.parametrize('streaming', [False, True], ids=['legacy_parser', 'streaming_parser'])
+def test_cadvisor_payload(benchmark, cadvisor_payload, streaming):
+    import tracemalloc
+
+    check = OpenMetricsBaseCheck('cadvisor', {}, [INSTANCE])
+    check.poll = mock.Mock(side_effect=lambda *args, **kwargs: MockResponse(cadvisor_payload))
+    scraper_config = check.get_scraper_config(INSTANCE)
+
+    patcher = mock.patch(
+        'datadog_checks.base.checks.openmetrics.mixins.text_fd_to_metric_families',
+        lambda fd, *args: legacy_text_fd_to_metric_families(fd),
+    )
+    if not streaming:
+        patcher.start()
+
+    try:
+        # Run once to compile the metric plans, and measure the peak memory of a scrape
+        tracemalloc.start()
+        check.process(scraper_config)
+        benchmark.extra_info['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        benchmark.extra_info['payload_size'] = sum(len(line) + 1 for line in cadvisor_payload)
+        benchmark.pedantic(check.process, args=(scraper_config,), rounds=3)
+    finally:
+        if not streaming:
+            patcher.stop()
+
+
+def legacy_pattern_filter(items, whitelist=None, blacklist=None, key=None):
+    """
+    `pattern_filter` as it was before patterns were compiled, searching for every pattern in every key.
+    """
+    key = key or (lambda item: item)
+
+    def search(patterns):
+        return {key(item) for pattern in patterns for item in items if re.search(pattern, key(item))}
+
+    whitelisted = search(whitelist)
+    whitelisted.difference_update(search(blacklist))
+    return [item for item in items if key(item) in whitelisted]
+
+
+@pytest.mark.parametrize('implementation', ['legacy', 'function', 'object'])
+def test_pattern_filter(benchmark, implementation):
+    groups = ('app', 'system', 'tmp', 'dead')
+    items = [{'name': 'queue.{}.{}'.format(group, i)} for group in groups for i in range(2500)]
+    whitelist = [r'^queue\.app\.', r'^queue\.system\.', r'\.1\d*$', r'^queue\.dead\.[0-4]']
+    blacklist = [r'\.0$', r'^queue\.tmp\.', r'\.99\d$']
+
+    def key(item):
+        return item['name']
+
+    if implementation == 'legacy':
+        run = lambda: legacy_pattern_filter(items, whitelist, blacklist, key=key)  # noqa: E731
+    elif implementation == 'function':
+        run = lambda: pattern_filter(items, whitelist, blacklist, key=key)  # noqa: E731
+    else:
+        # Built once, as checks would do for every instance
+        instance_filter = PatternFilter(whitelist, blacklist, key=key)
+        run = lambda: instance_filter.filter(items)  # noqa: E731
+
+    expected = legacy_pattern_filter(items, whitelist, blacklist, key=key)
+    assert run() == expected
+    benchmark(run)
@@ -3,6 +3,8 @@
 # Licensed under a 3-clause BSD style license (see LICENSE)
 import logging
 import os
+import threading
+import time
 from collections import OrderedDict
 
 import mock
@@ -12,10 +14,12 @@ import requests_kerberos
 import requests_ntlm
 from requests.exceptions import ConnectTimeout, ProxyError
 from six import iteritems
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
 from urllib3.exceptions import InsecureRequestWarning
 
 from datadog_checks.base import AgentCheck, ConfigurationError
-from datadog_checks.base.utils.http import STANDARD_FIELDS, RequestsWrapper
+from datadog_checks.base.utils.http import SESSION_POOL, STANDARD_FIELDS, RequestsWrapper, count_pool_connections
 from datadog_checks.dev import EnvVars
 from datadog_checks.dev.utils import running_on_windows_ci
 
@@ -646,6 +650,213 @@ class TestSession:
             assert getattr(http.session, key) == value
 
 
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'ok'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Set-Cookie', 'session=secret; Path=/')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # Connections are kept alive, they are handled by their own thread
+    daemon_threads = True
+
+
+@pytest.fixture
+def keep_alive_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:{}'.format(server.server_address[1])
+    finally:
+        server.shutdown()
+        server.server_close()
+        SESSION_POOL.clear()
+
+
+class TestConnectionPooling:
+    def test_default_disabled(self):
+        http = RequestsWrapper({}, {})
+
+        assert http.connection_pooling is False
+
+    def test_init_config_enable(self):
+        http = RequestsWrapper({}, {'connection_pooling': True, 'connection_pool_maxsize': 4})
+
+        assert http.connection_pooling is True
+        assert http.pool_settings == (10, 4, 300.0)
+
+    def test_instance_override(self):
+        http = RequestsWrapper({'connection_pooling': False}, {'connection_pooling': True})
+
+        assert http.connection_pooling is False
+
+    def test_shared_session(self):
+        instance = {'connection_pooling': True, 'username': 'user', 'password': 'pass'}
+        http1 = RequestsWrapper(instance, {})
+        http2 = RequestsWrapper(dict(instance), {})
+        http3 = RequestsWrapper(dict(instance, tls_verify=False), {})
+
+        try:
+            assert http1.pooled_session is http2.pooled_session
+            assert http1.pooled_session is not http3.pooled_session
+        finally:
+            SESSION_POOL.clear()
+
+    def test_auth_object_not_shared(self):
+        instance = {'connection_pooling': True, 'auth_type': 'digest', 'username': 'user', 'password': 'pass'}
+        http1 = RequestsWrapper(instance, {})
+        http2 = RequestsWrapper(instance, {})
+
+        assert http1.pool_key is None
+        assert http1.pooled_session is http1.pooled_session
+        assert http1.pooled_session is not http2.pooled_session
+
+    def test_connection_reuse(self, keep_alive_server):
+        http = RequestsWrapper({'connection_pooling': True}, {})
+
+        for _ in range(3):
+            assert http.get(keep_alive_server).content == b'ok'
+
+        assert http.pool_stats == {'requests': 3, 'connections': 1}
+
+        http.reset_pool_stats()
+        assert http.pool_stats == {'requests': 0, 'connections': 0}
+
+    def test_no_cookies(self, keep_alive_server):
+        http = RequestsWrapper({'connection_pooling': True}, {})
+        http.get(keep_alive_server)
+
+        assert not http.pooled_session.cookies
+
+    def test_idle_eviction(self, keep_alive_server):
+        http = RequestsWrapper({'connection_pooling': True, 'connection_pool_idle_timeout': 0.1}, {})
+        http.get(keep_alive_server)
+        session = http.pooled_session
+
+        time.sleep(0.2)
+        http.get(keep_alive_server)
+
+        assert http.pooled_session is not session
+        assert http.pool_stats == {'requests': 2, 'connections': 2}
+
+    def test_telemetry(self, aggregator, keep_alive_server):
+        class TestCheck(AgentCheck):
+            def check(self, _):
+                for _ in range(3):
+                    self.http.get(keep_alive_server)
+
+        check = TestCheck('test', {}, [{'connection_pooling': True, 'telemetry': True}])
+        check.run()
+
+        aggregator.assert_metric('test.telemetry.http.requests.count', value=3)
+        aggregator.assert_metric('test.telemetry.http.connections.new.count', value=1)
+        aggregator.assert_metric('test.telemetry.http.connections.reused.count', value=2)
+
+
+class TestBatch:
+    def test_empty(self):
+        http = RequestsWrapper({}, {})
+
+        assert http.batch([]) == []
+
+    @pytest.mark.parametrize('concurrency', [1, 4])
+    def test_order(self, concurrency):
+        http = RequestsWrapper({}, {})
+        urls = ['http://localhost/{}'.format(i) for i in range(10)]
+
+        def get(url, **options):
+            # Answer the first requests last
+            time.sleep(0.01 * (10 - int(url.rsplit('/', 1)[1])) if concurrency > 1 else 0)
+            return url
+
+        with mock.patch('requests.get', side_effect=get):
+            results = http.batch([('get', url) for url in urls], concurrency=concurrency)
+
+        assert results == [(url, None) for url in urls]
+
+    def test_options(self):
+        http = RequestsWrapper({}, {})
+        options = http.options.copy()
+        options['auth'] = ('user', 'pass')
+
+        with mock.patch('requests.post') as post:
+            http.batch([('post', 'http://localhost', {'auth': ('user', 'pass')})])
+
+        post.assert_called_once_with('http://localhost', **options)
+
+    def test_errors(self):
+        http = RequestsWrapper({}, {})
+        error = requests.exceptions.ConnectionError('refused')
+
+        def get(url, **options):
+            if url.endswith('bad'):
+                raise error
+            return url
+
+        with mock.patch('requests.get', side_effect=get):
+            results = http.batch([('get', 'http://localhost/bad'), ('get', 'http://localhost/good')])
+
+        assert results == [(None, error), ('http://localhost/good', None)]
+
+    def test_concurrency(self):
+        http = RequestsWrapper({}, {})
+        lock = threading.Lock()
+        in_flight = []
+        max_in_flight = []
+
+        def get(url, **options):
+            with lock:
+                in_flight.append(url)
+                max_in_flight.append(len(in_flight))
+            time.sleep(0.02)
+            with lock:
+                in_flight.remove(url)
+            return url
+
+        with mock.patch('requests.get', side_effect=get):
+            http.batch([('get', 'http://localhost/{}'.format(i)) for i in range(12)], concurrency=3)
+
+        assert max(max_in_flight) == 3
+
+    def test_hooks_entered_once(self):
+        http = RequestsWrapper({}, {})
+        hook = mock.MagicMock()
+        http.request_hooks = [hook]
+
+        with mock.patch('requests.get'):
+            http.batch([('get', 'http://localhost/{}'.format(i)) for i in range(5)])
+
+        assert hook.call_count == 1
+
+    def test_persist(self):
+        http = RequestsWrapper({'persist_connections': True}, {})
+
+        with mock.patch('datadog_checks.base.utils.http.RequestsWrapper.session') as session:
+            http.batch([('get', 'http://localhost/{}'.format(i)) for i in range(3)])
+
+        assert session.get.call_count == 3
+
+    def test_connection_pooling(self, keep_alive_server):
+        http = RequestsWrapper({'connection_pooling': True}, {})
+
+        results = http.batch([('get', keep_alive_server)] * 6, concurrency=2)
+
+        assert [response.content for response, _ in results] == [b'ok'] * 6
+        assert http.pool_stats['requests'] == 6
+        assert count_pool_connections(http.pooled_session) <= 2
+
+
 class TestRemapper:
     def test_legacy_no_proxy(self):
         instance = {'no_proxy': True}
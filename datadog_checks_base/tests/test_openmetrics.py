@@ -7,13 +7,18 @@ import copy
 import logging
 import math
 import os
+import threading
+from collections import Counter
 
 import mock
 import pytest
 import requests
 from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily, SummaryMetricFamily
+from prometheus_client.parser import text_fd_to_metric_families as reference_text_fd_to_metric_families
 from six import iteritems
 
+from datadog_checks.base.utils.prometheus import parser
+from datadog_checks.base.utils.prometheus.label_joins import LabelJoinIndex
 from datadog_checks.checks.openmetrics import OpenMetricsBaseCheck
 from datadog_checks.dev import get_here
 
@@ -25,14 +30,18 @@ class MockResponse:
     MockResponse is used to simulate the object requests.Response commonly returned by requests.get
     """
 
-    def __init__(self, content, content_type):
+    def __init__(self, content, content_type, status_code=200):
         self.content = content
         self.headers = {'Content-Type': content_type}
+        self.status_code = status_code
 
     def iter_lines(self, **_):
         for elt in self.content.split("\n"):
             yield elt
 
+    def raise_for_status(self):
+        pass
+
     def close(self):
         pass
 
@@ -1065,23 +1074,6 @@ def test_decumulate_histogram_buckets_single_bucket(p_check, mocked_prometheus_s
     assert sorted(expected_metric.samples, key=lambda i: i[0]) == sorted(current_metric.samples, key=lambda i: i[0])
 
 
-def test_compute_bucket_hash(p_check):
-    check = p_check
-
-    # two different buckets should have the same hash for the same other tags values
-    tags1 = {"url": "http://127.0.0.1:8080/api", "verb": "GET", "le": "1"}
-    tags2 = {"url": "http://127.0.0.1:8080/api", "verb": "GET", "le": "2"}
-    assert check._compute_bucket_hash(tags1) == check._compute_bucket_hash(tags2)
-
-    # tag order should not matter
-    tags3 = {"verb": "GET", "le": "+inf", "url": "http://127.0.0.1:8080/api"}
-    assert check._compute_bucket_hash(tags1) == check._compute_bucket_hash(tags3)
-
-    # changing a tag value should change the context hash
-    tags4 = {"url": "http://127.0.0.1:8080/api", "verb": "DELETE", "le": "1"}
-    assert check._compute_bucket_hash(tags1) != check._compute_bucket_hash(tags4)
-
-
 def test_decumulate_histogram_buckets_multiple_contexts(p_check, mocked_prometheus_scraper_config):
     # buckets are not necessary ordered
     text_data = (
@@ -1241,6 +1233,83 @@ def test_decumulate_histogram_buckets_no_buckets(p_check, mocked_prometheus_scra
     assert sorted(expected_metric.samples, key=lambda i: i[0]) == sorted(current_metric.samples, key=lambda i: i[0])
 
 
+def _reference_decumulate_histogram_buckets(metric):
+    """
+    Dict based implementation `_decumulate_histogram_buckets` must stay equivalent to
+    """
+
+    def context_hash(labels):
+        return hash(frozenset(sorted((k, v) for k, v in iteritems(labels) if k != 'le')))
+
+    values_by_context = {}
+    for sample in metric.samples:
+        if sample[0].endswith('_bucket'):
+            values_by_context.setdefault(context_hash(sample[1]), {})[float(sample[1]['le'])] = sample[2]
+
+    tuples_by_context = {}
+    for context, values in iteritems(values_by_context):
+        upper_bounds = sorted(values)
+        tuples_by_context[context] = {}
+        for i, upper_b in enumerate(upper_bounds):
+            if i == 0:
+                lower_b = 0 if upper_b > 0 else float('-inf')
+                tuples_by_context[context][upper_b] = (lower_b, upper_b, values[upper_b])
+            else:
+                tuples_by_context[context][upper_b] = (
+                    upper_bounds[i - 1],
+                    upper_b,
+                    values[upper_b] - values[upper_bounds[i - 1]],
+                )
+
+    for i, sample in enumerate(metric.samples):
+        if not sample[0].endswith('_bucket'):
+            continue
+        bucket = tuples_by_context[context_hash(sample[1])][float(sample[1]['le'])]
+        sample[1]['lower_bound'] = str(bucket[0])
+        metric.samples[i] = (sample[0], sample[1], bucket[2])
+
+
+def test_decumulate_histogram_buckets_reference(p_check):
+    metric = HistogramMetricFamily('random_histogram', 'Random histogram', labels=['verb', 'code'])
+    for verb, code in (('GET', '200'), ('GET', '500'), ('POST', '200')):
+        metric.add_metric([verb, code], [('-5', 1), ('-1', 3), ('1', 7), ('2.5', 12), ('+Inf', 20)], 42)
+    # Repeated upper bounds and unordered buckets
+    metric.samples.append(('random_histogram_bucket', {'verb': 'GET', 'code': '200', 'le': '1'}, 8))
+    metric.samples.append(('random_histogram_bucket', {'verb': 'PUT', 'code': '200', 'le': '+Inf'}, 9))
+    metric.samples.append(('random_histogram_bucket', {'verb': 'PUT', 'code': '200', 'le': '0.5'}, 4))
+    metric.samples.append(('random_histogram_bucket', {'verb': 'PUT', 'code': '200', 'le': '1e-3'}, 2))
+
+    expected_metric = copy.deepcopy(metric)
+    _reference_decumulate_histogram_buckets(expected_metric)
+
+    bounds = p_check._decumulate_histogram_buckets(metric)
+
+    assert metric.samples == expected_metric.samples
+    for i, sample in enumerate(metric.samples):
+        if sample[0].endswith('_bucket'):
+            assert bounds[i] == (float(sample[1]['lower_bound']), float(sample[1]['le']))
+        else:
+            assert i not in bounds
+
+
+def test_submit_buckets_as_distribution_bounds(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config):
+    check = mocked_prometheus_check
+    config = mocked_prometheus_scraper_config
+    config['_dry_run'] = False
+    config['send_distribution_buckets'] = True
+    config['non_cumulative_buckets'] = True
+
+    metric = HistogramMetricFamily('random_histogram', 'Random histogram')
+    metric.add_metric([], [('0.5', 4), ('+Inf', 9)], 42)
+    check.submit_openmetric('histogram', metric, config)
+
+    buckets = aggregator.histogram_bucket('prometheus.histogram')
+    assert [(b.value, b.lower_bound, b.upper_bound, sorted(b.tags)) for b in buckets] == [
+        (4, 0.0, 0.5, ['lower_bound:0.0', 'upper_bound:0.5']),
+        (5, 0.5, float('inf'), ['lower_bound:0.5', 'upper_bound:inf']),
+    ]
+
+
 def test_parse_one_summary(p_check, mocked_prometheus_scraper_config):
     """
     name: "http_response_size_bytes"
@@ -1788,16 +1857,16 @@ def test_label_joins_gc(aggregator, mocked_prometheus_check, mocked_prometheus_s
         count=1,
     )
 
-    assert 15 == len(mocked_prometheus_scraper_config['_label_mapping']['pod'])
+    assert 15 == len(mocked_prometheus_scraper_config['_label_join_index'].mappings['pod'])
     text_data = mock_get.replace('dd-agent-62bgh', 'dd-agent-1337')
     mock_response = mock.MagicMock(
         status_code=200, iter_lines=lambda **kwargs: text_data.split("\n"), headers={'Content-Type': text_content_type}
     )
     with mock.patch('requests.get', return_value=mock_response, __name__="get"):
         check.process(mocked_prometheus_scraper_config)
-        assert 'dd-agent-1337' in mocked_prometheus_scraper_config['_label_mapping']['pod']
-        assert 'dd-agent-62bgh' not in mocked_prometheus_scraper_config['_label_mapping']['pod']
-        assert 15 == len(mocked_prometheus_scraper_config['_label_mapping']['pod'])
+        assert 'dd-agent-1337' in mocked_prometheus_scraper_config['_label_join_index'].mappings['pod']
+        assert 'dd-agent-62bgh' not in mocked_prometheus_scraper_config['_label_join_index'].mappings['pod']
+        assert 15 == len(mocked_prometheus_scraper_config['_label_join_index'].mappings['pod'])
 
 
 def test_label_joins_missconfigured(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config, mock_get):
@@ -1941,8 +2010,8 @@ def test_label_join_state_change(aggregator, mocked_prometheus_check, mocked_pro
     check.process(mocked_prometheus_scraper_config)
 
     # check that 15 pods are in phase:Running
-    assert 15 == len(mocked_prometheus_scraper_config['_label_mapping']['pod'])
-    for _, tags in iteritems(mocked_prometheus_scraper_config['_label_mapping']['pod']):
+    assert 15 == len(mocked_prometheus_scraper_config['_label_join_index'].mappings['pod'])
+    for _, tags in iteritems(mocked_prometheus_scraper_config['_label_join_index'].mappings['pod']):
         assert tags.get('phase') == 'Running'
 
     text_data = mock_get.replace(
@@ -1955,8 +2024,9 @@ def test_label_join_state_change(aggregator, mocked_prometheus_check, mocked_pro
     )
     with mock.patch('requests.get', return_value=mock_response, __name__="get"):
         check.process(mocked_prometheus_scraper_config)
-        assert 15 == len(mocked_prometheus_scraper_config['_label_mapping']['pod'])
-        assert mocked_prometheus_scraper_config['_label_mapping']['pod']['dd-agent-62bgh']['phase'] == 'Test'
+        assert 15 == len(mocked_prometheus_scraper_config['_label_join_index'].mappings['pod'])
+        mappings = mocked_prometheus_scraper_config['_label_join_index'].mappings
+        assert mappings['pod']['dd-agent-62bgh']['phase'] == 'Test'
 
 
 def test_health_service_check_ok(mock_get, aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config):
@@ -2095,3 +2165,453 @@ def test_metadata_transformer(mocked_openmetrics_check_factory, text_data):
         m.assert_any_call('test:123', 'version.raw', 'v1.6.0-alpha.0.680+3872cb93abf948-dirty')
         m.assert_any_call('test:123', 'version.scheme', 'semver')
         assert m.call_count == 7
+
+
+def test_metric_plans(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config, ref_gauge):
+    check = mocked_prometheus_check
+    config = mocked_prometheus_scraper_config
+    config['_dry_run'] = False
+
+    check.process_metric(ref_gauge, config)
+    check.process_metric(ref_gauge, config)
+
+    assert config['_metric_plans'] == {'process_virtual_memory_bytes': (check.PLAN_MAPPED, 'process.vm.bytes')}
+    assert config['_metric_plans_stats'] == {'hit': 1, 'miss': 1}
+    aggregator.assert_metric('prometheus.process.vm.bytes', count=2)
+
+
+def test_metric_plans_outcomes(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config):
+    check = mocked_prometheus_check
+    config = mocked_prometheus_scraper_config
+    config['_dry_run'] = False
+    config['metrics_mapper'] = {'process_virtual_memory_bytes': 'process.vm.bytes', 'go_*': ''}
+    config['ignore_metrics'] = ['process_start_time_seconds']
+    transformer = mock.MagicMock()
+    transformers = {'process_max_fds': transformer}
+
+    for name in ('process_start_time_seconds', 'process_max_fds', 'go_goroutines', 'process_open_fds'):
+        metric = GaugeMetricFamily(name, '')
+        metric.add_metric([], 1.0)
+        check.process_metric(metric, config, metric_transformers=transformers)
+
+    assert config['_metric_plans'] == {
+        'process_start_time_seconds': (check.PLAN_IGNORE, None),
+        'process_max_fds': (check.PLAN_TRANSFORMER, None),
+        'go_goroutines': (check.PLAN_WILDCARD, None),
+        'process_open_fds': (check.PLAN_SKIP, None),
+    }
+    assert transformer.call_count == 1
+    aggregator.assert_metric('prometheus.go_goroutines', count=1)
+    aggregator.assert_all_metrics_covered()
+
+    # A transformer that is not given anymore invalidates the plan
+    metric = GaugeMetricFamily('process_max_fds', '')
+    metric.add_metric([], 1.0)
+    check.process_metric(metric, config)
+    assert config['_metric_plans']['process_max_fds'] == (check.PLAN_SKIP, None)
+    assert transformer.call_count == 1
+
+
+def test_metric_plans_invalidation(mocked_prometheus_check, mocked_prometheus_scraper_config, ref_gauge):
+    check = mocked_prometheus_check
+    config = mocked_prometheus_scraper_config
+    config['_dry_run'] = False
+
+    check.process_metric(ref_gauge, config)
+    assert config['_metric_plans']['process_virtual_memory_bytes'] == (check.PLAN_MAPPED, 'process.vm.bytes')
+
+    # Replacing the mapper is caught on the next lookup
+    config['metrics_mapper'] = {'process_virtual_memory_bytes': 'process.vm'}
+    check.process_metric(ref_gauge, config)
+    assert config['_metric_plans']['process_virtual_memory_bytes'] == (check.PLAN_MAPPED, 'process.vm')
+
+    # In-place changes are caught once per scrape
+    config['ignore_metrics'].append('process_virtual_memory_bytes')
+    check._validate_metric_plans(config)
+    assert config['_metric_plans'] == {}
+    check.process_metric(ref_gauge, config)
+    assert config['_metric_plans']['process_virtual_memory_bytes'] == (check.PLAN_IGNORE, None)
+
+
+def test_metric_plans_telemetry(aggregator, mocked_openmetrics_check_factory, text_data):
+    instance = dict(OPENMETRICS_CHECK_INSTANCE)
+    instance['telemetry'] = True
+    check = mocked_openmetrics_check_factory(instance)
+    check.poll = mock.MagicMock(side_effect=lambda _: MockResponse(text_data, text_content_type))
+
+    check.check(instance)
+    check.check(instance)
+
+    misses = [m.value for m in aggregator.metrics('openmetrics.telemetry.metrics.plan_cache.miss.count')]
+    hits = [m.value for m in aggregator.metrics('openmetrics.telemetry.metrics.plan_cache.hit.count')]
+    assert misses == [40, 0]
+    assert hits == [0, 40]
+
+
+def test_metric_tags_cache(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config):
+    check = mocked_prometheus_check
+    config = mocked_prometheus_scraper_config
+    config['_dry_run'] = False
+    config['custom_tags'] = ['env:dev']
+    config['exclude_labels'] = ['excluded']
+    config['labels_mapper'] = {'label': 'mapped'}
+
+    metric = GaugeMetricFamily('process_virtual_memory_bytes', '', labels=['label', 'excluded'])
+    metric.add_metric(['foo', 'bar'], 1.0)
+    metric.add_metric(['foo', 'bar'], 2.0)
+    check._validate_metric_tags_cache(config)
+    check.process_metric(metric, config)
+
+    tags_cache = config['_metric_tags_cache']
+    assert len(tags_cache) == 1
+    assert (tags_cache.hits, tags_cache.misses) == (1, 1)
+    for m in aggregator.metrics('prometheus.process.vm.bytes'):
+        assert sorted(m.tags) == ['env:dev', 'mapped:foo']
+
+    # Any change to the tag settings clears the cache on the next scrape
+    check._validate_metric_tags_cache(config)
+    assert len(tags_cache) == 1
+    config['custom_tags'] = ['env:prod']
+    check._validate_metric_tags_cache(config)
+    assert len(tags_cache) == 0
+
+
+def test_metric_tags_cache_disabled(mocked_openmetrics_check_factory):
+    instance = dict(OPENMETRICS_CHECK_INSTANCE)
+    instance['metric_tags_cache_size'] = 0
+    check = mocked_openmetrics_check_factory(instance)
+
+    assert check.get_scraper_config(instance)['_metric_tags_cache'] is None
+
+
+def test_metric_tags_cache_finalizer_override(aggregator):
+    class ValueTagCheck(OpenMetricsBaseCheck):
+        def _finalize_tags_to_submit(self, _tags, metric_name, val, metric, custom_tags=None, hostname=None):
+            _tags.append('value:{}'.format(val))
+            return _tags
+
+    check = ValueTagCheck('prometheus_check', {}, {})
+    config = check.get_scraper_config(PROMETHEUS_CHECK_INSTANCE)
+    config['_dry_run'] = False
+    assert config['_metric_tags_cache'] is None
+
+    metric = GaugeMetricFamily('process_virtual_memory_bytes', '')
+    metric.add_metric([], 1.0)
+    metric.add_metric([], 2.0)
+    check.process_metric(metric, config)
+
+    aggregator.assert_metric('prometheus.process.vm.bytes', value=1.0, tags=['value:1.0'])
+    aggregator.assert_metric('prometheus.process.vm.bytes', value=2.0, tags=['value:2.0'])
+
+
+def test_text_parser_reference(text_data):
+    text_data += '\n'.join(
+        [
+            '# HELP escaped_metric A help\\nwith escaping',
+            '# TYPE escaped_metric gauge',
+            'escaped_metric{path="C:\\\\dir",quote="say \\"hi\\"",empty=""} 1 1395066363000',
+            'escaped_metric{ spaced = "value" , trailing="comma", } 2',
+            'untyped_singleton\t3',
+            '',
+        ]
+    )
+
+    def families(parse):
+        # NaN values never compare equal, replace them before comparing
+        return [
+            (m.name, m.documentation, m.type, [(n, l, 'nan' if math.isnan(v) else v) for n, l, v in m.samples])
+            for m in parse(iter(text_data.split('\n')))
+        ]
+
+    assert families(parser.text_fd_to_metric_families) == families(reference_text_fd_to_metric_families)
+
+
+def test_text_parser_family_filter():
+    text_data = '\n'.join(
+        [
+            '# TYPE kept counter',
+            'kept{a="1"} 1',
+            'kept{a="2"} 2',
+            '# HELP dropped A histogram',
+            '# TYPE dropped histogram',
+            'dropped_bucket{le="+Inf",a="not,parsed"} 3',
+            'dropped_sum{not parsed at all',
+            'dropped_count 3',
+            '# TYPE empty gauge',
+        ]
+    )
+    family_filter = mock.MagicMock(side_effect=lambda name, typ: name != 'dropped')
+    skipped = Counter()
+
+    metrics = list(parser.text_fd_to_metric_families(iter(text_data.split('\n')), family_filter, skipped))
+
+    assert [(m.name, m.type, len(m.samples)) for m in metrics] == [('kept', 'counter', 2), ('empty', 'gauge', 0)]
+    assert skipped == {('dropped', 'histogram'): 3}
+    assert family_filter.call_args_list == [
+        mock.call('kept', 'counter'),
+        mock.call('dropped', 'histogram'),
+        mock.call('empty', 'gauge'),
+    ]
+
+
+def test_skip_unhandled_families(aggregator, mocked_openmetrics_check_factory, text_data):
+    instance = dict(OPENMETRICS_CHECK_INSTANCE)
+    instance['telemetry'] = True
+    instance['ignore_metrics'] = ['go_memstats_mallocs_total']
+    check = mocked_openmetrics_check_factory(instance)
+    check.poll = mock.MagicMock(side_effect=lambda _: MockResponse(text_data, text_content_type))
+    scraper_config = check.get_scraper_config(instance)
+
+    check.check(instance)
+    first_run = {name: sorted(m.value for m in aggregator.metrics(name)) for name in aggregator.metric_names}
+    aggregator.reset()
+
+    # Only families with a cached plan telling them apart are dropped, before parsing their samples
+    with mock.patch.object(parser, '_parse_sample', wraps=parser._parse_sample) as parse_sample:
+        check.check(instance)
+    parsed = {args[1] for args, _ in parse_sample.call_args_list}
+    assert parsed == {'process_virtual_memory_bytes'}
+    assert scraper_config['_metric_plans_transformers'] is None
+
+    # Submissions and telemetry are the same whether families are parsed or not
+    second_run = {name: sorted(m.value for m in aggregator.metrics(name)) for name in aggregator.metric_names}
+    for name in ('metrics.input.count', 'metrics.ignored.count', 'metrics.processed.count'):
+        name = 'openmetrics.telemetry.' + name
+        assert sum(first_run[name]) == sum(second_run[name])
+    aggregator.assert_metric('openmetrics.process.vm.bytes', count=1)
+
+
+@pytest.mark.parametrize('scrape_workers', [0, 2])
+def test_process_endpoints(aggregator, mocked_openmetrics_check_factory, text_data, scrape_workers):
+    instance = dict(OPENMETRICS_CHECK_INSTANCE, telemetry=True, scrape_workers=scrape_workers)
+    check = mocked_openmetrics_check_factory(instance)
+    urls = ['http://fake.endpoint:{}/metrics'.format(port) for port in (10056, 10057, 10058)]
+    configs = [
+        check.get_scraper_config(dict(instance, prometheus_url=url, namespace='endpoint{}'.format(i)))
+        for i, url in enumerate(urls)
+    ]
+    fetching_threads = set()
+
+    def send_request(endpoint, scraper_config, headers=None):
+        fetching_threads.add(threading.current_thread().name)
+        return MockResponse(text_data, text_content_type)
+
+    check.send_request = mock.MagicMock(side_effect=send_request)
+    check.process_metric = mock.MagicMock(wraps=check.process_metric)
+
+    check.process_endpoints([(config, None) for config in configs])
+
+    # Endpoints are processed in order by the calling thread, whatever thread fetched them
+    processed = [args[1]['namespace'] for args, _ in check.process_metric.call_args_list]
+    assert processed == sorted(processed)
+    assert len(processed) == 3 * processed.count('endpoint0')
+    assert (threading.current_thread().name in fetching_threads) is (scrape_workers == 0)
+    for i, url in enumerate(urls):
+        aggregator.assert_metric('endpoint{}.process.vm.bytes'.format(i), count=1)
+        for name in ('fetch', 'process'):
+            telemetry = 'endpoint{}.telemetry.scrape.{}.time'.format(i, name)
+            aggregator.assert_metric_has_tag(telemetry, 'endpoint:{}'.format(url), count=1)
+
+    # Fetches are timed by the worker threads, but recorded by the calling thread
+    phases = check._phase_recorder.phases
+    assert phases['fetch'][0] == 3
+    assert phases['process'][0] == 3
+    assert phases['process'][2] == len(processed)
+
+
+def test_process_endpoints_pool(mocked_openmetrics_check_factory, text_data):
+    instance = dict(OPENMETRICS_CHECK_INSTANCE, scrape_workers=2)
+    check = mocked_openmetrics_check_factory(instance)
+    configs = [
+        check.get_scraper_config(dict(instance, prometheus_url='http://fake.endpoint:{}/metrics'.format(port)))
+        for port in (10056, 10057)
+    ]
+    fetching_threads = set()
+
+    def send_request(endpoint, scraper_config, headers=None):
+        fetching_threads.add(threading.current_thread())
+        return MockResponse(text_data, text_content_type)
+
+    check.send_request = mock.MagicMock(side_effect=send_request)
+
+    # The threads are started once, and kept for the next runs
+    check.process_endpoints([(config, None) for config in configs])
+    pool = check._scrape_pool
+    check.process_endpoints([(config, None) for config in configs])
+
+    assert check._scrape_pool is pool
+    assert check.send_request.call_count == 4
+    assert fetching_threads <= set(pool._workers)
+    assert all(thread.is_alive() and thread.daemon for thread in pool._workers)
+
+    check.cancel()
+    pool.join()
+    assert check._scrape_pool is None
+
+
+def test_process_endpoints_max_in_flight(mocked_openmetrics_check_factory, text_data):
+    instance = dict(OPENMETRICS_CHECK_INSTANCE, scrape_workers=4, scrape_max_in_flight=2)
+    check = mocked_openmetrics_check_factory(instance)
+    configs = [
+        check.get_scraper_config(dict(instance, prometheus_url='http://fake.endpoint:{}/metrics'.format(port)))
+        for port in range(10055, 10061)
+    ]
+    lock = threading.Lock()
+    in_flight = []
+
+    def send_request(endpoint, scraper_config, headers=None):
+        response = MockResponse(text_data, text_content_type)
+        response.close = lambda: in_flight.remove(response)
+        with lock:
+            in_flight.append(response)
+            assert len(in_flight) <= 2
+        return response
+
+    check.send_request = mock.MagicMock(side_effect=send_request)
+
+    check.process_endpoints([(config, None) for config in configs])
+
+    assert check.send_request.call_count == 6
+    assert in_flight == []
+
+
+def test_process_endpoints_error(aggregator, mocked_openmetrics_check_factory, text_data):
+    instance = dict(OPENMETRICS_CHECK_INSTANCE, scrape_workers=2, health_service_check=True)
+    check = mocked_openmetrics_check_factory(instance)
+    urls = ['http://fake.endpoint:{}/metrics'.format(port) for port in (10055, 10056, 10057)]
+    configs = [check.get_scraper_config(dict(instance, prometheus_url=url)) for url in urls]
+    responses = []
+
+    def send_request(endpoint, scraper_config, headers=None):
+        if endpoint == urls[1]:
+            raise requests.ConnectionError('Connection refused')
+        response = MockResponse(text_data, text_content_type)
+        response.close = mock.MagicMock()
+        responses.append(response)
+        return response
+
+    check.send_request = mock.MagicMock(side_effect=send_request)
+
+    with pytest.raises(requests.ConnectionError, match='Connection refused'):
+        check.process_endpoints([(config, None) for config in configs])
+
+    # The error is raised when reaching the failed endpoint, and no response is left open
+    aggregator.assert_service_check('openmetrics.prometheus.health', status=check.OK, tags=['endpoint:' + urls[0]])
+    aggregator.assert_service_check(
+        'openmetrics.prometheus.health', status=check.CRITICAL, tags=['endpoint:' + urls[1]]
+    )
+    aggregator.assert_metric('openmetrics.process.vm.bytes', count=1)
+    for response in responses:
+        response.close.assert_called_once()
+
+
+def test_conditional_scrapes(aggregator, mocked_openmetrics_check_factory, text_data):
+    instance = dict(OPENMETRICS_CHECK_INSTANCE, telemetry=True, conditional_scrapes=True)
+    instance['metrics'] = [{'process_virtual_memory_bytes': 'process.vm.bytes', 'go_memstats_mallocs_total': 'mallocs'}]
+    check = mocked_openmetrics_check_factory(instance)
+    payloads = [text_data, text_data, text_data.replace('5.492736e+07', '5.492737e+07')]
+    check.send_request = mock.MagicMock(side_effect=lambda *args: MockResponse(payloads.pop(0), text_content_type))
+
+    check.check(instance)
+    aggregator.reset()
+
+    # Gauges of an unchanged payload are submitted again without parsing it, counters are not
+    with mock.patch.object(parser, '_parse_sample', wraps=parser._parse_sample) as parse_sample:
+        check.check(instance)
+    assert not parse_sample.called
+    aggregator.assert_metric('openmetrics.process.vm.bytes', value=54927360, count=1)
+    aggregator.assert_metric('openmetrics.mallocs', count=0)
+    aggregator.assert_metric_has_tag('openmetrics.telemetry.scrape.replayed.count', 'reason:unchanged', count=1)
+    aggregator.reset()
+
+    check.check(instance)
+    aggregator.assert_metric('openmetrics.process.vm.bytes', value=54927370, count=1)
+    aggregator.assert_metric('openmetrics.mallocs', count=1)
+    aggregator.assert_metric('openmetrics.telemetry.scrape.replayed.count', count=0)
+
+
+def test_conditional_scrapes_not_modified(aggregator, mocked_openmetrics_check_factory, text_data):
+    instance = dict(OPENMETRICS_CHECK_INSTANCE, telemetry=True, conditional_scrapes=True, health_service_check=True)
+    check = mocked_openmetrics_check_factory(instance)
+    response = MockResponse(text_data, text_content_type)
+    response.headers.update({'ETag': '"v1"', 'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+    responses = [response, MockResponse('', text_content_type, status_code=304)]
+
+    with mock.patch('requests.get', side_effect=responses) as get:
+        check.check(instance)
+        check.check(instance)
+
+    # The validators of the first response are sent with the second request
+    assert 'If-None-Match' not in get.call_args_list[0][1]['headers']
+    headers = get.call_args_list[1][1]['headers']
+    assert headers['If-None-Match'] == '"v1"'
+    assert headers['If-Modified-Since'] == 'Wed, 21 Oct 2015 07:28:00 GMT'
+    aggregator.assert_metric('openmetrics.process.vm.bytes', value=54927360, count=2)
+    aggregator.assert_metric_has_tag('openmetrics.telemetry.scrape.replayed.count', 'reason:not_modified', count=1)
+    # The health service check is sent once per scrape, not replayed
+    aggregator.assert_service_check('openmetrics.prometheus.health', status=check.OK, count=2)
+
+
+def test_label_join_index():
+    index = LabelJoinIndex(
+        {
+            'kube_pod_info': {'label_to_match': 'pod', 'labels_to_get': ['node', 'pod']},
+            'kube_pod_status_phase': {'label_to_match': 'pod', 'labels_to_get': ['phase']},
+        },
+        ttl=2,
+    )
+    index.store('kube_pod_info', {'pod': 'a', 'node': 'n1', 'namespace': 'default'})
+    index.store('kube_pod_status_phase', {'pod': 'a', 'phase': 'Running'})
+    index.store('kube_pod_info', {'pod': 'b', 'node': 'n2'})
+    index.store('kube_pod_info', {'node': 'n3'})
+
+    labels = {'pod': 'a', 'container': 'c'}
+    index.join(labels)
+    assert labels == {'pod': 'a', 'container': 'c', 'node': 'n1', 'phase': 'Running'}
+    assert len(index) == 2
+
+    # Entries not seen during the last `ttl` generations expire
+    index.next_generation()
+    index.join({'pod': 'a'})
+    index.next_generation()
+    assert len(index) == 2
+    index.next_generation()
+    assert index.mappings == {'pod': {'a': {'node': 'n1', 'phase': 'Running'}}}
+    assert index.expirations == 1
+    index.next_generation()
+    assert index.mappings == {'pod': {}}
+    assert (len(index), index.expirations) == (0, 2)
+
+
+def test_label_join_index_max_size():
+    index = LabelJoinIndex({'kube_pod_info': {'label_to_match': 'pod', 'labels_to_get': ['node']}}, max_size=2)
+    index.store('kube_pod_info', {'pod': 'a', 'node': 'n1'})
+    index.store('kube_pod_info', {'pod': 'b', 'node': 'n1'})
+    index.next_generation()
+    index.join({'pod': 'a'})
+
+    # The least recently seen entry makes room for the new one
+    index.store('kube_pod_info', {'pod': 'c', 'node': 'n2'})
+    assert sorted(index.mappings['pod']) == ['a', 'c']
+    assert (len(index), index.evictions) == (2, 1)
+
+    index.store('kube_pod_info', {'pod': 'd', 'node': 'n2'})
+    assert sorted(index.mappings['pod']) == ['c', 'd']
+    assert (len(index), index.evictions) == (2, 2)
+
+
+def test_label_joins_telemetry(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config, mock_get):
+    check = mocked_prometheus_check
+    config = mocked_prometheus_scraper_config
+    config['namespace'] = 'ksm'
+    config['telemetry'] = True
+    config['label_joins_max_size'] = 10
+    config['label_joins'] = {'kube_pod_info': {'label_to_match': 'pod', 'labels_to_get': ['node']}}
+    config['metrics_mapper'] = {'kube_pod_status_ready': 'pod.ready'}
+
+    check.process(config)
+
+    assert len(config['_label_join_index']) == 10
+    aggregator.assert_metric('ksm.telemetry.label_joins.size', value=10, count=1)
+    aggregator.assert_metric('ksm.telemetry.label_joins.evictions.count', value=5, count=1)
+    aggregator.assert_metric('ksm.telemetry.label_joins.expirations.count', value=0, count=1)
@@ -9,9 +9,11 @@ import os
 import mock
 import pytest
 import requests
+from google.protobuf.message import DecodeError
 from six import iteritems, iterkeys
 from six.moves import range
 
+from datadog_checks.base.utils.prometheus.functions import parse_metric_family_stream
 from datadog_checks.checks.prometheus import PrometheusCheck, UnknownFormatError
 from datadog_checks.utils.prometheus import metrics_pb2, parse_metric_family
 
@@ -31,6 +33,10 @@ class MockResponse:
         for elt in self.content.split("\n"):
             yield elt
 
+    def iter_content(self, chunk_size=1, **_):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i : i + chunk_size]
+
     def close(self):
         pass
 
@@ -116,6 +122,42 @@ def test_parse_metric_family():
         assert messages[-1].name == 'process_virtual_memory_bytes'
 
 
+def test_parse_metric_family_filter(bin_data):
+    all_names = [m.name for m in parse_metric_family(bin_data)]
+    family_filter = mock.MagicMock(side_effect=lambda name: not name.startswith('go_'))
+
+    messages = list(parse_metric_family(bin_data, family_filter))
+
+    # The filter sees the name of every family, only the ones it keeps are parsed
+    assert [args[0] for args, _ in family_filter.call_args_list] == all_names
+    assert [m.name for m in messages] == [name for name in all_names if not name.startswith('go_')]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1024, 100000])
+def test_parse_metric_family_stream(bin_data, chunk_size):
+    chunks = MockResponse(bin_data, protobuf_content_type).iter_content(chunk_size=chunk_size)
+    assert list(parse_metric_family_stream(chunks)) == list(parse_metric_family(bin_data))
+
+
+def test_parse_metric_family_stream_truncated(bin_data):
+    with pytest.raises(DecodeError):
+        list(parse_metric_family_stream(iter([bin_data[:-1]])))
+
+
+def test_parse_metric_family_protobuf_ignored(bin_data, mocked_prometheus_check):
+    check = mocked_prometheus_check
+    check.ignore_metrics = ['go_goroutines', 'process_virtual_memory_bytes']
+    check.label_joins = {'process_virtual_memory_bytes': {'label_to_match': 'foo', 'labels_to_get': []}}
+
+    messages = list(check.parse_metric_family(MockResponse(bin_data, protobuf_content_type)))
+
+    # Ignored families are never parsed, unless they are used to join labels
+    names = [m.name for m in messages]
+    assert len(names) == 60
+    assert 'go_goroutines' not in names
+    assert 'process_virtual_memory_bytes' in names
+
+
 def test_check(mocked_prometheus_check):
     """ Should not be implemented as it is the mother class """
     with pytest.raises(NotImplementedError):
@@ -331,7 +373,12 @@ def test_process_metric_filtered(mocked_prometheus_check):
 def test_poll_protobuf(mocked_prometheus_check, bin_data):
     """ Tests poll using the protobuf format """
     check = mocked_prometheus_check
-    mock_response = mock.MagicMock(status_code=200, content=bin_data, headers={'Content-Type': protobuf_content_type})
+    mock_response = mock.MagicMock(
+        status_code=200,
+        content=bin_data,
+        iter_content=lambda **kwargs: iter([bin_data]),
+        headers={'Content-Type': protobuf_content_type},
+    )
     with mock.patch('requests.get', return_value=mock_response, __name__="get"):
         response = check.poll("http://fake.endpoint:10055/metrics")
         messages = list(check.parse_metric_family(response))
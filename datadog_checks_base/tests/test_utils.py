@@ -4,14 +4,17 @@
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
 
+import re
+import threading
+import time
 from decimal import ROUND_HALF_DOWN
 
 import mock
 import pytest
 from six import PY3
 
-from datadog_checks.base.utils.common import ensure_bytes, ensure_unicode, pattern_filter, round_value
-from datadog_checks.base.utils.containers import iter_unique
+from datadog_checks.base.utils.common import PatternFilter, ensure_bytes, ensure_unicode, pattern_filter, round_value
+from datadog_checks.base.utils.containers import LRUCache, iter_unique
 from datadog_checks.base.utils.limiter import Limiter
 
 
@@ -64,6 +67,63 @@ class TestPatternFilter:
             Item('abcdef'),
         ]
 
+    def test_compiled_patterns(self):
+        items = ['abc', 'ABC', 'def']
+        blacklist = [re.compile('abc', re.I)]
+
+        assert pattern_filter(items, blacklist=blacklist) == ['def']
+
+    def test_uncombinable_patterns(self):
+        items = ['aa', 'ab', 'BB', 'cc']
+        whitelist = [r'(a)\1', '(?i)bb']
+
+        assert pattern_filter(items, whitelist=whitelist) == ['aa', 'BB']
+
+    def test_same_group_names(self):
+        items = ['ab', 'cd', 'ef']
+        whitelist = ['(?P<x>a)b', '(?P<x>c)d']
+
+        assert pattern_filter(items, whitelist=whitelist) == ['ab', 'cd']
+
+
+class TestPatternFilterObject:
+    def test_reuse(self):
+        pattern_filter = PatternFilter(whitelist=['abc', 'def'], blacklist=['^abc$'])
+
+        assert pattern_filter.filter(['abc', 'def', 'abcdef', 'ghi']) == ['def', 'abcdef']
+        assert pattern_filter.filter(['ghi', 'def']) == ['def']
+        assert pattern_filter.is_allowed('xdefx') is True
+
+    def test_no_patterns(self):
+        items = ['mock']
+
+        assert PatternFilter().filter(items) is items
+
+    def test_key_called_once(self):
+        items = [Item('abc'), Item('def'), Item('ghi')]
+        key = mock.MagicMock(side_effect=lambda item: item.name)
+        pattern_filter = PatternFilter(whitelist=['abc', 'def'], blacklist=['ghi'], key=key)
+
+        assert pattern_filter.filter(items) == [Item('abc'), Item('def')]
+        assert key.call_count == 3
+
+    def test_decision_cache(self):
+        pattern_filter = PatternFilter(whitelist=['abc'], cache_size=2)
+
+        pattern_filter.filter(['abc', 'def', 'abc', 'ghi', 'abc'])
+
+        cache = pattern_filter._decisions
+        assert len(cache) == 2
+        assert cache.hits == 2
+        assert cache.misses == 3
+        assert cache.evictions == 1
+
+    def test_no_decision_cache(self):
+        pattern_filter = PatternFilter(whitelist=['abc'], cache_size=0)
+
+        assert pattern_filter.filter(['abc', 'def', 'abc']) == ['abc', 'abc']
+        assert pattern_filter._decisions is None
+
 
 class TestLimiter:
     def test_no_uid(self):
@@ -149,6 +209,56 @@ class TestContainers:
 
         assert len(list(iter_unique(custom_queries))) == 1
 
+    def test_lru_cache(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        assert cache.get('a') == 1
+        # `b` is now the least recently used entry
+        cache.set('c', 3)
+
+        assert len(cache) == 2
+        assert 'b' not in cache
+        assert cache.get('b') is None
+        assert cache.get('c') == 3
+        assert (cache.hits, cache.misses, cache.evictions) == (2, 1, 1)
+
+        cache.reset_stats()
+        cache.clear()
+        assert len(cache) == 0
+        assert (cache.hits, cache.misses, cache.evictions) == (0, 0, 0)
+
+    def test_lru_cache_threads(self):
+        cache = LRUCache(8)
+        mark_used = cache._mark_used
+        errors = []
+
+        def slow_mark_used(key):
+            # Let other threads evict the entry being marked
+            time.sleep(0)
+            mark_used(key)
+
+        def use_cache(offset):
+            try:
+                for i in range(2000):
+                    key = (i + offset) % 12
+                    if cache.get(key) is None:
+                        cache.set(key, key)
+            except Exception as e:
+                errors.append(e)
+
+        with mock.patch.object(cache, '_mark_used', slow_mark_used):
+            threads = [threading.Thread(target=use_cache, args=(offset,)) for offset in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert errors == []
+        assert len(cache) == 8
+        assert cache.hits + cache.misses == 10000
+
 
 class TestBytesUnicode:
     @pytest.mark.skipif(PY3, reason="Python 3 does not support explicit bytestring with special characters")
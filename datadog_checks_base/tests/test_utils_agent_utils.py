@@ -4,7 +4,7 @@
 import mock
 
 from datadog_checks.base import stubs
-from datadog_checks.base.utils.agent.utils import should_profile_memory
+from datadog_checks.base.utils.agent.utils import should_profile_cpu, should_profile_memory
 
 
 class TestShouldProfileMemory:
@@ -52,3 +52,17 @@ class TestShouldProfileMemory:
 
         with mock.patch('datadog_checks.base.stubs.datadog_agent.get_config', side_effect=mock_get_config):
             assert should_profile_memory(stubs.datadog_agent, 'test') is False
+
+
+class TestShouldProfileCpu:
+    def test_default(self):
+        with mock.patch('datadog_checks.base.stubs.datadog_agent.get_config', return_value=''):
+            assert should_profile_cpu(stubs.datadog_agent, 'test') is False
+
+    def test_enable(self):
+        with mock.patch('datadog_checks.base.stubs.datadog_agent.get_config', return_value='foo, test'):
+            assert should_profile_cpu(stubs.datadog_agent, 'test') is True
+
+    def test_other_checks(self):
+        with mock.patch('datadog_checks.base.stubs.datadog_agent.get_config', return_value='foo,bar'):
+            assert should_profile_cpu(stubs.datadog_agent, 'test') is False
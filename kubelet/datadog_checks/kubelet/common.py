@@ -1,6 +1,7 @@
 # (C) Datadog, Inc. 2018
 # All rights reserved
 # Licensed under Simplified BSD License (see LICENSE)
+from collections import namedtuple
 
 from datadog_checks.base.utils.tagging import tagger
 
@@ -88,48 +89,144 @@ def replace_container_rt_prefix(cid):
     return cid
 
 
+# Pod of the index of PodListUtils, `containers` is a list of `(container id, name tuple)`
+IndexedPod = namedtuple('IndexedPod', ['version', 'uid', 'name_tuple', 'containers'])
+
+
 class PodListUtils(object):
     """
     Queries the podlist and the agent6's filtering logic to determine whether to
     send metrics for a given container.
-    Results and podlist are cached between calls to avoid the repeated python-go switching
-    cost (filter called once per prometheus metric), hence the PodListUtils object MUST
-    be re-created at every check run.
+
+    The pods are indexed once and the index is kept between check runs: `update` is called
+    with the podlist of every run and only indexes again the pods whose uid, resourceVersion
+    or container IDs changed.
+    Results are cached between calls to avoid the repeated python-go switching cost (filter
+    called once per prometheus metric). The results for the containers still in the podlist
+    are kept between runs, the name and image of a container never change. `reset` and
+    `invalidate_pod` force the pods to be indexed and filtered again.
 
     Containers that are part of a static pod are not filtered, as we cannot curently
     reliably determine their image name to pass to the filtering logic.
     """
 
-    def __init__(self, podlist):
+    def __init__(self, podlist=None):
         self.containers = {}
         self.static_pod_uids = set()
         self.cache = {}
         self.pod_uid_by_name_tuple = {}
         self.container_id_by_name_tuple = {}
+        # Pod uid --> IndexedPod
+        self._pods = {}
+        # Containers whose cached result depends on the podlist rather than on the container itself
+        self._podlist_results = set()
+
+        self.update(podlist)
 
+    def update(self, podlist):
+        """
+        Update the index with a new podlist.
+        Without podlist, the index is emptied.
+        """
         if podlist is None:
+            self.reset()
             return
 
+        for cid in self._podlist_results:
+            self.cache.pop(cid, None)
+        self._podlist_results = set()
+
         pods = podlist.get('items') or []
 
+        seen = set()
         for pod in pods:
             metadata = pod.get("metadata", {})
-            uid = metadata.get("uid")
-            namespace = metadata.get("namespace")
-            pod_name = metadata.get("name")
-            self.pod_uid_by_name_tuple[(namespace, pod_name)] = uid
-
-            # FIXME we are forced to do that because the Kubelet PodList isn't updated
-            # for static pods, see https://github.com/kubernetes/kubernetes/pull/59948
-            if is_static_pending_pod(pod):
-                self.static_pod_uids.add(uid)
-
-            for ctr in pod.get('status', {}).get('containerStatuses', []):
-                cid = ctr.get('containerID')
-                if not cid:
+            # Pods without uid are unexpected, index them by name
+            key = metadata.get("uid") or (metadata.get("namespace"), metadata.get("name"))
+            version = self._pod_version(pod)
+            seen.add(key)
+
+            indexed = self._pods.get(key)
+            if indexed is not None:
+                if version is not None and version == indexed.version:
                     continue
-                self.containers[cid] = ctr
-                self.container_id_by_name_tuple[(namespace, pod_name, ctr.get('name'))] = cid
+                # Keep the results for the containers still there
+                self._remove_pod(key, kept=self._container_ids(pod))
+
+            self._add_pod(key, version, pod)
+
+        for key in set(self._pods) - seen:
+            self._remove_pod(key)
+
+    def reset(self):
+        """
+        Forget all the pods and cached results.
+        """
+        self.containers = {}
+        self.static_pod_uids = set()
+        self.cache = {}
+        self.pod_uid_by_name_tuple = {}
+        self.container_id_by_name_tuple = {}
+        self._pods = {}
+        self._podlist_results = set()
+
+    def invalidate_pod(self, pod_uid):
+        """
+        Forget a pod and the cached results for its containers, the pod is indexed again by the next update.
+        """
+        if pod_uid in self._pods:
+            self._remove_pod(pod_uid)
+
+    @staticmethod
+    def _container_ids(pod):
+        return [ctr.get('containerID') for ctr in pod.get('status', {}).get('containerStatuses', [])]
+
+    @classmethod
+    def _pod_version(cls, pod):
+        resource_version = pod.get("metadata", {}).get("resourceVersion")
+        if resource_version is None:
+            return None
+
+        # The kubelet reports its latest container statuses, they may not have changed the resourceVersion yet
+        return resource_version, tuple(cls._container_ids(pod))
+
+    def _add_pod(self, key, version, pod):
+        metadata = pod.get("metadata", {})
+        uid = metadata.get("uid")
+        namespace = metadata.get("namespace")
+        pod_name = metadata.get("name")
+        name_tuple = (namespace, pod_name)
+        self.pod_uid_by_name_tuple[name_tuple] = uid
+
+        # FIXME we are forced to do that because the Kubelet PodList isn't updated
+        # for static pods, see https://github.com/kubernetes/kubernetes/pull/59948
+        if is_static_pending_pod(pod):
+            self.static_pod_uids.add(uid)
+
+        containers = []
+        for ctr in pod.get('status', {}).get('containerStatuses', []):
+            cid = ctr.get('containerID')
+            if not cid:
+                continue
+            ctr_name_tuple = (namespace, pod_name, ctr.get('name'))
+            self.containers[cid] = ctr
+            self.container_id_by_name_tuple[ctr_name_tuple] = cid
+            containers.append((cid, ctr_name_tuple))
+
+        self._pods[key] = IndexedPod(version, uid, name_tuple, containers)
+
+    def _remove_pod(self, key, kept=()):
+        indexed = self._pods.pop(key)
+        if self.pod_uid_by_name_tuple.get(indexed.name_tuple) == indexed.uid:
+            del self.pod_uid_by_name_tuple[indexed.name_tuple]
+        self.static_pod_uids.discard(indexed.uid)
+
+        for cid, ctr_name_tuple in indexed.containers:
+            self.containers.pop(cid, None)
+            if self.container_id_by_name_tuple.get(ctr_name_tuple) == cid:
+                del self.container_id_by_name_tuple[ctr_name_tuple]
+            if cid not in kept:
+                self.cache.pop(cid, None)
 
     def get_uid_by_name_tuple(self, name_tuple):
         """
@@ -168,23 +265,26 @@ class PodListUtils(object):
             return self.cache[cid]
 
         if pod_uid and pod_uid in self.static_pod_uids:
-            self.cache[cid] = False
-            return False
+            return self._cache_podlist_result(cid, False)
 
         if cid not in self.containers:
             # Filter out metrics not coming from a container (system slices)
-            self.cache[cid] = True
-            return True
+            return self._cache_podlist_result(cid, True)
         ctr = self.containers[cid]
         if not ("name" in ctr and "image" in ctr):
             # Filter out invalid containers
-            self.cache[cid] = True
-            return True
+            return self._cache_podlist_result(cid, True)
 
         excluded = is_excluded(ctr.get("name"), ctr.get("image"))
         self.cache[cid] = excluded
         return excluded
 
+    def _cache_podlist_result(self, cid, excluded):
+        # Results that don't come from the filtering logic are only cached until the next update
+        self.cache[cid] = excluded
+        self._podlist_results.add(cid)
+        return excluded
+
 
 class KubeletCredentials(object):
     """
@@ -3,7 +3,6 @@
 # Licensed under Simplified BSD License (see LICENSE)
 from __future__ import division
 
-import json
 import logging
 import re
 from collections import defaultdict
@@ -23,6 +22,7 @@ from datadog_checks.errors import CheckException
 
 from .cadvisor import CadvisorScraper
 from .common import CADVISOR_DEFAULT_PORT, KubeletCredentials, PodListUtils, replace_container_rt_prefix
+from .podlist import PodListDecoder
 from .prometheus import CadvisorPrometheusScraperMixin
 
 try:
@@ -136,6 +136,9 @@ class KubeletCheck(CadvisorPrometheusScraperMixin, OpenMetricsBaseCheck, Cadviso
 
         self.kubelet_scraper_config = self.get_scraper_config(kubelet_instance)
 
+        # Index of the pod list, kept between runs to only filter the new containers
+        self.pod_list_utils = PodListUtils()
+
     def _create_kubelet_prometheus_instance(self, instance):
         """
         Create a copy of the instance and set default values.
@@ -214,27 +217,31 @@ class KubeletCheck(CadvisorPrometheusScraperMixin, OpenMetricsBaseCheck, Cadviso
             self.log.debug('cAdvisor not found, running in prometheus mode: %s' % str(e))
 
         self.pod_list = self.retrieve_pod_list()
-        self.pod_list_utils = PodListUtils(self.pod_list)
+        self.pod_list_utils.update(self.pod_list)
+        self._reset_cadvisor_contexts()
 
         self._report_node_metrics(self.instance_tags)
         self._report_pods_running(self.pod_list, self.instance_tags)
         self._report_container_spec_metrics(self.pod_list, self.instance_tags)
         self._report_container_state_metrics(self.pod_list, self.instance_tags)
 
+        scrapes = []
         if self.cadvisor_legacy_url:  # Legacy cAdvisor
             self.log.debug('processing legacy cadvisor metrics')
             self.process_cadvisor(instance, self.cadvisor_legacy_url, self.pod_list, self.pod_list_utils)
         elif self.cadvisor_scraper_config['prometheus_url']:  # Prometheus
             self.log.debug('processing cadvisor metrics')
-            self.process(self.cadvisor_scraper_config, metric_transformers=self.CADVISOR_METRIC_TRANSFORMERS)
+            scrapes.append((self.cadvisor_scraper_config, self.CADVISOR_METRIC_TRANSFORMERS))
 
         if self.kubelet_scraper_config['prometheus_url']:  # Prometheus
             self.log.debug('processing kubelet metrics')
-            self.process(self.kubelet_scraper_config)
+            scrapes.append((self.kubelet_scraper_config, None))
+
+        self.process_endpoints(scrapes)
 
         # Free up memory
         self.pod_list = None
-        self.pod_list_utils = None
+        self._reset_cadvisor_contexts()
 
     def perform_kubelet_query(self, url, verbose=True, timeout=10, stream=False):
         """
@@ -254,15 +261,13 @@ class KubeletCheck(CadvisorPrometheusScraperMixin, OpenMetricsBaseCheck, Cadviso
         try:
             cutoff_date = self._compute_pod_expiration_datetime()
             with self.perform_kubelet_query(self.pod_list_url, stream=True) as r:
+                # Decode the pods one at a time and only keep the fields the check uses
                 if cutoff_date:
                     f = ExpiredPodFilter(cutoff_date)
-                    pod_list = json.load(r.raw, object_hook=f.json_hook)
+                    pod_list = PodListDecoder(r.raw, pod_hook=f.json_hook).decode()
                     pod_list['expired_count'] = f.expired_count
-                    if pod_list.get("items") is not None:
-                        # Filter out None items from the list
-                        pod_list['items'] = [p for p in pod_list['items'] if p is not None]
                 else:
-                    pod_list = json.load(r.raw)
+                    pod_list = PodListDecoder(r.raw).decode()
 
             if pod_list.get("items") is None:
                 # Sanitize input: if no pod are running, 'items' is a NoneObject
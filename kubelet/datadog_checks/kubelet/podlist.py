@@ -0,0 +1,178 @@
+# (C) Datadog, Inc. 2020
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import codecs
+import json
+import re
+
+from six import iteritems
+
+# Fields of the pods used by the check, other fields are dropped when decoding the pod list.
+# `True` keeps the whole value of a field, fields of lists of objects apply to every object.
+POD_FIELDS = {
+    'metadata': {
+        'name': True,
+        'namespace': True,
+        'uid': True,
+        # Used to detect the pods that changed since the previous run
+        'resourceVersion': True,
+        # Used to detect static pods
+        'annotations': {'kubernetes.io/config.source': True},
+    },
+    'spec': {'hostNetwork': True, 'containers': {'name': True, 'resources': True}},
+    'status': {
+        'phase': True,
+        'containerStatuses': {
+            'name': True,
+            'containerID': True,
+            'image': True,
+            'state': True,
+            'lastState': True,
+            'restartCount': True,
+        },
+    },
+}
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def project(value, fields):
+    """
+    Return a copy of a decoded JSON value with only the given fields, see `POD_FIELDS`.
+    """
+    if fields is True:
+        return value
+
+    if isinstance(value, list):
+        return [project(item, fields) for item in value]
+
+    if not isinstance(value, dict):
+        return value
+
+    return {name: project(value[name], subfields) for name, subfields in iteritems(fields) if name in value}
+
+
+class PodListDecoder(object):
+    """
+    Decodes the pod list sent by the kubelet from a stream, one pod at a time.
+
+    Only the fields of the pods listed in `fields` are kept, so the size of the decoded pod list doesn't
+    depend on the size of the pod specs (environment, volumes, managed fields...) and a single full pod
+    is decoded at a time. The optional `pod_hook` is called with every full pod, before it is projected,
+    and returns the pod to keep or None to drop it, like `ExpiredPodFilter.json_hook`.
+    """
+
+    # Pod specs are often tens of KiB, read several of them at once
+    CHUNK_SIZE = 256 * 1024
+
+    def __init__(self, stream, pod_hook=None, fields=POD_FIELDS):
+        self._stream = stream
+        self._pod_hook = pod_hook
+        self._fields = fields
+        self._json_decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = u''
+        self._pos = 0
+        self._eof = False
+
+    def decode(self):
+        """
+        Return the pod list, its `items` are the pods kept.
+        Raises a ValueError if the stream isn't a JSON object.
+        """
+        pod_list = {}
+        self._expect(u'{')
+        if self._peek() == u'}':
+            return pod_list
+
+        while True:
+            key = self._value()
+            self._expect(u':')
+            if key == 'items' and self._peek() == u'[':
+                pod_list[key] = self._items()
+            else:
+                pod_list[key] = self._value()
+
+            if not self._more(u'}'):
+                return pod_list
+
+    def _items(self):
+        items = []
+        self._expect(u'[')
+        if self._peek() == u']':
+            self._pos += 1
+            return items
+
+        while True:
+            pod = self._value()
+            if pod is not None and self._pod_hook is not None:
+                pod = self._pod_hook(pod)
+            if pod is not None:
+                items.append(project(pod, self._fields))
+
+            if not self._more(u']'):
+                return items
+
+    def _value(self):
+        self._skip_whitespace()
+        read_size = self.CHUNK_SIZE
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                # The value may not be fully read yet
+                if self._eof:
+                    raise
+            else:
+                # Unless the stream is over, a value ending with the buffer may be a truncated number
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+
+            # Large values are decoded again with twice as much data, to avoid decoding them too many times
+            self._read(read_size)
+            read_size = len(self._buffer) - self._pos
+
+    def _read(self, size):
+        chunk = self._stream.read(size)
+        if not chunk:
+            self._eof = True
+        if isinstance(chunk, bytes):
+            chunk = self._text_decoder.decode(chunk, final=self._eof)
+
+        # Drop what was decoded already
+        self._buffer = self._buffer[self._pos :] + chunk
+        self._pos = 0
+
+    def _skip_whitespace(self):
+        while True:
+            self._pos = WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer) or self._eof:
+                return
+            self._read(self.CHUNK_SIZE)
+
+    def _peek(self):
+        self._skip_whitespace()
+        return self._buffer[self._pos : self._pos + 1]
+
+    def _next_char(self):
+        char = self._peek()
+        self._pos += 1
+        return char
+
+    def _expect(self, char):
+        found = self._next_char()
+        if found != char:
+            self._unexpected(repr(char), found)
+
+    def _more(self, closing):
+        """Read the separator following a member or an element, return whether another one follows."""
+        found = self._next_char()
+        if found == closing:
+            return False
+        if found != u',':
+            self._unexpected(u"',' or '{}'".format(closing), found)
+        return True
+
+    def _unexpected(self, expected, found):
+        raise ValueError('Expecting {} in the pod list, found {!r}'.format(expected, found or 'EOF'))
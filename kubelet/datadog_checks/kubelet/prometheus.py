@@ -3,14 +3,14 @@
 # Licensed under Simplified BSD License (see LICENSE)
 from __future__ import division
 
+from collections import namedtuple
 from copy import deepcopy
 
-from six import iteritems
+from six import iteritems, itervalues
 
 from datadog_checks.base.utils.tagging import tagger
-from datadog_checks.checks.openmetrics import OpenMetricsBaseCheck
 
-from .common import get_pod_by_uid, is_static_pending_pod, replace_container_rt_prefix
+from .common import is_static_pending_pod, replace_container_rt_prefix
 
 METRIC_TYPES = ['counter', 'gauge', 'summary']
 
@@ -18,6 +18,13 @@ METRIC_TYPES = ['counter', 'gauge', 'summary']
 PRE_1_16_CONTAINER_LABELS = set(['namespace', 'name', 'image', 'id', 'container_name', 'pod_name'])
 POST_1_16_CONTAINER_LABELS = set(['namespace', 'name', 'image', 'id', 'container', 'pod'])
 
+# What the series of a container resolve to during a check run, see `_get_container_context`.
+# `tags` is None if the container is excluded or has no tags, `static_tags` is None unless the container
+# is in a static pod with tags.
+ContainerContext = namedtuple('ContainerContext', ['entity_id', 'pod_uid', 'static', 'tags', 'static_tags'])
+# What the series of a pod resolve to during a check run, see `_get_pod_context`
+PodContext = namedtuple('PodContext', ['pod_uid', 'host_networked', 'tags'])
+
 
 class CadvisorPrometheusScraperMixin(object):
     """
@@ -34,6 +41,11 @@ class CadvisorPrometheusScraperMixin(object):
         self.mem_usage_bytes = {}
         self.swap_usage_bytes = {}
 
+        # Contexts resolved once per check run, for all the metric families, see `_reset_cadvisor_contexts`
+        self._container_contexts = {}
+        self._pod_contexts = {}
+        self._pods_by_uid = None
+
         self.CADVISOR_METRIC_TRANSFORMERS = {
             'container_cpu_usage_seconds_total': self.container_cpu_usage_seconds_total,
             'container_cpu_load_average_10s': self.container_cpu_load_average_10s,
@@ -176,22 +188,6 @@ class CadvisorPrometheusScraperMixin(object):
             container_name = CadvisorPrometheusScraperMixin._get_container_label(labels, "container_name")
         return self.pod_list_utils.get_cid_by_name_tuple((namespace, pod_name, container_name))
 
-    def _get_entity_id_if_container_metric(self, labels):
-        """
-        Checks the labels indicate a container metric,
-        then extract the container id from them.
-
-        :param labels
-        :return str or None
-        """
-        if CadvisorPrometheusScraperMixin._is_container_metric(labels):
-            pod = self._get_pod_by_metric_label(labels)
-            if pod is not None and is_static_pending_pod(pod):
-                # If the pod is static, ContainerStatus is unavailable.
-                # Return the pod UID so that we can collect metrics from it later on.
-                return self._get_pod_uid(labels)
-            return self._get_container_id(labels)
-
     def _get_pod_uid(self, labels):
         """
         Return the id of a pod
@@ -205,16 +201,6 @@ class CadvisorPrometheusScraperMixin(object):
             pod_name = CadvisorPrometheusScraperMixin._get_container_label(labels, "pod_name")
         return self.pod_list_utils.get_uid_by_name_tuple((namespace, pod_name))
 
-    def _get_pod_uid_if_pod_metric(self, labels):
-        """
-        Checks the labels indicate a pod metric,
-        then extract the pod uid from them.
-        :param labels
-        :return str or None
-        """
-        if CadvisorPrometheusScraperMixin._is_pod_metric(labels):
-            return self._get_pod_uid(labels)
-
     def _is_pod_host_networked(self, pod_uid):
         """
         Return if the pod is on host Network
@@ -222,10 +208,10 @@ class CadvisorPrometheusScraperMixin(object):
         :param pod_uid: str
         :return: bool
         """
-        for pod in self.pod_list['items']:
-            if pod.get('metadata', {}).get('uid', '') == pod_uid:
-                return pod.get('spec', {}).get('hostNetwork', False)
-        return False
+        pod = self._get_pod_by_uid(pod_uid)
+        if pod is None:
+            return False
+        return pod.get('spec', {}).get('hostNetwork', False)
 
     def _get_pod_by_metric_label(self, labels):
         """
@@ -233,7 +219,91 @@ class CadvisorPrometheusScraperMixin(object):
         :return:
         """
         pod_uid = self._get_pod_uid(labels)
-        return get_pod_by_uid(pod_uid, self.pod_list)
+        return self._get_pod_by_uid(pod_uid)
+
+    def _get_pod_by_uid(self, pod_uid):
+        """
+        Return the pod with the given uid from the pod list of the run, or None
+        """
+        if self._pods_by_uid is None:
+            self._pods_by_uid = {}
+            for pod in (self.pod_list or {}).get('items') or []:
+                self._pods_by_uid.setdefault(pod.get('metadata', {}).get('uid'), pod)
+        return self._pods_by_uid.get(pod_uid)
+
+    def _reset_cadvisor_contexts(self):
+        """
+        Forget the contexts resolved during the previous run, the pod list and the tags may have changed.
+        """
+        self._container_contexts = {}
+        self._pod_contexts = {}
+        self._pods_by_uid = None
+
+    def _get_container_context(self, labels, scraper_config):
+        """
+        Return the ContainerContext of a container-scoped series, resolved once per run for all the metric
+        families: the container id, or the pod uid for static pods, whether the container is excluded and
+        its tags.
+        :param labels: labels of a series for which `_is_container_metric` is true
+        :return: ContainerContext
+        """
+        namespace = self._get_container_label(labels, "namespace")
+        pod_name = self._get_container_label(labels, "pod") or self._get_container_label(labels, "pod_name")
+        container_name = self._get_container_label(labels, "container") or self._get_container_label(
+            labels, "container_name"
+        )
+        key = (namespace, pod_name, container_name)
+        context = self._container_contexts.get(key)
+        if context is None:
+            context = self._resolve_container_context(labels, scraper_config)
+            self._container_contexts[key] = context
+        return context
+
+    def _resolve_container_context(self, labels, scraper_config):
+        pod_uid = self._get_pod_uid(labels)
+        pod = self._get_pod_by_uid(pod_uid)
+        # If the pod is static, ContainerStatus is unavailable, use the pod UID instead.
+        static = pod is not None and is_static_pending_pod(pod)
+        entity_id = pod_uid if static else self._get_container_id(labels)
+        if not entity_id or self.pod_list_utils.is_excluded(entity_id, pod_uid):
+            return ContainerContext(entity_id, pod_uid, static, None, None)
+
+        tags = tagger.tag(replace_container_rt_prefix(entity_id), tagger.HIGH)
+        if not tags:
+            return ContainerContext(entity_id, pod_uid, static, None, None)
+        tags = tags + scraper_config['custom_tags']
+
+        static_tags = None
+        if static:
+            # FIXME we are forced to do that because the Kubelet PodList isn't updated
+            # for static pods, see https://github.com/kubernetes/kubernetes/pull/59948
+            pod_tags = tagger.tag('kubernetes_pod_uid://%s' % pod["metadata"]["uid"], tagger.HIGH)
+            if pod_tags:
+                static_tags = list(set(tags + pod_tags + self._get_kube_container_name(labels)))
+
+        return ContainerContext(entity_id, pod_uid, static, tags, static_tags)
+
+    def _get_pod_context(self, labels, scraper_config):
+        """
+        Return the PodContext of a pod-scoped series, resolved once per run for all the metric families.
+        :param labels: labels of a series for which `_is_pod_metric` is true
+        :return: PodContext
+        """
+        namespace = self._get_container_label(labels, "namespace")
+        pod_name = self._get_container_label(labels, "pod") or self._get_container_label(labels, "pod_name")
+        key = (namespace, pod_name)
+        context = self._pod_contexts.get(key)
+        if context is None:
+            pod_uid = self._get_pod_uid(labels)
+            tags = None
+            host_networked = False
+            if pod_uid:
+                host_networked = self._is_pod_host_networked(pod_uid)
+                tags = tagger.tag('kubernetes_pod_uid://%s' % pod_uid, tagger.HIGH)
+                tags = tags + scraper_config['custom_tags'] if tags else None
+            context = PodContext(pod_uid, host_networked, tags)
+            self._pod_contexts[key] = context
+        return context
 
     @staticmethod
     def _get_kube_container_name(labels):
@@ -254,37 +324,68 @@ class CadvisorPrometheusScraperMixin(object):
             return ["kube_container_name:%s" % container_name]
         return []
 
-    @staticmethod
-    def _sum_values_by_context(metric, uid_from_labels):
+    def _sum_values_by_container(self, metric, scraper_config, factor=None):
+        """
+        Sums the values of the samples of a metric family by container, in a single pass.
+        Containers that are excluded or without tags are skipped.
+        :param metric: prometheus metric family
+        :param factor: optional factor applied to the values
+        :return: dict with the container ids as keys, and `[sum of the values, labels of the first sample,
+                 ContainerContext]` as values
+        """
+        totals = {}
+        for sample in metric.samples:
+            labels = sample[self.SAMPLE_LABELS]
+            if not self._is_container_metric(labels):
+                continue
+            context = self._get_container_context(labels, scraper_config)
+            if context.tags is None:
+                continue
+
+            value = sample[self.SAMPLE_VALUE]
+            if factor is not None:
+                value *= factor
+            total = totals.get(context.entity_id)
+            if total is None:
+                totals[context.entity_id] = [value, labels, context]
+            else:
+                total[0] += value
+        return totals
+
+    def _sum_values_by_pod(self, metric, scraper_config):
         """
-        Iterates over all metrics in a metric and sums the values
-        matching the same uid. Modifies the metric family in place.
+        Sums the values of the samples of a metric family by pod, in a single pass.
+        Pods without tags are skipped.
         :param metric: prometheus metric family
-        :param uid_from_labels: function mapping a metric.label to a unique context id
-        :return: dict with uid as keys, metric object references as values
+        :return: dict with the pod uids as keys, and `[sum of the values, labels of the first sample, PodContext]`
+                 as values
         """
-        seen = {}
+        totals = {}
         for sample in metric.samples:
-            uid = uid_from_labels(sample[OpenMetricsBaseCheck.SAMPLE_LABELS])
-            if not uid:
-                # TODO
-                # metric.Clear()  # Ignore this metric message
+            labels = sample[self.SAMPLE_LABELS]
+            if not self._is_pod_metric(labels):
                 continue
-            # Sum the counter value accross all contexts
-            if uid not in seen:
-                seen[uid] = sample
+            context = self._get_pod_context(labels, scraper_config)
+            if context.tags is None:
+                continue
+
+            total = totals.get(context.pod_uid)
+            if total is None:
+                totals[context.pod_uid] = [sample[self.SAMPLE_VALUE], labels, context]
             else:
-                # We have to create a new tuple
-                seen[uid] = (
-                    seen[uid][OpenMetricsBaseCheck.SAMPLE_NAME],
-                    seen[uid][OpenMetricsBaseCheck.SAMPLE_LABELS],
-                    seen[uid][OpenMetricsBaseCheck.SAMPLE_VALUE] + sample[OpenMetricsBaseCheck.SAMPLE_VALUE],
-                )
-                # TODO
-                # metric.Clear()  # Ignore this metric message
-        return seen
-
-    def _process_container_metric(self, type, metric_name, metric, scraper_config, labels=None):
+                total[0] += sample[self.SAMPLE_VALUE]
+        return totals
+
+    @staticmethod
+    def _get_label_tags(sample_labels, labels):
+        tags = []
+        for label in labels:
+            value = sample_labels.get(label)
+            if value:
+                tags.append('%s:%s' % (label, value))
+        return tags
+
+    def _process_container_metric(self, type, metric_name, metric, scraper_config, labels=None, factor=None):
         """
         Takes a simple metric about a container, reports it as a rate or gauge.
         If several series are found for a given container, values are summed before submission.
@@ -296,34 +397,12 @@ class CadvisorPrometheusScraperMixin(object):
             self.log.error("Metric type %s unsupported for metric %s" % (metric.type, metric.name))
             return
 
-        samples = self._sum_values_by_context(metric, self._get_entity_id_if_container_metric)
-        for c_id, sample in iteritems(samples):
-            pod_uid = self._get_pod_uid(sample[self.SAMPLE_LABELS])
-            if self.pod_list_utils.is_excluded(c_id, pod_uid):
-                continue
-
-            tags = tagger.tag(replace_container_rt_prefix(c_id), tagger.HIGH)
-            if not tags:
+        totals = self._sum_values_by_container(metric, scraper_config, factor)
+        for val, sample_labels, context in itervalues(totals):
+            tags = context.static_tags if context.static else context.tags
+            if tags is None:
                 continue
-            tags += scraper_config['custom_tags']
-
-            # FIXME we are forced to do that because the Kubelet PodList isn't updated
-            # for static pods, see https://github.com/kubernetes/kubernetes/pull/59948
-            pod = self._get_pod_by_metric_label(sample[self.SAMPLE_LABELS])
-            if pod is not None and is_static_pending_pod(pod):
-                pod_tags = tagger.tag('kubernetes_pod_uid://%s' % pod["metadata"]["uid"], tagger.HIGH)
-                if not pod_tags:
-                    continue
-                tags += pod_tags
-                tags += self._get_kube_container_name(sample[self.SAMPLE_LABELS])
-                tags = list(set(tags))
-
-            for label in labels:
-                value = sample[self.SAMPLE_LABELS].get(label)
-                if value:
-                    tags.append('%s:%s' % (label, value))
-
-            val = sample[self.SAMPLE_VALUE]
+            tags = tags + self._get_label_tags(sample_labels, labels)
 
             if "rate" == type:
                 self.rate(metric_name, val, tags)
@@ -342,19 +421,12 @@ class CadvisorPrometheusScraperMixin(object):
             self.log.error("Metric type %s unsupported for metric %s" % (metric.type, metric.name))
             return
 
-        samples = self._sum_values_by_context(metric, self._get_pod_uid_if_pod_metric)
-        for pod_uid, sample in iteritems(samples):
-            if '.network.' in metric_name and self._is_pod_host_networked(pod_uid):
-                continue
-            tags = tagger.tag('kubernetes_pod_uid://%s' % pod_uid, tagger.HIGH)
-            if not tags:
+        is_network_metric = '.network.' in metric_name
+        totals = self._sum_values_by_pod(metric, scraper_config)
+        for val, sample_labels, context in itervalues(totals):
+            if is_network_metric and context.host_networked:
                 continue
-            tags += scraper_config['custom_tags']
-            for label in labels:
-                value = sample[self.SAMPLE_LABELS].get(label)
-                if value:
-                    tags.append('%s:%s' % (label, value))
-            val = sample[self.SAMPLE_VALUE]
+            tags = context.tags + self._get_label_tags(sample_labels, labels)
             self.rate(metric_name, val, tags)
 
     def _process_usage_metric(self, m_name, metric, cache, scraper_config, labels=None):
@@ -369,37 +441,17 @@ class CadvisorPrometheusScraperMixin(object):
         # track containers that still exist in the cache
         seen_keys = {k: False for k in cache}
 
-        samples = self._sum_values_by_context(metric, self._get_entity_id_if_container_metric)
-        for c_id, sample in iteritems(samples):
-            c_name = self._get_container_label(sample[self.SAMPLE_LABELS], 'name')
+        totals = self._sum_values_by_container(metric, scraper_config)
+        for val, sample_labels, context in itervalues(totals):
+            c_name = self._get_container_label(sample_labels, 'name')
             if not c_name:
                 continue
-            pod_uid = self._get_pod_uid(sample[self.SAMPLE_LABELS])
-            if self.pod_list_utils.is_excluded(c_id, pod_uid):
-                continue
 
-            tags = tagger.tag(replace_container_rt_prefix(c_id), tagger.HIGH)
-            if not tags:
+            tags = context.static_tags if context.static else context.tags
+            if tags is None:
                 continue
-            tags += scraper_config['custom_tags']
-
-            # FIXME we are forced to do that because the Kubelet PodList isn't updated
-            # for static pods, see https://github.com/kubernetes/kubernetes/pull/59948
-            pod = self._get_pod_by_metric_label(sample[self.SAMPLE_LABELS])
-            if pod is not None and is_static_pending_pod(pod):
-                pod_tags = tagger.tag('kubernetes_pod_uid://%s' % pod["metadata"]["uid"], tagger.HIGH)
-                if not pod_tags:
-                    continue
-                tags += pod_tags
-                tags += self._get_kube_container_name(sample[self.SAMPLE_LABELS])
-                tags = list(set(tags))
-
-            for label in labels:
-                value = sample[self.SAMPLE_LABELS].get(label)
-                if value:
-                    tags.append('%s:%s' % (label, value))
+            tags = tags + self._get_label_tags(sample_labels, labels)
 
-            val = sample[self.SAMPLE_VALUE]
             cache[c_name] = (val, tags)
             seen_keys[c_name] = True
             self.gauge(m_name, val, tags)
@@ -415,23 +467,13 @@ class CadvisorPrometheusScraperMixin(object):
         and optionally checks in the given cache if there's a usage
         for each sample in the metric and reports the usage_pct
         """
-        samples = self._sum_values_by_context(metric, self._get_entity_id_if_container_metric)
-        for c_id, sample in iteritems(samples):
-            limit = sample[self.SAMPLE_VALUE]
-            pod_uid = self._get_pod_uid(sample[self.SAMPLE_LABELS])
-            if self.pod_list_utils.is_excluded(c_id, pod_uid):
-                continue
-
-            tags = tagger.tag(replace_container_rt_prefix(c_id), tagger.HIGH)
-            if not tags:
-                continue
-            tags += scraper_config['custom_tags']
-
+        totals = self._sum_values_by_container(metric, scraper_config)
+        for limit, sample_labels, context in itervalues(totals):
             if m_name:
-                self.gauge(m_name, limit, tags)
+                self.gauge(m_name, limit, list(context.tags))
 
             if pct_m_name and limit > 0:
-                c_name = self._get_container_label(sample[self.SAMPLE_LABELS], 'name')
+                c_name = self._get_container_label(sample_labels, 'name')
                 if not c_name:
                     continue
                 usage, tags = cache.get(c_name, (None, None))
@@ -445,15 +487,8 @@ class CadvisorPrometheusScraperMixin(object):
 
     def container_cpu_usage_seconds_total(self, metric, scraper_config):
         metric_name = scraper_config['namespace'] + '.cpu.usage.total'
-
-        for i, sample in enumerate(metric.samples):
-            # Replacing the sample tuple to convert cores in nano cores
-            metric.samples[i] = (
-                sample[self.SAMPLE_NAME],
-                sample[self.SAMPLE_LABELS],
-                sample[self.SAMPLE_VALUE] * 10.0 ** 9,
-            )
-        self._process_container_metric('rate', metric_name, metric, scraper_config)
+        # Convert cores in nano cores
+        self._process_container_metric('rate', metric_name, metric, scraper_config, factor=10.0 ** 9)
 
     def container_cpu_load_average_10s(self, metric, scraper_config):
         metric_name = scraper_config['namespace'] + '.cpu.load.10s.avg'
@@ -0,0 +1,184 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+import io
+import json
+import os
+import sys
+
+import mock
+import pytest
+
+from datadog_checks.base.stubs import tagger
+from datadog_checks.base.utils.date import parse_rfc3339
+from datadog_checks.kubelet import KubeletCheck, PodListUtils
+from datadog_checks.kubelet.kubelet import ExpiredPodFilter
+from datadog_checks.kubelet.podlist import PodListDecoder
+
+from .test_kubelet import COMMON_TAGS
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Skip the whole tests module on Windows
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='tests for linux only')
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+
+def mock_response(fname):
+    with open(os.path.join(HERE, 'fixtures', fname)) as f:
+        content = f.read()
+
+    attrs = {'close.return_value': True, 'iter_lines.return_value': content.split('\n'), 'content': content}
+    return mock.Mock(headers={'Content-Type': 'text/plain'}, **attrs)
+
+
+@pytest.mark.parametrize('metric_tags_cache_size', [0, 10000], ids=['no_tags_cache', 'tags_cache'])
+def test_kubelet_metrics(benchmark, metric_tags_cache_size):
+    check = KubeletCheck('kubelet', None, {}, [{'metric_tags_cache_size': metric_tags_cache_size}])
+    check.poll = mock.Mock(return_value=mock_response('kubelet_metrics.txt'))
+    scraper_config = check.kubelet_scraper_config
+
+    # Run once to get the dry run and cache warm up out of the way.
+    check.process(scraper_config)
+
+    benchmark(check.process, scraper_config)
+
+
+def cadvisor_check(fixture):
+    tagger.reset()
+    tagger.set_tags(COMMON_TAGS)
+    check = KubeletCheck('kubelet', None, {}, [{}])
+    check.poll = mock.Mock(return_value=mock_response(fixture))
+    with open(os.path.join(HERE, 'fixtures', 'pods.json')) as f:
+        check.pod_list = json.load(f)
+    check.pod_list_utils = PodListUtils(check.pod_list)
+    return check
+
+
+CADVISOR_FIXTURES = pytest.mark.parametrize(
+    'fixture',
+    ['cadvisor_metrics_pre_1_16.txt', 'cadvisor_metrics_post_1_16.txt'],
+    ids=['cadvisor_pre_1_16', 'cadvisor_post_1_16'],
+)
+
+
+@CADVISOR_FIXTURES
+def test_cadvisor_metrics(benchmark, fixture):
+    check = cadvisor_check(fixture)
+    scraper_config = check.cadvisor_scraper_config
+
+    def process():
+        # Contexts are resolved on every run
+        check._reset_cadvisor_contexts()
+        check.process(scraper_config, metric_transformers=check.CADVISOR_METRIC_TRANSFORMERS)
+
+    # Run once to get the dry run and cache warm up out of the way.
+    process()
+
+    benchmark(process)
+
+
+@CADVISOR_FIXTURES
+def test_cadvisor_metric_transformers(benchmark, fixture):
+    check = cadvisor_check(fixture)
+    scraper_config = check.cadvisor_scraper_config
+    # Only the processing of the metrics, without the parsing
+    metrics = list(check.scrape_metrics(scraper_config))
+
+    def process_metrics():
+        check._reset_cadvisor_contexts()
+        for metric in metrics:
+            check.process_metric(metric, scraper_config, metric_transformers=check.CADVISOR_METRIC_TRANSFORMERS)
+
+    process_metrics()
+
+    benchmark(process_metrics)
+
+
+def large_pod_list(pods=300):
+    """Pod list with pod specs as large as the ones of real deployments."""
+    items = []
+    for i in range(pods):
+        name = 'app-{}'.format(i)
+        containers = [
+            {
+                'name': 'container-{}'.format(c),
+                'image': 'registry/app:1.0',
+                'env': [{'name': 'VARIABLE_{}'.format(e), 'value': 'value-{}'.format(e) * 4} for e in range(40)],
+                'volumeMounts': [{'name': 'volume-{}'.format(v), 'mountPath': '/mnt/{}'.format(v)} for v in range(10)],
+                'resources': {'requests': {'cpu': '100m', 'memory': '200Mi'}, 'limits': {'memory': '300Mi'}},
+            }
+            for c in range(3)
+        ]
+        items.append(
+            {
+                'metadata': {
+                    'name': name,
+                    'namespace': 'default',
+                    'uid': 'uid-{}'.format(i),
+                    'labels': {'app': name, 'team': 'team-{}'.format(i % 10)},
+                    'annotations': {
+                        'kubernetes.io/config.source': 'api',
+                        'kubectl.kubernetes.io/last-applied-configuration': json.dumps({'spec': containers}),
+                    },
+                    'managedFields': [{'manager': 'kubectl', 'fieldsV1': {'f:spec': containers}}],
+                },
+                'spec': {
+                    'containers': containers,
+                    'volumes': [{'name': 'volume-{}'.format(v), 'emptyDir': {}} for v in range(10)],
+                },
+                'status': {
+                    'phase': 'Succeeded' if i % 3 == 0 else 'Running',
+                    'containerStatuses': [
+                        {
+                            'name': 'container-{}'.format(c),
+                            'containerID': 'docker://{}-{}'.format(i, c),
+                            'image': 'registry/app:1.0',
+                            'restartCount': 0,
+                            'state': (
+                                {'terminated': {'finishedAt': '2019-02-18T15:00:00Z'}}
+                                if i % 3 == 0
+                                else {'running': {'startedAt': '2019-02-18T15:00:00Z'}}
+                            ),
+                        }
+                        for c in range(3)
+                    ],
+                },
+            }
+        )
+
+    return json.dumps({'kind': 'PodList', 'apiVersion': 'v1', 'metadata': {}, 'items': items}).encode('utf-8')
+
+
+def json_load(raw, pod_hook):
+    # Decoding of the pod list before it was streamed
+    pod_list = json.load(raw, object_hook=pod_hook)
+    pod_list['items'] = [p for p in pod_list['items'] if p is not None]
+    return pod_list
+
+
+def streaming(raw, pod_hook):
+    return PodListDecoder(raw, pod_hook=pod_hook).decode()
+
+
+@pytest.mark.parametrize('decode', [json_load, streaming], ids=['json_load', 'streaming'])
+def test_pod_list_decoding(benchmark, decode):
+    content = large_pod_list()
+    cutoff_date = parse_rfc3339('2019-02-18T16:00:00Z')
+
+    def run():
+        return decode(io.BytesIO(content), ExpiredPodFilter(cutoff_date).json_hook)
+
+    if tracemalloc is not None:
+        # Memory used to decode the pod list and keep it
+        tracemalloc.start()
+        pod_list = run()
+        benchmark.extra_info['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert len(pod_list['items']) == 200
+
+    benchmark(run)
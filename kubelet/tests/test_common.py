@@ -89,6 +89,102 @@ def test_filter_staticpods(monkeypatch):
     )
 
 
+def make_pod(uid, resource_version, *containers):
+    return {
+        'metadata': {'uid': uid, 'name': 'pod-' + uid, 'namespace': 'default', 'resourceVersion': resource_version},
+        'status': {
+            'phase': 'Running',
+            'containerStatuses': [
+                {'name': name, 'image': 'image-' + name, 'containerID': 'docker://' + name} for name in containers
+            ],
+        },
+    }
+
+
+def test_pod_list_utils_update(monkeypatch):
+    is_excluded = mock.Mock(return_value=False)
+    monkeypatch.setattr('datadog_checks.kubelet.common.is_excluded', is_excluded)
+
+    pod_list_utils = PodListUtils({'items': [make_pod('a', '1', 'a1', 'a2'), make_pod('b', '1', 'b1')]})
+    for cid in ('docker://a1', 'docker://a2', 'docker://b1'):
+        assert pod_list_utils.is_excluded(cid) is False
+    assert is_excluded.call_count == 3
+
+    # Unchanged pods keep the results of their containers
+    is_excluded.reset_mock()
+    pod_list_utils.update({'items': [make_pod('a', '1', 'a1', 'a2'), make_pod('b', '1', 'b1')]})
+    for cid in ('docker://a1', 'docker://a2', 'docker://b1'):
+        assert pod_list_utils.is_excluded(cid) is False
+    is_excluded.assert_not_called()
+
+    # Churn: a container of `a` is replaced, `b` is deleted and `c` is created
+    pod_list_utils.update({'items': [make_pod('a', '2', 'a1', 'a3'), make_pod('c', '1', 'c1')]})
+    assert sorted(pod_list_utils.containers) == ['docker://a1', 'docker://a3', 'docker://c1']
+    assert sorted(pod_list_utils.cache) == ['docker://a1']
+    assert pod_list_utils.get_uid_by_name_tuple(('default', 'pod-b')) is None
+    assert pod_list_utils.get_uid_by_name_tuple(('default', 'pod-c')) == 'c'
+    assert pod_list_utils.get_cid_by_name_tuple(('default', 'pod-a', 'a2')) is None
+    assert pod_list_utils.get_cid_by_name_tuple(('default', 'pod-a', 'a3')) == 'docker://a3'
+
+    assert pod_list_utils.is_excluded('docker://a1') is False
+    is_excluded.assert_not_called()
+    assert pod_list_utils.is_excluded('docker://b1') is True
+    assert pod_list_utils.is_excluded('docker://a3') is False
+    assert pod_list_utils.is_excluded('docker://c1') is False
+    assert is_excluded.call_count == 2
+
+
+def test_pod_list_utils_update_container_statuses(monkeypatch):
+    is_excluded = mock.Mock(return_value=False)
+    monkeypatch.setattr('datadog_checks.kubelet.common.is_excluded', is_excluded)
+
+    pod_list_utils = PodListUtils({'items': [make_pod('a', '1')]})
+    # Not in the pod list yet
+    assert pod_list_utils.is_excluded('docker://a1') is True
+
+    # New container statuses may be reported before the resourceVersion changes
+    pod_list_utils.update({'items': [make_pod('a', '1', 'a1')]})
+    assert pod_list_utils.is_excluded('docker://a1') is False
+    is_excluded.assert_called_once_with('a1', 'image-a1')
+
+
+def test_pod_list_utils_update_static_pods(monkeypatch):
+    is_excluded = mock.Mock(return_value=True)
+    monkeypatch.setattr('datadog_checks.kubelet.common.is_excluded', is_excluded)
+
+    pods = json.loads(mock_from_file('pods.json'))
+    pod_list_utils = PodListUtils(pods)
+    assert pod_list_utils.is_excluded("cid", "260c2b1d43b094af6d6b4ccba082c2db") is False
+
+    # The static pod is gone
+    pods['items'] = [pod for pod in pods['items'] if pod['metadata']['uid'] != "260c2b1d43b094af6d6b4ccba082c2db"]
+    pod_list_utils.update(pods)
+    assert pod_list_utils.is_excluded("cid", "260c2b1d43b094af6d6b4ccba082c2db") is True
+    is_excluded.assert_not_called()
+
+
+def test_pod_list_utils_invalidation(monkeypatch):
+    is_excluded = mock.Mock(return_value=False)
+    monkeypatch.setattr('datadog_checks.kubelet.common.is_excluded', is_excluded)
+
+    pod_list = {'items': [make_pod('a', '1', 'a1'), make_pod('b', '1', 'b1')]}
+    pod_list_utils = PodListUtils(pod_list)
+    pod_list_utils.is_excluded('docker://a1')
+    pod_list_utils.is_excluded('docker://b1')
+
+    pod_list_utils.invalidate_pod('a')
+    assert sorted(pod_list_utils.cache) == ['docker://b1']
+    pod_list_utils.update(pod_list)
+    assert sorted(pod_list_utils.containers) == ['docker://a1', 'docker://b1']
+
+    # Without pod list, everything is forgotten
+    pod_list_utils.update(None)
+    assert pod_list_utils.containers == {}
+    assert pod_list_utils.cache == {}
+    assert pod_list_utils.is_excluded('docker://b1') is True
+    assert is_excluded.call_count == 2
+
+
 def test_pod_by_uid():
     podlist = json.loads(mock_from_file('pods.json'))
 
@@ -12,6 +12,7 @@ from six import iteritems
 
 from datadog_checks.base.utils.date import UTC, parse_rfc3339
 from datadog_checks.kubelet import KubeletCheck, KubeletCredentials
+from datadog_checks.kubelet.podlist import POD_FIELDS, project
 
 # Skip the whole tests module on Windows
 pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='tests for linux only')
@@ -254,6 +255,21 @@ def test_kubelet_default_options():
     assert isinstance(check.kubelet_scraper_config, dict)
 
 
+def test_kubelet_check_pod_list_index(monkeypatch, aggregator, tagger):
+    is_excluded = mock.Mock(return_value=False)
+    monkeypatch.setattr('datadog_checks.kubelet.common.is_excluded', is_excluded)
+    check = mock_kubelet_check(monkeypatch, [{}])
+    monkeypatch.setattr(check, 'process_cadvisor', mock.Mock(return_value=None))
+
+    check.check({})
+    assert is_excluded.call_count > 0
+
+    # The containers of the pods that didn't change aren't filtered again
+    is_excluded.reset_mock()
+    check.check({})
+    is_excluded.assert_not_called()
+
+
 def test_kubelet_check_prometheus_instance_tags(monkeypatch, aggregator, tagger):
     _test_kubelet_check_prometheus(monkeypatch, aggregator, tagger, ["instance:tag"])
 
@@ -673,6 +689,8 @@ def test_retrieve_pod_list_success(monkeypatch):
 
     retrieved = check.retrieve_pod_list()
     expected = json.loads(mock_from_file("pod_list_raw.json"))
+    # Only the fields used by the check are kept
+    expected['items'] = [project(pod, POD_FIELDS) for pod in expected['items']]
     assert json.dumps(retrieved, sort_keys=True) == json.dumps(expected, sort_keys=True)
 
 
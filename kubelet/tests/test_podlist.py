@@ -0,0 +1,68 @@
+# (C) Datadog, Inc. 2020
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import io
+import json
+import sys
+
+import pytest
+
+from datadog_checks.base.utils.common import ensure_bytes, ensure_unicode
+from datadog_checks.kubelet.podlist import POD_FIELDS, PodListDecoder, project
+
+from .test_kubelet import mock_from_file
+
+# Skip the whole tests module on Windows
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='tests for linux only')
+
+
+def test_project():
+    pod = {
+        'metadata': {'name': 'foo', 'labels': {'app': 'foo'}, 'annotations': None},
+        'spec': {'containers': [{'name': 'bar', 'env': [{'name': 'A', 'value': '1'}]}]},
+        'status': {'phase': 'Running', 'containerStatuses': []},
+    }
+    assert project(pod, POD_FIELDS) == {
+        'metadata': {'name': 'foo', 'annotations': None},
+        'spec': {'containers': [{'name': 'bar'}]},
+        'status': {'phase': 'Running', 'containerStatuses': []},
+    }
+
+
+@pytest.mark.parametrize('chunk_size', [1, 10, PodListDecoder.CHUNK_SIZE])
+def test_decode(monkeypatch, chunk_size):
+    content = mock_from_file('pods.json')
+    expected = json.loads(content)
+    expected['items'] = [project(pod, POD_FIELDS) for pod in expected['items']]
+
+    monkeypatch.setattr(PodListDecoder, 'CHUNK_SIZE', chunk_size)
+    assert PodListDecoder(io.BytesIO(ensure_bytes(content))).decode() == expected
+    assert PodListDecoder(io.StringIO(ensure_unicode(content))).decode() == expected
+
+
+def test_decode_pod_hook():
+    content = b'{"items": [{"metadata": {"name": "foo"}}, {"metadata": {"name": "bar"}}], "kind": "PodList"}'
+
+    def pod_hook(pod):
+        return None if pod['metadata']['name'] == 'foo' else pod
+
+    pod_list = PodListDecoder(io.BytesIO(content), pod_hook=pod_hook).decode()
+    assert pod_list == {'items': [{'metadata': {'name': 'bar'}}], 'kind': 'PodList'}
+
+
+@pytest.mark.parametrize(
+    'content, expected',
+    [
+        (b'{}', {}),
+        (b' {"items": null} ', {'items': None}),
+        (b'{"items": [], "count": 12345}', {'items': [], 'count': 12345}),
+    ],
+)
+def test_decode_empty(content, expected):
+    assert PodListDecoder(io.BytesIO(content)).decode() == expected
+
+
+@pytest.mark.parametrize('content', [b'', b'[]', b'{"items": [{}', b'{"items" []}', b'{"items": [] "kind": ""}'])
+def test_decode_invalid(content):
+    with pytest.raises(ValueError):
+        PodListDecoder(io.BytesIO(content)).decode()
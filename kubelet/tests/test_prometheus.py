@@ -162,7 +162,9 @@ def test_get_container_id(cadvisor_scraper):
     assert cadvisor_scraper._get_container_id([]) is None
 
 
-def test_get_entity_id_if_container_metric(cadvisor_scraper):
+def test_get_container_context_entity_id(cadvisor_scraper):
+    scraper_config = cadvisor_scraper.cadvisor_scraper_config
+
     # k8s >= 1.16
     static_pod_1_16 = MockMetric(
         'bar',
@@ -175,9 +177,10 @@ def test_get_entity_id_if_container_metric(cadvisor_scraper):
             "id": "1",
         },
     )
-    assert (
-        cadvisor_scraper._get_entity_id_if_container_metric(static_pod_1_16.label) == "fbf18e171294371272adc19391eae7cc"
-    )
+    cadvisor_scraper._reset_cadvisor_contexts()
+    context = cadvisor_scraper._get_container_context(static_pod_1_16.label, scraper_config)
+    assert context.entity_id == "fbf18e171294371272adc19391eae7cc"
+    assert context.static
 
     static_pod_1_15 = MockMetric(
         'bar',
@@ -192,9 +195,10 @@ def test_get_entity_id_if_container_metric(cadvisor_scraper):
             "id": "1",
         },
     )
-    assert (
-        cadvisor_scraper._get_entity_id_if_container_metric(static_pod_1_15.label) == "fbf18e171294371272adc19391eae7cc"
-    )
+    cadvisor_scraper._reset_cadvisor_contexts()
+    context = cadvisor_scraper._get_container_context(static_pod_1_15.label, scraper_config)
+    assert context.entity_id == "fbf18e171294371272adc19391eae7cc"
+    assert context.static
 
     # k8s < 1.16
     static_pod_1_14 = MockMetric(
@@ -208,9 +212,10 @@ def test_get_entity_id_if_container_metric(cadvisor_scraper):
             "id": "1",
         },
     )
-    assert (
-        cadvisor_scraper._get_entity_id_if_container_metric(static_pod_1_14.label) == "fbf18e171294371272adc19391eae7cc"
-    )
+    cadvisor_scraper._reset_cadvisor_contexts()
+    context = cadvisor_scraper._get_container_context(static_pod_1_14.label, scraper_config)
+    assert context.entity_id == "fbf18e171294371272adc19391eae7cc"
+    assert context.static
 
 
 def test_get_pod_uid(cadvisor_scraper):
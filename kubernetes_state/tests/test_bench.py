@@ -0,0 +1,36 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import os
+
+import mock
+import pytest
+
+from datadog_checks.kubernetes_state import KubernetesState
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def mock_response(fname):
+    with open(os.path.join(HERE, 'fixtures', fname)) as f:
+        content = f.read()
+
+    attrs = {'close.return_value': True, 'iter_lines.return_value': content.split('\n'), 'content': content}
+    return mock.Mock(headers={'Content-Type': 'text/plain'}, **attrs)
+
+
+@pytest.mark.parametrize('metric_tags_cache_size', [0, 10000], ids=['no_tags_cache', 'tags_cache'])
+def test_check(benchmark, metric_tags_cache_size):
+    instance = {
+        'host': 'foo',
+        'kube_state_url': 'http://foo',
+        'tags': ['optional:tag1'],
+        'metric_tags_cache_size': metric_tags_cache_size,
+    }
+    check = KubernetesState('kubernetes_state', {}, {}, [instance])
+    check.poll = mock.Mock(return_value=mock_response('prometheus.txt'))
+
+    # Run once to get the label joins dry run and cache warm up out of the way.
+    check.check(instance)
+
+    benchmark(check.check, instance)
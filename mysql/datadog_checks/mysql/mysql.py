@@ -451,7 +451,32 @@ class MySql(AgentCheck):
                 db.close()
 
     def _collect_metrics(self, db, tags, options, queries, max_custom_queries):
+        with self.phase('query'):
+            metrics, results = self._query_metrics(db, tags, options)
 
+        with self.phase('submit') as phase:
+            self._submit_metrics(metrics, results, tags)
+            phase.add(len(metrics))
+
+        # Collect custom query metrics
+        # Max of 20 queries allowed
+        if isinstance(queries, list):
+            # Each custom query is submitted as soon as it's read, they are timed together
+            with self.phase('custom_queries') as phase:
+                for check in queries[:max_custom_queries]:
+                    total_tags = tags + check.get('tags', [])
+                    self._collect_dict(
+                        check['type'], {check['field']: check['metric']}, check['query'], db, tags=total_tags
+                    )
+                    phase.add()
+
+            if len(queries) > max_custom_queries:
+                self.warning("Maximum number (%s) of custom queries reached.  Skipping the rest." % max_custom_queries)
+
+    def _query_metrics(self, db, tags, options):
+        """
+        Return the variables to submit, and the results they are read from.
+        """
         # Get aggregate of all VARS we want to collect
         metrics = STATUS_VARS
 
@@ -641,19 +666,7 @@ class MySql(AgentCheck):
             if src in results:
                 results[dst] = results[src]
 
-        self._submit_metrics(metrics, results, tags)
-
-        # Collect custom query metrics
-        # Max of 20 queries allowed
-        if isinstance(queries, list):
-            for check in queries[:max_custom_queries]:
-                total_tags = tags + check.get('tags', [])
-                self._collect_dict(
-                    check['type'], {check['field']: check['metric']}, check['query'], db, tags=total_tags
-                )
-
-            if len(queries) > max_custom_queries:
-                self.warning("Maximum number (%s) of custom queries reached.  Skipping the rest." % max_custom_queries)
+        return metrics, results
 
     def _is_master(self, slaves, results):
         # master uuid only collected in slaves
@@ -11,7 +11,7 @@ from openstack.config.loader import OpenStackConfig
 from six import iteritems, itervalues
 
 from datadog_checks.base import AgentCheck, is_affirmative
-from datadog_checks.base.utils.common import pattern_filter
+from datadog_checks.base.utils.common import PatternFilter
 
 from .api import ApiFactory
 from .exceptions import (
@@ -133,6 +133,11 @@ class OpenStackControllerCheck(AgentCheck):
         # Mapping of Nova-managed servers to tags for current instance name
         self.external_host_tags = {}
 
+        instance = self.instance or {}
+        self._project_name_filter = PatternFilter(
+            whitelist=instance.get('whitelist_project_names'), blacklist=instance.get('blacklist_project_names')
+        )
+
     def delete_api_cache(self):
         self._api = None
 
@@ -679,10 +684,6 @@ class OpenStackControllerCheck(AgentCheck):
         exclude_network_id_rules = [re.compile(ex) for ex in exclude_network_id_patterns]
         exclude_server_id_patterns = set(instance.get('exclude_server_ids', []))
         exclude_server_id_rules = [re.compile(ex) for ex in exclude_server_id_patterns]
-        include_project_name_patterns = set(instance.get('whitelist_project_names', []))
-        include_project_name_rules = [re.compile(ex) for ex in include_project_name_patterns]
-        exclude_project_name_patterns = set(instance.get('blacklist_project_names', []))
-        exclude_project_name_rules = [re.compile(ex) for ex in exclude_project_name_patterns]
 
         custom_tags = instance.get("tags", [])
         collect_project_metrics = is_affirmative(instance.get('collect_project_metrics', True))
@@ -710,7 +711,7 @@ class OpenStackControllerCheck(AgentCheck):
             # TODO: NOTE: During authentication we use /v3/auth/projects and here we use /v3/projects.
             # TODO: These api don't seems to return the same thing however the latter contains the former.
             # TODO: Is this expected or could we just have one call with proper config?
-            projects = self.get_projects(include_project_name_rules, exclude_project_name_rules)
+            projects = self.get_projects()
 
             if collect_project_metrics:
                 for project in itervalues(projects):
@@ -818,16 +819,14 @@ class OpenStackControllerCheck(AgentCheck):
         return self._api.get_flavors_detail(query_params)
 
     # Keystone Proxy Methods
-    def get_projects(self, include_project_name_rules, exclude_project_name_rules):
+    def get_projects(self):
         projects = self._api.get_projects()
         project_by_name = {}
         for project in projects:
             name = project.get('name')
             project_by_name[name] = project
-        filtered_project_names = pattern_filter(
-            [p for p in project_by_name], whitelist=include_project_name_rules, blacklist=exclude_project_name_rules
-        )
-        result = {name: v for (name, v) in iteritems(project_by_name) if name in filtered_project_names}
+        is_allowed = self._project_name_filter.is_allowed
+        result = {name: v for (name, v) in iteritems(project_by_name) if is_allowed(name)}
         return result
 
     # Neutron Proxy Methods
@@ -352,12 +352,15 @@ class PostgreSql(AgentCheck):
                 rel_names = ', '.join("'{0}'".format(k) for k, v in relations_config.items() if 'relation_name' in v)
                 rel_regex = ', '.join("'{0}'".format(k) for k, v in relations_config.items() if 'relation_regex' in v)
                 self.log.debug("Running query: %s with relations matching: %s", query, rel_names + rel_regex)
-                cursor.execute(query.format(relations_names=rel_names, relations_regexes=rel_regex))
+                statement = query.format(relations_names=rel_names, relations_regexes=rel_regex)
             else:
                 self.log.debug("Running query: %s", query)
-                cursor.execute(query.replace(r'%', r'%%'))
+                statement = query.replace(r'%', r'%%')
 
-            results = cursor.fetchall()
+            with self.phase('query') as phase:
+                cursor.execute(statement)
+                results = cursor.fetchall()
+                phase.add(len(results))
 
         except psycopg2.errors.UndefinedFunction as e:
             log_func(e)
@@ -380,6 +383,13 @@ class PostgreSql(AgentCheck):
             )
             results = results[:MAX_CUSTOM_RESULTS]
 
+        with self.phase('submit') as phase:
+            valid_results_size = self._submit_scope_results(scope, cols, results, instance_tags, relations_config)
+            phase.add(valid_results_size)
+
+        return valid_results_size
+
+    def _submit_scope_results(self, scope, cols, results, instance_tags, relations_config):
         desc = scope['descriptors']
 
         # parse & submit results
@@ -735,7 +745,9 @@ class PostgreSql(AgentCheck):
                 collect_database_size_metrics,
                 collect_default_db,
             )
-            self._get_custom_queries(tags, custom_queries)
+            # The rows of custom queries are submitted as they are read, they are timed together
+            with self.phase('custom_queries'):
+                self._get_custom_queries(tags, custom_queries)
         except (psycopg2.InterfaceError, socket.error):
             self.log.info("Connection error, will retry on next agent run")
             self._clean_state()
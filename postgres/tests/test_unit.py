@@ -6,7 +6,7 @@ import pytest
 from mock import MagicMock
 from semver import VersionInfo
 
-from datadog_checks.postgres import util
+from datadog_checks.postgres import PostgreSql, util
 
 pytestmark = pytest.mark.unit
 
@@ -172,3 +172,20 @@ def test_malformed_get_custom_queries(check):
         malformed_custom_query_column['name'],
         malformed_custom_query['metric_prefix'],
     )
+
+
+def test_query_scope_phases():
+    check = PostgreSql('postgres', {}, [{'dbname': 'dbname', 'host': 'localhost', 'port': '5432', 'telemetry': True}])
+    check._version = VersionInfo(9, 2, 0)
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [('db1', 1), ('db2', 2)]
+    scope = {
+        'descriptors': [('datname', 'db')],
+        'metrics': {'numbackends': ('postgresql.connections', PostgreSql.gauge)},
+        'query': 'SELECT datname, {metrics_columns} FROM pg_stat_database',
+        'relation': False,
+    }
+
+    assert check._query_scope(cursor, scope, ['foo:bar'], False, {}) == 2
+    phases = check._phase_recorder.phases
+    assert [(name, calls, count) for name, (calls, _, count) in phases.items()] == [('query', 1, 2), ('submit', 1, 2)]
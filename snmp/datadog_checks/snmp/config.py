@@ -3,6 +3,7 @@
 # Licensed under Simplified BSD License (see LICENSE)
 import ipaddress
 import os
+import time
 from collections import defaultdict
 
 import pysnmp_mibs
@@ -18,6 +19,8 @@ from pysnmp.smi.error import MibNotFoundError
 
 from datadog_checks.base import ConfigurationError, is_affirmative
 
+from .resolver import OIDResolver, OIDTrie
+
 
 class InstanceConfig:
     """Parse and hold configuration about a single instance."""
@@ -26,11 +29,14 @@ class InstanceConfig:
     DEFAULT_TIMEOUT = 1
     DEFAULT_ALLOWED_FAILURES = 3
     DEFAULT_BULK_THRESHOLD = 5
+    DEFAULT_WORKERS = 5
+    DEFAULT_DISCOVERY_CACHE_TTL = 86400
 
     def __init__(self, instance, warning, log, global_metrics, mibs_path, profiles, profiles_by_oid):
         self.instance = instance
         self.tags = instance.get('tags', [])
-        self.metrics = instance.get('metrics', [])
+        # Copied, the profile metrics of discovered devices must not leak into the instance
+        self.metrics = list(instance.get('metrics', []))
         profile = instance.get('profile')
         if is_affirmative(instance.get('use_global_metrics', True)):
             self.metrics.extend(global_metrics)
@@ -45,10 +51,23 @@ class InstanceConfig:
         self.discovered_instances = {}
         self.failing_instances = defaultdict(int)
         self.allowed_failures = int(instance.get('discovery_allowed_failures', self.DEFAULT_ALLOWED_FAILURES))
+        self.discovery_cache_ttl = int(instance.get('discovery_cache_ttl', self.DEFAULT_DISCOVERY_CACHE_TTL))
         self.bulk_threshold = int(instance.get('bulk_threshold', self.DEFAULT_BULK_THRESHOLD))
+        self.workers = max(1, int(instance.get('workers', self.DEFAULT_WORKERS)))
+        device_timeout = instance.get('device_timeout')
+        self.device_timeout = float(device_timeout) if device_timeout else None
+        self.deadline = None
 
         timeout = int(instance.get('timeout', self.DEFAULT_TIMEOUT))
         retries = int(instance.get('retries', self.DEFAULT_RETRIES))
+        self.timeout = timeout
+        self.adaptive_requests = is_affirmative(instance.get('adaptive_requests', False))
+        # Built by the check, it depends on its configuration
+        self.request_plan = None
+        # Profile matching the sysObjectID of the device, resolved by the check
+        self.sys_object_oid = None
+        self.resolved_profile = None
+        self.resolved_at = None
 
         ip_address = instance.get('ip_address')
         network_address = instance.get('network_address')
@@ -74,6 +93,7 @@ class InstanceConfig:
             raise ConfigurationError('Instance should specify at least one metric or profiles should be defined')
 
         self.table_oids, self.raw_oids, self.mibs_to_load = self.parse_metrics(self.metrics, warning, log)
+        self.build_resolvers()
 
         self.auth_data = self.get_auth_data(instance)
         self.context_data = hlapi.ContextData(*self.get_context_data(instance))
@@ -81,6 +101,25 @@ class InstanceConfig:
     def refresh_with_profile(self, profile, warning, log):
         self.metrics.extend(profile['definition']['metrics'])
         self.table_oids, self.raw_oids, self.mibs_to_load = self.parse_metrics(self.metrics, warning, log)
+        self.build_resolvers()
+
+    def record_profile(self, sys_object_oid, profile, resolved_at=None):
+        """Record the profile matching the sysObjectID of the device, None if no profile matched."""
+        self.sys_object_oid = sys_object_oid
+        self.resolved_profile = profile
+        self.resolved_at = time.time() if resolved_at is None else resolved_at
+
+    def build_resolvers(self):
+        """Build the lookups of the results of the queries, they are rebuilt when the metrics change."""
+        self.oid_trie = OIDTrie(metric['OID'] for metric in self.metrics if 'OID' in metric)
+        self.resolver = OIDResolver(self.mib_view_controller, self.mibs_to_load)
+
+    def start_deadline(self):
+        """Start the time budget of the queries made to the device during a check run."""
+        self.deadline = time.time() + self.device_timeout if self.device_timeout else None
+
+    def past_deadline(self):
+        return self.deadline is not None and time.time() > self.deadline
 
     def call_cmd(self, cmd, *args, **kwargs):
         return cmd(self.snmp_engine, self.auth_data, self.transport, self.context_data, *args, **kwargs)
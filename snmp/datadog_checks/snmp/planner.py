@@ -0,0 +1,204 @@
+# (C) Datadog, Inc. 2020
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import math
+
+
+class RequestSize(object):
+    """
+    Number of var-binds of a kind of request, adapted to what the device supports.
+
+    The size grows while the device answers full requests quickly, and shrinks when requests are too big
+    or slow. The smallest size known to fail and the largest size known to succeed are kept, so the size
+    converges instead of repeatedly probing sizes the device can't handle.
+    """
+
+    GROWTH = 1.25
+
+    def __init__(self, size, maximum):
+        self.size = size
+        self.maximum = maximum
+        # Smallest size the device failed with
+        self.limit = None
+        # Largest size the device answered, the initial size is assumed to be supported
+        self.known_good = size
+
+    def succeeded(self, size, latency, slow_latency, full):
+        """
+        Account for a request of `size` var-binds answered in `latency` seconds, return whether the size changed.
+        Only `full` requests, as large as the current size allows, make it grow.
+        """
+        self.known_good = max(self.known_good, size)
+        if latency > slow_latency:
+            return self._set(int(self.size / self.GROWTH))
+
+        if not full:
+            return False
+
+        ceiling = self.maximum if self.limit is None else min(self.maximum, self.limit - 1)
+        return self._set(min(ceiling, int(math.ceil(self.size * self.GROWTH))))
+
+    def too_big(self, size):
+        """Account for a request of `size` var-binds the device couldn't answer, return whether the size changed."""
+        self.limit = size if self.limit is None else min(self.limit, size)
+        return self._set(min(self.size, size // 2))
+
+    def truncated(self, size, received):
+        """
+        Account for a request of `size` var-binds answered with only `received` var-binds, return whether the
+        size changed.
+        """
+        self.limit = size if self.limit is None else min(self.limit, size)
+        return self._set(min(self.size, received))
+
+    def timed_out(self, size):
+        """
+        Account for a request of `size` var-binds that timed out, return whether the size changed. Only requests
+        larger than the ones the device answered are deemed too big, the device may just be unreachable.
+        """
+        if size <= self.known_good:
+            return False
+
+        return self.too_big(size)
+
+    def _set(self, size):
+        size = max(1, size)
+        if size == self.size:
+            return False
+
+        self.size = size
+        return True
+
+    def to_dict(self):
+        return {'size': self.size, 'limit': self.limit, 'known_good': self.known_good}
+
+    def update(self, data):
+        self.size = max(1, min(self.maximum, int(data['size'])))
+        self.limit = data['limit']
+        self.known_good = data['known_good']
+
+
+class RequestPlan(object):
+    """
+    Sizes of the requests made to a device: the number of OIDs of GET requests, and the number of
+    var-binds of GETBULK responses.
+
+    Several table columns are walked with each GETBULK request. The number of rows of the tables is
+    remembered, so that the next walks fetch all the rows of a table with as few requests as possible.
+
+    Unless adaptive, the sizes are fixed.
+    """
+
+    MAX_BATCH_SIZE = 64
+    MAX_BULK_SIZE = 256
+    # Rows fetched by the GETBULK requests walking tables whose number of rows is unknown
+    DEFAULT_REPETITIONS = 5
+
+    def __init__(self, batch_size, bulk_size, timeout, adaptive=False):
+        self.batch = RequestSize(batch_size, max(batch_size, self.MAX_BATCH_SIZE))
+        self.bulk = RequestSize(bulk_size, max(bulk_size, self.MAX_BULK_SIZE))
+        # Responses slower than this are deemed too big, retries start after the timeout
+        self.slow_latency = timeout / 2.0
+        self.adaptive = adaptive
+        # Whether the plan changed since it was last saved
+        self.changed = False
+        # OID of a table entry -> number of rows
+        self.rows = {}
+
+    @property
+    def batch_size(self):
+        return self.batch.size
+
+    def column_chunks(self, columns):
+        """
+        Group the columns to walk, OID tuples, by GETBULK request and return a list of `(max_repetitions, columns)`.
+
+        The columns of a table whose number of rows is known are walked with a request fetching one more row,
+        to reach the end of the table, and the columns of tables with as many rows are walked together.
+        """
+        budget = self.bulk.size
+        ordered = []
+        for column in columns:
+            rows = self.rows.get(column[:-1])
+            repetitions = self.DEFAULT_REPETITIONS if rows is None else rows + 1
+            ordered.append((min(budget, repetitions), column))
+        ordered.sort(key=lambda item: item[0])
+
+        chunks = []
+        chunk = []
+        chunk_repetitions = 0
+        for repetitions, column in ordered:
+            repetitions = max(chunk_repetitions, repetitions)
+            if chunk and (len(chunk) + 1) * repetitions > budget:
+                chunks.append((chunk_repetitions, chunk))
+                chunk = []
+            chunk.append(column)
+            chunk_repetitions = repetitions
+
+        if chunk:
+            chunks.append((chunk_repetitions, chunk))
+
+        return chunks
+
+    def max_repetitions(self, columns):
+        return max(1, self.bulk.size // columns)
+
+    def record_rows(self, columns, rows):
+        """Remember the number of rows of the tables of the walked columns."""
+        table_rows = {}
+        for column, column_rows in zip(columns, rows):
+            entry = column[:-1]
+            table_rows[entry] = max(table_rows.get(entry, 0), column_rows)
+
+        for entry, entry_rows in table_rows.items():
+            if self.rows.get(entry) != entry_rows:
+                self.rows[entry] = entry_rows
+                self.changed = True
+
+    def get_succeeded(self, size, latency):
+        self._adapt(self.batch.succeeded, size, latency, self.slow_latency, size >= self.batch.size)
+
+    def get_too_big(self, size):
+        """Return whether the request should be retried with the new batch size."""
+        self._adapt(self.batch.too_big, size)
+        return self.adaptive and size > self.batch.size
+
+    def get_timed_out(self, size):
+        self._adapt(self.batch.timed_out, size)
+
+    def bulk_succeeded(self, size, columns, received, latency):
+        if received < size:
+            self._adapt(self.bulk.truncated, size, received)
+        else:
+            full = size + columns > self.bulk.size
+            self._adapt(self.bulk.succeeded, size, latency, self.slow_latency, full)
+
+    def bulk_too_big(self, size):
+        """Return whether the request should be retried with the new bulk size."""
+        self._adapt(self.bulk.too_big, size)
+        return self.adaptive and size > self.bulk.size
+
+    def bulk_timed_out(self, size):
+        self._adapt(self.bulk.timed_out, size)
+
+    def _adapt(self, method, *args):
+        if not self.adaptive:
+            return False
+
+        changed = method(*args)
+        self.changed = self.changed or changed
+        return changed
+
+    def to_dict(self):
+        return {
+            'batch': self.batch.to_dict(),
+            'bulk': self.bulk.to_dict(),
+            'rows': {'.'.join(str(part) for part in entry): rows for entry, rows in list(self.rows.items())},
+        }
+
+    def update(self, data):
+        """Restore a saved plan, see `to_dict`. The sizes of a plan that isn't adaptive stay the configured ones."""
+        if self.adaptive:
+            self.batch.update(data['batch'])
+            self.bulk.update(data['bulk'])
+        self.rows = {tuple(int(part) for part in entry.split('.')): rows for entry, rows in data['rows'].items()}
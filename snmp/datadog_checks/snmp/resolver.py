@@ -0,0 +1,97 @@
+# (C) Datadog, Inc. 2020
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+from pysnmp import hlapi
+
+# Key of the queried OID in the node of the trie it ends at, OID components are integers
+QUERIED_OID = None
+
+
+def parse_oid(oid):
+    """Return the tuple of the components of a dotted OID, or None if it isn't numerical."""
+    try:
+        return tuple(int(part) for part in oid.strip('.').split('.'))
+    except ValueError:
+        return None
+
+
+class OIDTrie(object):
+    """
+    Prefix tree of the OIDs queried from a device, used to match the OIDs sent back by the device
+    to the queried OIDs they are equal to or start with, in a single traversal of the results.
+    """
+
+    def __init__(self, oids):
+        self._root = {}
+        for oid in oids:
+            parts = parse_oid(oid)
+            if parts is None:
+                continue
+
+            node = self._root
+            for part in parts:
+                node = node.setdefault(part, {})
+            node[QUERIED_OID] = oid.lstrip('.')
+
+    def match(self, results):
+        """
+        Return `dict[queried oid] = value` from `results`, an iterable of `(oid tuple, value)`.
+
+        A queried OID is matched to the value of the same OID if the device sent it back, otherwise
+        to the value of the first OID it is a prefix of.
+        """
+        exact = {}
+        prefixes = {}
+        for oid, value in results:
+            node = self._root
+            for part in oid:
+                queried = node.get(QUERIED_OID)
+                if queried is not None and queried not in prefixes:
+                    prefixes[queried] = value
+
+                node = node.get(part)
+                if node is None:
+                    break
+            else:
+                queried = node.get(QUERIED_OID)
+                if queried is not None:
+                    exact[queried] = value
+
+        prefixes.update(exact)
+        return prefixes
+
+
+class OIDResolver(object):
+    """
+    Resolve the OIDs sent back by a device to their MIB symbol and indexes.
+
+    Resolutions are kept until the end of the next run, the MIB resolver is only used for
+    the OIDs the device didn't send during the previous run.
+    """
+
+    def __init__(self, mib_view_controller, mibs_to_load):
+        self._mib_view_controller = mib_view_controller
+        self._mibs_to_load = mibs_to_load
+        # oid tuple -> (symbol, indexes)
+        self._previous = {}
+        self._current = {}
+
+    def resolve(self, oid):
+        """Return the `(symbol, indexes)` of an OID tuple."""
+        resolved = self._current.get(oid)
+        if resolved is not None:
+            return resolved
+
+        resolved = self._previous.get(oid)
+        if resolved is None:
+            identity = hlapi.ObjectIdentity(oid).loadMibs(*self._mibs_to_load)
+            _, symbol, indexes = identity.resolveWithMib(self._mib_view_controller).getMibSymbol()
+            resolved = symbol, indexes
+
+        self._current[oid] = resolved
+        return resolved
+
+    def next_run(self):
+        """Forget the OIDs that weren't resolved since the previous call."""
+        self._previous = self._current
+        self._current = {}
@@ -12,16 +12,21 @@ from collections import defaultdict
 import pysnmp.proto.rfc1902 as snmp_type
 import yaml
 from pyasn1.codec.ber import decoder
+from pyasn1.type.univ import Null
 from pysnmp import hlapi
 from pysnmp.error import PySnmpError
+from pysnmp.proto import errind
 from pysnmp.smi import builder
 from pysnmp.smi.exval import noSuchInstance, noSuchObject
 from six import iteritems
+from six.moves import queue
 
 from datadog_checks.base import AgentCheck, ConfigurationError, is_affirmative
+from datadog_checks.base.checks.libs.thread_pool import Pool
 from datadog_checks.base.errors import CheckException
 
 from .config import InstanceConfig
+from .planner import RequestPlan
 
 try:
     from datadog_agent import get_config, read_persistent_cache, write_persistent_cache
@@ -57,6 +62,9 @@ SNMP_GAUGES = frozenset(
 
 DEFAULT_OID_BATCH_SIZE = 10
 
+# Error status of the responses a device couldn't fit in a message
+TOO_BIG = 1
+
 
 def reply_invalid(oid):
     return noSuchInstance.isSameTypeWith(oid) or noSuchObject.isSameTypeWith(oid)
@@ -132,36 +140,110 @@ class SnmpCheck(AgentCheck):
         discovery_interval = config.instance.get('discovery_interval', 3600)
         while self._running:
             start_time = time.time()
+            hosts = queue.Queue()
             for host in config.ip_network.hosts():
                 host = str(host)
-                if host in config.discovered_instances:
-                    continue
-                instance = config.instance.copy()
-                instance.pop('network_address')
-                instance['ip_address'] = host
-
-                host_config = self._build_config(instance)
-                try:
-                    sys_object_oid = self.fetch_sysobject_oid(host_config)
-                except Exception as e:
-                    self.log.debug("Error scanning host %s: %s", host, e)
-                    continue
-                try:
-                    profile = self._profile_for_sysobject_oid(sys_object_oid)
-                except ConfigurationError:
-                    if not (host_config.table_oids or host_config.raw_oids):
-                        self.log.warn("Host %s didn't match a profile for sysObjectID %s", host, sys_object_oid)
-                        continue
-                else:
-                    host_config.refresh_with_profile(self.profiles[profile], self.warning, self.log)
-                config.discovered_instances[host] = host_config
+                if host not in config.discovered_instances:
+                    hosts.put(host)
+
+            # Scan the network with daemon threads, like the discovery thread itself, for a scan
+            # to never prevent the interpreter from exiting
+            scanners = []
+            for i in range(min(config.workers, hosts.qsize())):
+                scanner = threading.Thread(
+                    target=self._scan_hosts, args=(hosts,), name='{}-discovery-{}'.format(self.name, i)
+                )
+                scanner.daemon = True
+                scanner.start()
+                scanners.append(scanner)
+            for scanner in scanners:
+                scanner.join()
 
-            write_persistent_cache(self.check_id, json.dumps(list(config.discovered_instances)))
+            self._write_discovery_cache()
 
             time_elapsed = time.time() - start_time
+            self.log.debug('Scanned network %s in %.2f seconds', config.ip_network, time_elapsed)
             if discovery_interval - time_elapsed > 0:
                 time.sleep(discovery_interval - time_elapsed)
 
+    def _scan_hosts(self, hosts):
+        """Probe the hosts of the queue until it's empty, and add the SNMP devices to the discovered instances."""
+        while self._running:
+            try:
+                host = hosts.get_nowait()
+            except queue.Empty:
+                return
+
+            host_config = self._discover_host(host)
+            if host_config is not None:
+                self._config.discovered_instances[host] = host_config
+
+    def _discover_host(self, host):
+        """Return the configuration to query the host with, or None if it isn't a supported SNMP device."""
+        host_config = self._build_host_config(host)
+        try:
+            sys_object_oid = self.fetch_sysobject_oid(host_config)
+        except Exception as e:
+            self.log.debug("Error scanning host %s: %s", host, e)
+            return None
+        try:
+            profile = self._profile_for_sysobject_oid(sys_object_oid)
+        except ConfigurationError:
+            if not (host_config.table_oids or host_config.raw_oids):
+                self.log.warn("Host %s didn't match a profile for sysObjectID %s", host, sys_object_oid)
+                return None
+            profile = None
+        else:
+            host_config.refresh_with_profile(self.profiles[profile], self.warning, self.log)
+        host_config.record_profile(sys_object_oid, profile)
+        return host_config
+
+    def _build_host_config(self, host):
+        instance = self._config.instance.copy()
+        instance.pop('network_address')
+        instance['ip_address'] = host
+        return self._build_config(instance)
+
+    def _restore_host(self, host, device, now):
+        """
+        Return the configuration of a host of the discovery cache, with the profile and request plan saved
+        for it, or None if it was resolved too long ago or with a removed profile and must be rediscovered.
+        """
+        resolved_at = device.get('resolved_at')
+        profile = device.get('profile')
+        if resolved_at is None:
+            # Hosts saved by previous versions are only known by their address
+            return self._build_host_config(host)
+        if now - resolved_at > self._config.discovery_cache_ttl:
+            return None
+        if profile is not None and profile not in self.profiles:
+            return None
+
+        host_config = self._build_host_config(host)
+        if profile is not None:
+            host_config.refresh_with_profile(self.profiles[profile], self.warning, self.log)
+        host_config.record_profile(device['sys_object_oid'], profile, resolved_at)
+        # Adaptive request plans are saved on their own after each run, only the rows of fixed ones are restored
+        if device.get('request_plan') and not host_config.adaptive_requests:
+            self._get_request_plan(host_config).update(device['request_plan'])
+        return host_config
+
+    def _write_discovery_cache(self):
+        """Save the discovered hosts, with the profile and request plan resolved for each of them."""
+        devices = {}
+        for host, host_config in list(self._config.discovered_instances.items()):
+            device = devices[host] = {}
+            if host_config.resolved_at is None:
+                continue
+
+            device['sys_object_oid'] = host_config.sys_object_oid
+            device['profile'] = host_config.resolved_profile
+            device['resolved_at'] = host_config.resolved_at
+            if host_config.request_plan is not None:
+                device['request_plan'] = host_config.request_plan.to_dict()
+
+        write_persistent_cache(self.check_id, json.dumps(devices))
+
     def raise_on_error_indication(self, error_indication, ip_address):
         if error_indication:
             message = '{} for instance {}'.format(error_indication, ip_address)
@@ -179,7 +261,7 @@ class SnmpCheck(AgentCheck):
         results = defaultdict(dict)
         enforce_constraints = config.enforce_constraints
         oids = []
-        bulk_oids = []
+        bulk_columns = []
         # Use bulk for SNMP version > 1 and there are enough symbols
         bulk_limit = config.bulk_threshold if config.auth_data.mpModel else 0
         for table, symbols in table_oids.items():
@@ -189,40 +271,24 @@ class SnmpCheck(AgentCheck):
             elif len(symbols) < bulk_limit:
                 oids.extend(symbols)
             else:
-                bulk_oids.append(table)
+                bulk_columns.extend(symbols)
 
         all_binds, error = self.fetch_oids(config, oids, enforce_constraints=enforce_constraints)
 
-        for oid in bulk_oids:
-            try:
-                self.log.debug('Running SNMP command getBulk on OID %r', oid)
-                binds_iterator = config.call_cmd(
-                    hlapi.bulkCmd,
-                    self._NON_REPEATERS,
-                    self._MAX_REPETITIONS,
-                    oid,
-                    lookupMib=enforce_constraints,
-                    ignoreNonIncreasingOid=self.ignore_nonincreasing_oid,
-                    lexicographicMode=False,
-                )
-                binds, error = self._consume_binds_iterator(binds_iterator, config)
-                all_binds.extend(binds)
-
-            except PySnmpError as e:
-                message = 'Failed to collect some metrics: {}'.format(e)
-                if not error:
-                    error = message
-                self.warning(message)
+        if bulk_columns:
+            binds, bulk_error = self.fetch_columns(config, bulk_columns, enforce_constraints)
+            all_binds.extend(binds)
+            error = bulk_error or error
 
         for result_oid, value in all_binds:
-            if not enforce_constraints:
+            if enforce_constraints:
+                _, metric, indexes = result_oid.getMibSymbol()
+            else:
                 # if enforce_constraints is false, then MIB resolution has not been done yet
-                # so we need to do it manually. We have to specify the mibs that we will need
-                # to resolve the name.
-                oid_to_resolve = hlapi.ObjectIdentity(result_oid.asTuple()).loadMibs(*config.mibs_to_load)
-                result_oid = oid_to_resolve.resolveWithMib(config.mib_view_controller)
-            _, metric, indexes = result_oid.getMibSymbol()
+                # so we need to do it manually, the resolutions are cached across runs.
+                metric, indexes = config.resolver.resolve(result_oid.asTuple())
             results[metric][indexes] = value
+        config.resolver.next_run()
         self.log.debug('Raw results: %s', results)
         # Freeze the result
         results.default_factory = None
@@ -234,19 +300,128 @@ class SnmpCheck(AgentCheck):
         configured in instance.
 
         Returns a dictionary:
-        dict[oid/metric_name] = value
-        In case of scalar objects, the row index is just 0
+        dict[queried oid] = value
+        The value is the one of the queried OID, or of the first OID it is a prefix of.
         """
         all_binds, error = self.fetch_oids(config, oids, enforce_constraints=False)
-        results = {}
-
-        for result_oid, value in all_binds:
-            oid = result_oid.asTuple()
-            matching = '.'.join(str(i) for i in oid)
-            results[matching] = value
+        results = config.oid_trie.match((result_oid.asTuple(), value) for result_oid, value in all_binds)
         self.log.debug('Raw results: %s', results)
         return results, error
 
+    def fetch_columns(self, config, columns, enforce_constraints):
+        """
+        Walk the table columns with GETBULK requests. Instead of the whole tables, only the queried columns
+        are walked, several at a time, with requests sized by the request plan of the device.
+        """
+        error = None
+        all_binds = []
+        prefixes = []
+        for column in columns:
+            try:
+                prefix = column.resolveWithMib(config.mib_view_controller)[0].getOid().asTuple()
+            except PySnmpError as e:
+                message = 'Failed to collect some metrics: {}'.format(e)
+                if not error:
+                    error = message
+                self.warning(message)
+                continue
+            if prefix not in prefixes:
+                prefixes.append(prefix)
+
+        for max_repetitions, chunk in self._get_request_plan(config).column_chunks(prefixes):
+            if config.past_deadline():
+                break
+            try:
+                binds, chunk_error = self._walk_columns(config, chunk, max_repetitions, enforce_constraints)
+                all_binds.extend(binds)
+                error = chunk_error or error
+            except PySnmpError as e:
+                message = 'Failed to collect some metrics: {}'.format(e)
+                if not error:
+                    error = message
+                self.warning(message)
+
+        return all_binds, error
+
+    def _walk_columns(self, config, prefixes, max_repetitions, enforce_constraints):
+        plan = self._get_request_plan(config)
+        # The last OID fetched from each column, None once the column is walked
+        positions = list(prefixes)
+        rows_count = [0] * len(prefixes)
+        all_binds = []
+        while True:
+            walked = [i for i, position in enumerate(positions) if position is not None]
+            if not walked:
+                plan.record_rows(prefixes, rows_count)
+                break
+            if config.past_deadline():
+                break
+
+            if max_repetitions is None:
+                max_repetitions = plan.max_repetitions(len(walked))
+            size = max_repetitions * len(walked)
+            var_binds = [hlapi.ObjectType(hlapi.ObjectIdentity(positions[i])) for i in walked]
+            self.log.debug('Running SNMP command getBulk on OIDS %s', var_binds)
+            started = time.time()
+            error_indication, error_status, rows = self._bulk_request(
+                config, max_repetitions, var_binds, enforce_constraints
+            )
+            self.log.debug('Returned vars: %s', rows)
+
+            if error_indication == errind.requestTimedOut:
+                plan.bulk_timed_out(size)
+            self.raise_on_error_indication(error_indication, config.ip_address)
+
+            if error_status:
+                if error_status == TOO_BIG and plan.bulk_too_big(size):
+                    max_repetitions = None
+                    continue
+
+                message = '{} for instance {}'.format(error_status.prettyPrint(), config.ip_address)
+                self.warning(message)
+                return all_binds, message
+
+            plan.bulk_succeeded(size, len(walked), sum(len(row) for row in rows), time.time() - started)
+            max_repetitions = None
+
+            for row in rows:
+                for i, (result_oid, value) in zip(walked, row):
+                    position = positions[i]
+                    if position is None:
+                        continue
+
+                    oid = result_oid.asTuple()
+                    # The column is walked at the end of the MIB, or once the OIDs leave it
+                    if isinstance(value, Null) or oid[: len(prefixes[i])] != prefixes[i]:
+                        positions[i] = None
+                        continue
+                    if oid <= position and not self.ignore_nonincreasing_oid:
+                        self.raise_on_error_indication(errind.oidNotIncreasing, config.ip_address)
+
+                    positions[i] = oid
+                    rows_count[i] += 1
+                    all_binds.append((result_oid, value))
+
+        return all_binds, None
+
+    def _bulk_request(self, config, max_repetitions, var_binds, enforce_constraints):
+        """Send a single GETBULK request, return its error indication, error status and rows."""
+        rows = []
+        for error_indication, error_status, _, row in config.call_cmd(
+            hlapi.bulkCmd,
+            self._NON_REPEATERS,
+            max_repetitions,
+            *var_binds,
+            lookupMib=enforce_constraints,
+            ignoreNonIncreasingOid=self.ignore_nonincreasing_oid,
+            maxCalls=1
+        ):
+            if error_indication or error_status:
+                return error_indication, error_status, rows
+            rows.append(row)
+
+        return None, None, rows
+
     def fetch_oids(self, config, oids, enforce_constraints):
         # UPDATE: We used to perform only a snmpgetnext command to fetch metric values.
         # It returns the wrong value when the OID passeed is referring to a specific leaf.
@@ -254,20 +429,33 @@ class SnmpCheck(AgentCheck):
         # snmpgetnext -v2c -c public localhost:11111 1.3.6.1.2.1.25.4.2.1.7.222
         # iso.3.6.1.2.1.25.4.2.1.7.224 = INTEGER: 2
         # SOLUTION: perform a snmpget command and fallback with snmpgetnext if not found
+        plan = self._get_request_plan(config)
         error = None
         first_oid = 0
         all_binds = []
         while first_oid < len(oids):
+            if config.past_deadline():
+                break
+            batch_size = plan.batch_size
             try:
-                oids_batch = oids[first_oid : first_oid + self.oid_batch_size]
+                oids_batch = oids[first_oid : first_oid + batch_size]
                 self.log.debug('Running SNMP command get on OIDS %s', oids_batch)
+                started = time.time()
                 error_indication, error_status, _, var_binds = next(
                     config.call_cmd(hlapi.getCmd, *oids_batch, lookupMib=enforce_constraints)
                 )
                 self.log.debug('Returned vars: %s', var_binds)
 
+                if error_indication == errind.requestTimedOut:
+                    plan.get_timed_out(len(oids_batch))
                 self.raise_on_error_indication(error_indication, config.ip_address)
 
+                if error_status == TOO_BIG and plan.get_too_big(len(oids_batch)):
+                    # Retry the batch with fewer OIDs
+                    continue
+                if not error_status:
+                    plan.get_succeeded(len(oids_batch), time.time() - started)
+
                 missing_results = []
 
                 for var in var_binds:
@@ -299,10 +487,36 @@ class SnmpCheck(AgentCheck):
                 self.warning(message)
 
             # if we fail move onto next batch
-            first_oid += self.oid_batch_size
+            first_oid += batch_size
 
         return all_binds, error
 
+    def _get_request_plan(self, config):
+        plan = config.request_plan
+        if plan is None:
+            plan = config.request_plan = RequestPlan(
+                self.oid_batch_size, self._MAX_REPETITIONS, config.timeout, config.adaptive_requests
+            )
+            if plan.adaptive:
+                cache = read_persistent_cache(self._request_plan_key(config))
+                if cache:
+                    try:
+                        plan.update(json.loads(cache))
+                    except Exception as e:
+                        self.log.debug('Ignoring the saved request plan of %s: %s', config.ip_address, e)
+
+        return plan
+
+    def _save_request_plan(self, config):
+        plan = config.request_plan
+        if plan is not None and plan.adaptive and plan.changed:
+            write_persistent_cache(self._request_plan_key(config), json.dumps(plan.to_dict()))
+            plan.changed = False
+
+    def _request_plan_key(self, config):
+        # Keep the key usable as a file name
+        return '{}_request_plan_{}'.format(self.check_id, config.ip_address.replace('.', '_').replace(':', '_'))
+
     def fetch_sysobject_oid(self, config):
         """Return the sysObjectID of the instance."""
         # Reference sysObjectID directly, see http://oidref.com/1.3.6.1.2.1.1.2
@@ -344,24 +558,29 @@ class SnmpCheck(AgentCheck):
                     self.warning(message)
 
             all_binds.extend(var_binds_table)
+
+            if config.past_deadline():
+                break
         return all_binds, error
 
     def _start_discovery(self):
         cache = read_persistent_cache(self.check_id)
         if cache:
-            hosts = json.loads(cache)
-            for host in hosts:
+            devices = json.loads(cache)
+            # Previous versions only saved the list of hosts
+            if isinstance(devices, list):
+                devices = {host: {} for host in devices}
+            now = time.time()
+            for host, device in devices.items():
                 try:
                     ipaddress.ip_address(host)
                 except ValueError:
-                    write_persistent_cache(self.check_id, json.dumps([]))
+                    write_persistent_cache(self.check_id, json.dumps({}))
                     break
-                instance = self.instance.copy()
-                instance.pop('network_address')
-                instance['ip_address'] = host
 
-                host_config = self._build_config(instance)
-                self._config.discovered_instances[host] = host_config
+                host_config = self._restore_host(host, device, now)
+                if host_config is not None:
+                    self._config.discovered_instances[host] = host_config
 
         self._thread = threading.Thread(target=self.discover_instances, name=self.name)
         self._thread.daemon = True
@@ -376,8 +595,10 @@ class SnmpCheck(AgentCheck):
         if self._config.ip_network:
             if self._thread is None:
                 self._start_discovery()
-            for host, discovered in list(config.discovered_instances.items()):
-                if self._check_with_config(discovered):
+            discovered_instances = list(config.discovered_instances.items())
+            errors = self._check_with_configs([discovered for _, discovered in discovered_instances])
+            for (host, _), error in zip(discovered_instances, errors):
+                if error:
                     config.failing_instances[host] += 1
                     if config.failing_instances[host] >= config.allowed_failures:
                         # Remove it from discovered instances, we'll re-discover it later if it reappears
@@ -393,25 +614,55 @@ class SnmpCheck(AgentCheck):
         else:
             self._check_with_config(config)
 
+    def _check_with_configs(self, configs):
+        """
+        Query the devices, up to `workers` at a time, and return their errors in order.
+        """
+        workers = min(self._config.workers, len(configs))
+        if workers <= 1:
+            return [self._check_with_config(config) for config in configs]
+
+        pool = Pool(workers, name=self.name)
+        try:
+            results = [pool.apply_async(self._check_with_config, (config,)) for config in configs]
+            return [result.get() for result in results]
+        finally:
+            pool.terminate()
+
     def _check_with_config(self, config):
         # Reset errors
         instance = config.instance
         error = table_results = raw_results = None
+        started = time.time()
+        config.start_deadline()
         try:
             if not (config.table_oids or config.raw_oids):
                 sys_object_oid = self.fetch_sysobject_oid(config)
                 profile = self._profile_for_sysobject_oid(sys_object_oid)
                 config.refresh_with_profile(self.profiles[profile], self.warning, self.log)
+                config.record_profile(sys_object_oid, profile)
 
             if config.table_oids:
                 self.log.debug('Querying device %s for %s oids', config.ip_address, len(config.table_oids))
-                table_results, error = self.check_table(config, config.table_oids)
-                self.report_table_metrics(config.metrics, table_results, config.tags)
+                with self.phase('fetch_table') as phase:
+                    table_results, error = self.check_table(config, config.table_oids)
+                    phase.add(len(config.table_oids))
+                with self.phase('submit'):
+                    self.report_table_metrics(config.metrics, table_results, config.tags)
 
             if config.raw_oids:
                 self.log.debug('Querying device %s for %s oids', config.ip_address, len(config.raw_oids))
-                raw_results, error = self.check_raw(config, config.raw_oids)
-                self.report_raw_metrics(config.metrics, raw_results, config.tags)
+                with self.phase('fetch_raw') as phase:
+                    raw_results, error = self.check_raw(config, config.raw_oids)
+                    phase.add(len(config.raw_oids))
+                with self.phase('submit'):
+                    self.report_raw_metrics(config.metrics, raw_results, config.tags)
+
+            if config.past_deadline():
+                error = 'Queries to instance {} exceeded the device timeout of {} seconds'.format(
+                    config.ip_address, config.device_timeout
+                )
+                self.warning(error)
         except CheckException as e:
             error = str(e)
             self.warning(error)
@@ -429,35 +680,38 @@ class SnmpCheck(AgentCheck):
                 if raw_results or table_results:
                     status = self.WARNING
             self.service_check(self.SC_STATUS, status, tags=sc_tags, message=error)
+            self._save_request_plan(config)
+
+            if self._telemetry:
+                self.gauge('snmp.telemetry.device.time', time.time() - started, tags=sc_tags, raw=True)
         return error
 
     def report_raw_metrics(self, metrics, results, tags):
         """
         For all the metrics that are specified as oid,
-        the conf oid is going to exactly match or be a prefix of the oid sent back by the device
+        the conf oid is going to exactly match or be a prefix of the oid sent back by the device,
+        `check_raw` already matched them.
         Use the instance configuration to find the name to give to the metric
 
         Submit the results to the aggregator.
         """
-        for metric in metrics:
-            if 'OID' in metric:
-                forced_type = metric.get('forced_type')
-                queried_oid = metric['OID'].lstrip('.')
-                if queried_oid in results:
-                    value = results[queried_oid]
-                else:
-                    for oid in results:
-                        if oid.startswith(queried_oid):
-                            value = results[oid]
-                            break
-                    else:
+        batches = defaultdict(list)
+        try:
+            for metric in metrics:
+                if 'OID' in metric:
+                    forced_type = metric.get('forced_type')
+                    queried_oid = metric['OID'].lstrip('.')
+                    if queried_oid not in results:
                         self.log.warning('No matching results found for oid %s', queried_oid)
                         continue
-                name = metric.get('name', 'unnamed_metric')
-                metric_tags = tags
-                if metric.get('metric_tags'):
-                    metric_tags = metric_tags + metric.get('metric_tags')
-                self.submit_metric(name, value, forced_type, metric_tags)
+                    value = results[queried_oid]
+                    name = metric.get('name', 'unnamed_metric')
+                    metric_tags = tags
+                    if metric.get('metric_tags'):
+                        metric_tags = metric_tags + metric.get('metric_tags')
+                    self._batch_metric(batches, name, value, forced_type, metric_tags)
+        finally:
+            self._submit_batches(batches)
 
     def report_table_metrics(self, metrics, results, tags):
         """
@@ -466,44 +720,48 @@ class SnmpCheck(AgentCheck):
 
         Submit the results to the aggregator.
         """
-        for metric in metrics:
-            forced_type = metric.get('forced_type')
-            if 'table' in metric:
-                index_based_tags = []
-                column_based_tags = []
-                for metric_tag in metric.get('metric_tags', []):
-                    tag_key = metric_tag['tag']
-                    if 'index' in metric_tag:
-                        index_based_tags.append((tag_key, metric_tag.get('index')))
-                    elif 'column' in metric_tag:
-                        column_based_tags.append((tag_key, metric_tag.get('column')))
-                    else:
-                        self.log.warning('No indication on what value to use for this tag')
-
-                for value_to_collect in metric.get('symbols', []):
-                    if value_to_collect not in results:
-                        self.log.debug('Ignoring metric %s from table %s', value_to_collect, metric['table'])
+        batches = defaultdict(list)
+        try:
+            for metric in metrics:
+                forced_type = metric.get('forced_type')
+                if 'table' in metric:
+                    index_based_tags = []
+                    column_based_tags = []
+                    for metric_tag in metric.get('metric_tags', []):
+                        tag_key = metric_tag['tag']
+                        if 'index' in metric_tag:
+                            index_based_tags.append((tag_key, metric_tag.get('index')))
+                        elif 'column' in metric_tag:
+                            column_based_tags.append((tag_key, metric_tag.get('column')))
+                        else:
+                            self.log.warning('No indication on what value to use for this tag')
+
+                    for value_to_collect in metric.get('symbols', []):
+                        if value_to_collect not in results:
+                            self.log.debug('Ignoring metric %s from table %s', value_to_collect, metric['table'])
+                            continue
+                        for index, val in iteritems(results[value_to_collect]):
+                            index_tags = self.get_index_tags(index, results, index_based_tags, column_based_tags)
+                            self._batch_metric(batches, value_to_collect, val, forced_type, tags + index_tags)
+
+                elif 'symbol' in metric:
+                    name = metric['symbol']
+                    if name not in results:
+                        self.log.debug('Ignoring metric %s', name)
                         continue
-                    for index, val in iteritems(results[value_to_collect]):
-                        metric_tags = tags + self.get_index_tags(index, results, index_based_tags, column_based_tags)
-                        self.submit_metric(value_to_collect, val, forced_type, metric_tags)
-
-            elif 'symbol' in metric:
-                name = metric['symbol']
-                if name not in results:
-                    self.log.debug('Ignoring metric %s', name)
-                    continue
-                result = list(results[name].items())
-                if len(result) > 1:
-                    self.log.warning('Several rows corresponding while the metric is supposed to be a scalar')
-                    continue
-                val = result[0][1]
-                metric_tags = tags + metric.get('metric_tags', [])
-                self.submit_metric(name, val, forced_type, metric_tags)
-            elif 'OID' in metric:
-                pass  # This one is already handled by the other batch of requests
-            else:
-                raise ConfigurationError('Unsupported metric in config file: {}'.format(metric))
+                    result = list(results[name].items())
+                    if len(result) > 1:
+                        self.log.warning('Several rows corresponding while the metric is supposed to be a scalar')
+                        continue
+                    val = result[0][1]
+                    metric_tags = tags + metric.get('metric_tags', [])
+                    self._batch_metric(batches, name, val, forced_type, metric_tags)
+                elif 'OID' in metric:
+                    pass  # This one is already handled by the other batch of requests
+                else:
+                    raise ConfigurationError('Unsupported metric in config file: {}'.format(metric))
+        finally:
+            self._submit_batches(batches)
 
     def get_index_tags(self, index, results, index_tags, column_tags):
         """
@@ -540,30 +798,36 @@ class SnmpCheck(AgentCheck):
             tags.append('{}:{}'.format(tag_group, tag_value))
         return tags
 
-    def submit_metric(self, name, snmp_value, forced_type, tags=None):
+    def _batch_metric(self, batches, name, snmp_value, forced_type, tags):
+        submission = self.get_submission(name, snmp_value, forced_type)
+        if submission is not None:
+            metric_type, metric_name, value = submission
+            batches[metric_type].append((metric_name, value, tags, None))
+
+    def _submit_batches(self, batches):
+        for metric_type, points in iteritems(batches):
+            self.submit_metrics(metric_type, points)
+
+    def get_submission(self, name, snmp_value, forced_type):
         """
-        Convert the values reported as pysnmp-Managed Objects to values and
-        report them to the aggregator.
+        Convert a value reported as pysnmp-Managed Object to the `(metric_type, metric_name, value)`
+        to submit, `metric_type` being the name of the submission method. Returns None if it can't be submitted.
         """
-        tags = [] if tags is None else tags
         if reply_invalid(snmp_value):
             # Metrics not present in the queried object
             self.log.warning('No such Mib available: %s', name)
-            return
+            return None
 
         metric_name = self.normalize(name, prefix='snmp')
 
         if forced_type:
             if forced_type.lower() == 'gauge':
-                value = int(snmp_value)
-                self.gauge(metric_name, value, tags)
+                return 'gauge', metric_name, int(snmp_value)
             elif forced_type.lower() == 'counter':
-                value = int(snmp_value)
-                self.rate(metric_name, value, tags)
+                return 'rate', metric_name, int(snmp_value)
             else:
                 self.warning('Invalid forced-type specified: {} in {}'.format(forced_type, name))
                 raise ConfigurationError('Invalid forced-type in config file: {}'.format(name))
-            return
 
         # Ugly hack but couldn't find a cleaner way
         # Proper way would be to use the ASN1 method isSameTypeWith but it
@@ -571,13 +835,9 @@ class SnmpCheck(AgentCheck):
         # and Counter64 for example
         snmp_class = snmp_value.__class__.__name__
         if snmp_class in SNMP_COUNTERS:
-            value = int(snmp_value)
-            self.rate(metric_name, value, tags)
-            return
+            return 'rate', metric_name, int(snmp_value)
         if snmp_class in SNMP_GAUGES:
-            value = int(snmp_value)
-            self.gauge(metric_name, value, tags)
-            return
+            return 'gauge', metric_name, int(snmp_value)
 
         if snmp_class == 'Opaque':
             # Try support for floats
@@ -586,8 +846,7 @@ class SnmpCheck(AgentCheck):
             except Exception:
                 pass
             else:
-                self.gauge(metric_name, value, tags)
-                return
+                return 'gauge', metric_name, value
 
         # Falls back to try to cast the value.
         try:
@@ -595,7 +854,7 @@ class SnmpCheck(AgentCheck):
         except ValueError:
             pass
         else:
-            self.gauge(metric_name, value, tags)
-            return
+            return 'gauge', metric_name, value
 
         self.log.warning('Unsupported metric type %s for %s', snmp_class, metric_name)
+        return None
@@ -31,6 +31,14 @@ def test_tabular_bulk(benchmark):
     benchmark(check.check, instance)
 
 
+def test_tabular_bulk_adaptive(benchmark):
+    instance = generate_instance_config(BULK_TABULAR_OBJECTS)
+    instance['adaptive_requests'] = True
+    check = create_check(instance)
+
+    benchmark(check.check, instance)
+
+
 def test_tabular_no_bulk(benchmark):
     instance = generate_instance_config(BULK_TABULAR_OBJECTS)
     # Don't use bulk requests
@@ -38,3 +46,12 @@ def test_tabular_no_bulk(benchmark):
     check = create_check(instance)
 
     benchmark(check.check, instance)
+
+
+def test_tabular_no_bulk_adaptive(benchmark):
+    instance = generate_instance_config(BULK_TABULAR_OBJECTS)
+    instance['bulk_threshold'] = 100
+    instance['adaptive_requests'] = True
+    check = create_check(instance)
+
+    benchmark(check.check, instance)
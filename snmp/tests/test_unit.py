@@ -2,16 +2,26 @@
 # All rights reserved
 # Licensed under Simplified BSD License (see LICENSE)
 
+import json
 import os
+import threading
 import time
 
 import mock
 import pytest
+from pysnmp import hlapi
+from pysnmp.proto.rfc1902 import Gauge32, Integer32, ObjectName
+from pysnmp.proto.rfc1905 import endOfMibView
 
 from datadog_checks.base import ConfigurationError
+from datadog_checks.base.errors import CheckException
+from datadog_checks.base.utils.containers import LRUCache
 from datadog_checks.dev import temp_dir
 from datadog_checks.snmp import SnmpCheck
 from datadog_checks.snmp.config import InstanceConfig
+from datadog_checks.snmp.planner import RequestPlan
+from datadog_checks.snmp.resolver import OIDResolver, OIDTrie
+from datadog_checks.snmp.snmp import TOO_BIG
 
 from . import common
 
@@ -179,6 +189,96 @@ def test_removing_host():
     assert warnings == [msg, msg, msg]
 
 
+def test_concurrent_discovered_hosts():
+    """Discovered hosts are queried concurrently, and their failures are counted like when they are queried in turn."""
+    instance = common.generate_instance_config(common.SUPPORTED_METRIC_TYPES)
+    instance.pop('ip_address')
+    instance['network_address'] = '192.168.0.0/24'
+    instance['workers'] = 3
+    check = SnmpCheck('snmp', {}, [instance])
+
+    hosts = ['192.168.0.{}'.format(i) for i in range(1, 7)]
+    for host in hosts:
+        check._config.discovered_instances[host] = mock.Mock(ip_address=host)
+
+    threads = set()
+
+    def check_with_config(config):
+        threads.add(threading.current_thread().name)
+        # Keep the thread busy for the other hosts to be queried by other threads
+        time.sleep(0.05)
+        if config.ip_address.endswith(('2', '5')):
+            return 'error'
+
+    with mock.patch.object(check, '_check_with_config', side_effect=check_with_config):
+        check.check(instance)
+
+    assert len(threads) > 1
+    assert dict(check._config.failing_instances) == {'192.168.0.2': 1, '192.168.0.5': 1}
+    assert sorted(check._config.discovered_instances) == hosts
+
+
+def test_concurrent_metric_submission(aggregator):
+    """Devices queried concurrently share the metric name cache of the check."""
+    instance = common.generate_instance_config(common.SUPPORTED_METRIC_TYPES)
+    check = SnmpCheck('snmp', {}, [instance])
+    # Names are evicted from the cache while other threads look them up
+    cache = check._metric_name_cache = LRUCache(4)
+    mark_used = cache._mark_used
+
+    def slow_mark_used(key):
+        time.sleep(0)
+        mark_used(key)
+
+    cache._mark_used = slow_mark_used
+    metrics = [{'OID': '1.3.6.1.{}'.format(i), 'name': 'metric{}'.format(i)} for i in range(6)]
+    results = {'1.3.6.1.{}'.format(i): Gauge32(i) for i in range(6)}
+    start = threading.Event()
+
+    def report(device):
+        start.wait()
+        for i in range(100):
+            # Going back and forth, the last names reported are still in the cache
+            check.report_raw_metrics(metrics[:: (-1) ** i], results, ['device:{}'.format(device)])
+
+    threads = [threading.Thread(target=report, args=(device,)) for device in range(5)]
+    for thread in threads:
+        thread.start()
+    start.set()
+    for thread in threads:
+        thread.join()
+
+    for device in range(5):
+        for i in range(6):
+            aggregator.assert_metric('snmp.metric{}'.format(i), value=i, tags=['device:{}'.format(device)], count=100)
+
+
+def test_device_timeout(aggregator):
+    instance = common.generate_instance_config(common.SUPPORTED_METRIC_TYPES)
+    instance['ip_address'] = '1.1.1.1'
+    instance['device_timeout'] = 5
+    instance['telemetry'] = True
+    check = SnmpCheck('snmp', {}, [instance])
+
+    # The deadline is past as soon as it's started, the device must not be queried
+    time_mock = mock.Mock()
+    time_mock.time.side_effect = [0] + [10] * 10
+    with mock.patch('datadog_checks.snmp.config.time', time_mock), mock.patch.object(
+        check._config, 'call_cmd'
+    ) as call_cmd:
+        check.check(instance)
+
+    assert not call_cmd.called
+    tags = ['snmp_device:1.1.1.1']
+    aggregator.assert_service_check(
+        SnmpCheck.SC_STATUS,
+        status=SnmpCheck.CRITICAL,
+        tags=tags,
+        message='Queries to instance 1.1.1.1 exceeded the device timeout of 5.0 seconds',
+    )
+    aggregator.assert_metric('snmp.telemetry.device.time', tags=tags)
+
+
 @mock.patch("datadog_checks.snmp.snmp.read_persistent_cache")
 def test_cache_discovered_host(read_mock):
     instance = common.generate_instance_config(common.SUPPORTED_METRIC_TYPES)
@@ -203,7 +303,7 @@ def test_cache_corrupted(write_mock, read_mock):
     check.check(instance)
 
     assert not check._config.discovered_instances
-    write_mock.assert_called_once_with('', '[]')
+    write_mock.assert_called_once_with('', '{}')
 
 
 @mock.patch("datadog_checks.snmp.snmp.read_persistent_cache")
@@ -232,4 +332,340 @@ def test_cache_building(write_mock, read_mock):
     finally:
         check._running = False
 
-    write_mock.assert_called_once_with('', '["192.168.0.1"]')
+    write_mock.assert_called_once_with('', '{"192.168.0.1": {}}')
+
+
+@mock.patch("datadog_checks.snmp.snmp.read_persistent_cache")
+@mock.patch("datadog_checks.snmp.snmp.write_persistent_cache")
+def test_cache_profiles(write_mock, read_mock):
+    instance = common.generate_instance_config([])
+    instance.pop('ip_address')
+    instance['network_address'] = '192.168.0.0/29'
+    init_config = {
+        'profiles': {
+            'profile1': {'definition': {'metrics': common.SUPPORTED_METRIC_TYPES, 'sysobjectid': '1.3.6.1.4.1.8072.*'}}
+        }
+    }
+    now = time.time()
+    # Saved with another `oid_batch_size`
+    plan = {
+        'batch': {'size': 5, 'limit': None, 'known_good': 5},
+        'bulk': {'size': 10, 'limit': None, 'known_good': 10},
+        'rows': {'1.3.6.1.2.1.2.2.1': 3},
+    }
+    devices = {
+        '192.168.0.1': {
+            'sys_object_oid': '1.3.6.1.4.1.8072.3.2.10',
+            'profile': 'profile1',
+            'resolved_at': now - 60,
+            'request_plan': plan,
+        },
+        # Resolved too long ago
+        '192.168.0.2': {'sys_object_oid': '1.3.6.1.4.1.8072.3.2.10', 'profile': 'profile1', 'resolved_at': now - 90000},
+        # Resolved with a profile that was removed
+        '192.168.0.3': {'sys_object_oid': '1.3.6.1.4.1.8072.3.2.10', 'profile': 'profile2', 'resolved_at': now - 60},
+        # Saved by a previous version
+        '192.168.0.4': {},
+    }
+    read_mock.return_value = json.dumps(devices)
+
+    check = SnmpCheck('snmp', init_config, [instance])
+    # Don't scan the network
+    check._running = False
+    with mock.patch.object(check, 'fetch_sysobject_oid') as fetch_mock:
+        check._start_discovery()
+    check._thread.join()
+
+    discovered = check._config.discovered_instances
+    assert sorted(discovered) == ['192.168.0.1', '192.168.0.4']
+    assert fetch_mock.call_count == 0
+    # Queries are ready without fetching the sysObjectID of the device
+    assert len(discovered['192.168.0.1'].raw_oids) == len(common.SUPPORTED_METRIC_TYPES)
+    # The request sizes are the configured ones
+    restored_plan = discovered['192.168.0.1'].request_plan.to_dict()
+    assert restored_plan == {
+        'batch': {'size': check.oid_batch_size, 'limit': None, 'known_good': check.oid_batch_size},
+        'bulk': {'size': check._MAX_REPETITIONS, 'limit': None, 'known_good': check._MAX_REPETITIONS},
+        'rows': plan['rows'],
+    }
+    assert not (discovered['192.168.0.4'].table_oids or discovered['192.168.0.4'].raw_oids)
+
+    check._write_discovery_cache()
+    saved = json.loads(write_mock.call_args[0][1])
+    assert saved == {'192.168.0.1': dict(devices['192.168.0.1'], request_plan=restored_plan), '192.168.0.4': {}}
+
+
+def test_oid_trie():
+    trie = OIDTrie(['1.3.6.1.2.1.1.3.0', '.1.3.6.1.2.1.2', '1.3.6.1.2.1.25', '1.3.6.1.4', 'sysUpTime'])
+    results = [
+        ((1, 3, 6, 1, 2, 1, 2, 2, 1, 10, 1), 'first'),
+        ((1, 3, 6, 1, 2, 1, 1, 3, 0), 'exact'),
+        ((1, 3, 6, 1, 2, 1, 2), 'exact'),
+        ((1, 3, 6, 1, 2, 1, 2, 2, 1, 10, 2), 'second'),
+        # A prefix of the components, not of the string
+        ((1, 3, 6, 1, 2, 1, 250, 1), 'other'),
+        ((1, 3, 6, 1, 4, 1, 1), 'first'),
+        ((1, 3, 6, 1, 4, 1, 2), 'second'),
+    ]
+
+    assert trie.match(results) == {
+        '1.3.6.1.2.1.1.3.0': 'exact',
+        '1.3.6.1.2.1.2': 'exact',
+        '1.3.6.1.4': 'first',
+    }
+
+
+@mock.patch("datadog_checks.snmp.resolver.hlapi")
+def test_oid_resolver(hlapi_mock):
+    identity = hlapi_mock.ObjectIdentity.return_value.loadMibs.return_value
+    identity.resolveWithMib.return_value.getMibSymbol.side_effect = lambda: ('IF-MIB', 'ifInOctets', (1,))
+    resolver = OIDResolver(mock.Mock(), {'IF-MIB'})
+    oid = (1, 3, 6, 1, 2, 1, 2, 2, 1, 10, 1)
+
+    assert resolver.resolve(oid) == ('ifInOctets', (1,))
+    resolver.next_run()
+    assert resolver.resolve(oid) == ('ifInOctets', (1,))
+    resolver.next_run()
+    assert identity.resolveWithMib.call_count == 1
+
+    # The OID was not sent back during a whole run
+    resolver.next_run()
+    resolver.next_run()
+    resolver.resolve(oid)
+    assert identity.resolveWithMib.call_count == 2
+
+
+def test_resolvers_rebuilt_with_profile():
+    instance = common.generate_instance_config(common.SUPPORTED_METRIC_TYPES)
+    check = SnmpCheck('snmp', {}, [instance])
+    config = check._config
+    resolver = config.resolver
+
+    profile = {'definition': {'metrics': [{'OID': '1.2.3', 'name': 'foo'}]}}
+    config.refresh_with_profile(profile, check.warning, check.log)
+
+    assert config.resolver is not resolver
+    assert config.oid_trie.match([((1, 2, 3, 0), 1)]) == {'1.2.3': 1}
+
+
+def test_request_plan_fixed():
+    plan = RequestPlan(10, 25, 1)
+
+    plan.get_succeeded(10, 0.01)
+    plan.bulk_succeeded(25, 5, 25, 0.01)
+    assert not plan.get_too_big(10)
+    assert not plan.bulk_too_big(25)
+    assert plan.batch_size == 10
+    assert plan.bulk.size == 25
+    assert not plan.changed
+
+
+def test_request_plan_adaptive():
+    plan = RequestPlan(10, 25, 1, adaptive=True)
+
+    # Full and fast requests grow
+    plan.get_succeeded(10, 0.01)
+    assert plan.batch_size == 13
+    plan.bulk_succeeded(25, 5, 25, 0.01)
+    assert plan.bulk.size == 32
+    assert plan.changed
+
+    # Requests the device can't answer shrink, and the sizes don't grow back past the failure
+    assert plan.get_too_big(13)
+    assert plan.batch_size == 6
+    for _ in range(10):
+        plan.get_succeeded(plan.batch_size, 0.01)
+    assert plan.batch_size == 12
+
+    # Truncated responses set the size to what the device sent
+    plan.bulk_succeeded(30, 5, 20, 0.01)
+    assert plan.bulk.size == 20
+
+    # Slow responses shrink
+    plan.bulk_succeeded(20, 5, 20, 0.9)
+    assert plan.bulk.size == 16
+
+    # Timeouts of requests not larger than the ones answered don't
+    plan.bulk_timed_out(16)
+    assert plan.bulk.size == 16
+
+    plan.record_rows([(1, 3, 6, 1, 2, 1, 2, 2, 1, 2)], [3])
+    restored = RequestPlan(10, 25, 1, adaptive=True)
+    restored.update(plan.to_dict())
+    assert restored.to_dict() == plan.to_dict()
+
+    # Only the rows of fixed plans are restored
+    fixed = RequestPlan(10, 25, 1)
+    fixed.update(plan.to_dict())
+    assert fixed.batch_size == 10
+    assert fixed.bulk.size == 25
+    assert fixed.rows == plan.rows
+
+
+def test_request_plan_error_status():
+    """Responses with an error don't count as supported request sizes."""
+    instance = common.generate_instance_config(common.SUPPORTED_METRIC_TYPES)
+    instance['adaptive_requests'] = True
+    check = SnmpCheck('snmp', {}, [instance])
+    config = check._config
+    oids = list(range(check.oid_batch_size * 3))
+
+    # Every request fails with a genErr
+    with mock.patch.object(config, 'call_cmd', side_effect=lambda *args, **kwargs: iter([(None, 5, 0, [])])):
+        check.fetch_oids(config, oids, False)
+
+    plan = check._get_request_plan(config)
+    assert plan.batch.known_good == check.oid_batch_size
+    assert plan.batch_size == check.oid_batch_size
+
+
+def test_request_plan_column_chunks():
+    plan = RequestPlan(10, 20, 1)
+    if_table = [(1, 3, 6, 1, 2, 1, 2, 2, 1, column) for column in range(1, 7)]
+    ip_table = [(1, 3, 6, 1, 2, 1, 4, 31, 1, 1, column) for column in range(3, 6)]
+
+    # Tables of unknown size are walked a few rows at a time
+    assert plan.column_chunks(if_table + ip_table) == [
+        (5, if_table[:4]),
+        (5, if_table[4:] + ip_table[:2]),
+        (5, ip_table[2:]),
+    ]
+
+    plan.record_rows(if_table, [3] * 6)
+    plan.record_rows(ip_table, [1, 1, 0])
+    assert plan.changed
+
+    # Columns of tables with fewer rows come first, and all the rows of a table are fetched at once
+    assert plan.column_chunks(if_table + ip_table) == [(4, ip_table + if_table[:2]), (4, if_table[2:])]
+    plan.record_rows(if_table, [9] * 6)
+    assert plan.column_chunks(if_table + ip_table) == [
+        (2, ip_table),
+        (10, if_table[:2]),
+        (10, if_table[2:4]),
+        (10, if_table[4:]),
+    ]
+
+
+class BulkAgent(object):
+    """
+    Answer the GETBULK requests of `call_cmd` from a list of OIDs, in the order the agent walks them.
+    The requests larger than `max_size` variables are answered with a tooBig error status.
+    """
+
+    def __init__(self, oids, mib_view_controller, max_size=None):
+        self.oids = oids
+        self.mib_view_controller = mib_view_controller
+        self.max_size = max_size
+        self.requests = []
+
+    def next_oid(self, oid):
+        if oid in self.oids:
+            index = self.oids.index(oid) + 1
+            return self.oids[index] if index < len(self.oids) else None
+        return next((next_oid for next_oid in sorted(self.oids) if next_oid > oid), None)
+
+    def __call__(self, cmd, non_repeaters, max_repetitions, *var_binds, **kwargs):
+        positions = [var_bind.resolveWithMib(self.mib_view_controller)[0].getOid().asTuple() for var_bind in var_binds]
+        self.requests.append((max_repetitions, list(positions)))
+        if self.max_size is not None and max_repetitions * len(positions) > self.max_size:
+            return iter([(None, Integer32(TOO_BIG), 0, [])])
+
+        rows = []
+        for _ in range(max_repetitions):
+            row = []
+            for i, position in enumerate(positions):
+                oid = self.next_oid(position)
+                if oid is None:
+                    row.append((ObjectName(position), endOfMibView))
+                else:
+                    row.append((ObjectName(oid), Integer32(oid[-1])))
+                    positions[i] = oid
+            rows.append(row)
+        return iter([(None, 0, 0, row) for row in rows])
+
+
+def walk_columns(check, agent, prefixes, max_repetitions):
+    config = check._config
+    with mock.patch.object(config, 'call_cmd', side_effect=agent):
+        binds, error = check._walk_columns(config, prefixes, max_repetitions, False)
+    return [result_oid.asTuple() for result_oid, _ in binds], error
+
+
+def test_walk_columns_end_of_mib():
+    check = SnmpCheck('snmp', {}, [common.generate_instance_config(common.SUPPORTED_METRIC_TYPES)])
+    column = (1, 3, 6, 1, 2, 1, 2, 2, 1, 1)
+    agent = BulkAgent([column + (1,), column + (2,)], check._config.mib_view_controller)
+
+    assert walk_columns(check, agent, [column], 5) == ([column + (1,), column + (2,)], None)
+    assert len(agent.requests) == 1
+    assert check._get_request_plan(check._config).rows == {column[:-1]: 2}
+
+
+def test_walk_columns_different_lengths():
+    """Each column stops once its OIDs leave it, the other columns are walked further."""
+    check = SnmpCheck('snmp', {}, [common.generate_instance_config(common.SUPPORTED_METRIC_TYPES)])
+    if_index = (1, 3, 6, 1, 2, 1, 2, 2, 1, 1)
+    if_descr = (1, 3, 6, 1, 2, 1, 2, 2, 1, 2)
+    ip_address = (1, 3, 6, 1, 2, 1, 4, 20, 1, 1)
+    oids = [if_index + (i,) for i in (1, 2, 3)] + [if_descr + (i,) for i in (1, 2, 3)] + [ip_address + (1,)]
+    agent = BulkAgent(oids, check._config.mib_view_controller)
+
+    walked, error = walk_columns(check, agent, [if_index, ip_address], 2)
+
+    assert error is None
+    assert sorted(walked) == [if_index + (1,), if_index + (2,), if_index + (3,), ip_address + (1,)]
+    # ipAddrTable is walked with the first response, the next request only continues ifIndex, sized by the plan
+    assert agent.requests == [(2, [if_index, ip_address]), (check._MAX_REPETITIONS, [if_index + (2,)])]
+    assert check._get_request_plan(check._config).rows == {if_index[:-1]: 3, ip_address[:-1]: 1}
+
+
+def test_walk_columns_non_increasing_oid():
+    column = (1, 3, 6, 1, 2, 1, 2, 2, 1, 1)
+    oids = [column + (1,), column + (3,), column + (2,)]
+
+    check = SnmpCheck('snmp', {}, [common.generate_instance_config(common.SUPPORTED_METRIC_TYPES)])
+    agent = BulkAgent(oids, check._config.mib_view_controller)
+    with pytest.raises(CheckException, match='OID not increasing'):
+        walk_columns(check, agent, [column], 5)
+
+    check = SnmpCheck(
+        'snmp', common.IGNORE_NONINCREASING_OID, [common.generate_instance_config(common.SUPPORTED_METRIC_TYPES)]
+    )
+    agent = BulkAgent(oids, check._config.mib_view_controller)
+    assert walk_columns(check, agent, [column], 5) == (oids, None)
+
+
+def test_fetch_columns_too_big():
+    """Requests the device can't answer are retried with fewer repetitions."""
+    instance = common.generate_instance_config(common.SUPPORTED_METRIC_TYPES)
+    instance['adaptive_requests'] = True
+    check = SnmpCheck('snmp', {}, [instance])
+    config = check._config
+    column = (1, 3, 6, 1, 2, 1, 2, 2, 1, 1)
+    oids = [column + (i,) for i in range(1, 11)]
+    agent = BulkAgent(oids, config.mib_view_controller, max_size=4)
+
+    with mock.patch.object(config, 'call_cmd', side_effect=agent):
+        binds, error = check.fetch_columns(config, [hlapi.ObjectType(hlapi.ObjectIdentity(column))], False)
+
+    assert error is None
+    assert [result_oid.asTuple() for result_oid, _ in binds] == oids
+    max_repetitions, _ = agent.requests[0]
+    assert max_repetitions > 4
+    assert all(max_repetitions <= 4 for max_repetitions, _ in agent.requests[1:])
+    assert check._get_request_plan(config).bulk.size <= 4
+
+
+def test_fetch_columns_too_big_fixed():
+    """Without adaptive requests, the error is reported instead."""
+    check = SnmpCheck('snmp', {}, [common.generate_instance_config(common.SUPPORTED_METRIC_TYPES)])
+    config = check._config
+    column = (1, 3, 6, 1, 2, 1, 2, 2, 1, 1)
+    agent = BulkAgent([column + (i,) for i in range(1, 11)], config.mib_view_controller, max_size=4)
+
+    with mock.patch.object(config, 'call_cmd', side_effect=agent):
+        binds, error = check.fetch_columns(config, [hlapi.ObjectType(hlapi.ObjectIdentity(column))], False)
+
+    assert binds == []
+    assert error
+    assert len(agent.requests) == 1
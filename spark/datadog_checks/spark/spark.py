@@ -2,6 +2,8 @@
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
 
+from functools import partial
+
 from bs4 import BeautifulSoup
 from requests.exceptions import ConnectionError, HTTPError, InvalidURL, Timeout
 from simplejson import JSONDecodeError
@@ -52,6 +54,9 @@ SUCCESS_STATUS = ['SUCCEEDED', 'COMPLETE']
 # Event source type
 SOURCE_TYPE_NAME = 'spark'
 
+# Number of Spark applications queried at the same time
+DEFAULT_MAX_CONCURRENT_REQUESTS = 1
+
 # Metric types
 GAUGE = 'gauge'
 COUNT = 'count'
@@ -141,6 +146,16 @@ SPARK_STREAMING_STATISTICS_METRICS = {
 }
 
 
+def get_outcome(response, error):
+    """
+    Return the response of a batched request, or raise the error it failed with
+    """
+    if error is not None:
+        raise error
+
+    return response
+
+
 class SparkCheck(AgentCheck):
     HTTP_CONFIG_REMAPPER = {
         'ssl_verify': {'name': 'tls_verify'},
@@ -431,13 +446,7 @@ class SparkCheck(AgentCheck):
         """
         Get metrics for each Spark job.
         """
-        for app_id, (app_name, tracking_url) in iteritems(running_apps):
-
-            base_url = self._get_request_url(instance, tracking_url)
-            response = self._rest_request_to_json(
-                base_url, SPARK_APPS_PATH, SPARK_SERVICE_CHECK, addl_tags, app_id, 'jobs'
-            )
-
+        for app_name, response in self._spark_apps_to_json(instance, running_apps, addl_tags, 'jobs'):
             for job in response:
 
                 status = job.get('status')
@@ -453,13 +462,7 @@ class SparkCheck(AgentCheck):
         """
         Get metrics for each Spark stage.
         """
-        for app_id, (app_name, tracking_url) in iteritems(running_apps):
-
-            base_url = self._get_request_url(instance, tracking_url)
-            response = self._rest_request_to_json(
-                base_url, SPARK_APPS_PATH, SPARK_SERVICE_CHECK, addl_tags, app_id, 'stages'
-            )
-
+        for app_name, response in self._spark_apps_to_json(instance, running_apps, addl_tags, 'stages'):
             for stage in response:
 
                 status = stage.get('status')
@@ -475,13 +478,7 @@ class SparkCheck(AgentCheck):
         """
         Get metrics for each Spark executor.
         """
-        for app_id, (app_name, tracking_url) in iteritems(running_apps):
-
-            base_url = self._get_request_url(instance, tracking_url)
-            response = self._rest_request_to_json(
-                base_url, SPARK_APPS_PATH, SPARK_SERVICE_CHECK, addl_tags, app_id, 'executors'
-            )
-
+        for app_name, response in self._spark_apps_to_json(instance, running_apps, addl_tags, 'executors'):
             tags = ['app_name:%s' % str(app_name)]
             tags.extend(addl_tags)
 
@@ -498,13 +495,7 @@ class SparkCheck(AgentCheck):
         """
         Get metrics for each Spark RDD.
         """
-        for app_id, (app_name, tracking_url) in iteritems(running_apps):
-
-            base_url = self._get_request_url(instance, tracking_url)
-            response = self._rest_request_to_json(
-                base_url, SPARK_APPS_PATH, SPARK_SERVICE_CHECK, addl_tags, app_id, 'storage/rdd'
-            )
-
+        for app_name, response in self._spark_apps_to_json(instance, running_apps, addl_tags, 'storage/rdd'):
             tags = ['app_name:%s' % str(app_name)]
             tags.extend(addl_tags)
 
@@ -569,7 +560,14 @@ class SparkCheck(AgentCheck):
         Query the given URL and return the response
         """
         service_check_tags = ['url:%s' % self._get_url_base(url)] + tags
+        url = self._build_request_url(url, object_path, *args, **kwargs)
+
+        return self._check_response(url, service_name, service_check_tags, lambda: self.http.get(url))
 
+    def _build_request_url(self, url, object_path, *args, **kwargs):
+        """
+        Join the object path, the directories and the query arguments to the given URL
+        """
         if object_path:
             url = self._join_url_dir(url, object_path)
 
@@ -583,9 +581,15 @@ class SparkCheck(AgentCheck):
             query = '&'.join(['{0}={1}'.format(key, value) for key, value in iteritems(kwargs)])
             url = urljoin(url, '?' + query)
 
+        return url
+
+    def _check_response(self, url, service_name, service_check_tags, send):
+        """
+        Get the response of the request to the given URL from `send`, report failures and return it
+        """
         try:
             self.log.debug('Spark check URL: %s' % url)
-            response = self.http.get(url)
+            response = send()
 
             response.raise_for_status()
 
@@ -620,6 +624,12 @@ class SparkCheck(AgentCheck):
         """
         response = self._rest_request(address, object_path, service_name, tags, *args, **kwargs)
 
+        return self._response_to_json(response, address, service_name, tags)
+
+    def _response_to_json(self, response, address, service_name, tags):
+        """
+        Return the JSON body of a response
+        """
         try:
             response_json = response.json()
 
@@ -634,6 +644,40 @@ class SparkCheck(AgentCheck):
 
         return response_json
 
+    def _spark_apps_to_json(self, instance, running_apps, addl_tags, *args):
+        """
+        Query the given path of the API of every running application, and yield the name of the
+        application along with the JSON response, in the order of the applications.
+
+        With `max_concurrent_requests` greater than 1, all the applications are queried concurrently
+        before the first response is returned, otherwise they are queried one at a time.
+        """
+        concurrency = int(instance.get('max_concurrent_requests', DEFAULT_MAX_CONCURRENT_REQUESTS))
+
+        apps = [
+            (app_id, app_name, self._get_request_url(instance, tracking_url))
+            for app_id, (app_name, tracking_url) in iteritems(running_apps)
+        ]
+
+        if concurrency <= 1:
+            for app_id, app_name, base_url in apps:
+                yield app_name, self._rest_request_to_json(
+                    base_url, SPARK_APPS_PATH, SPARK_SERVICE_CHECK, addl_tags, app_id, *args
+                )
+            return
+
+        urls = [self._build_request_url(base_url, SPARK_APPS_PATH, app_id, *args) for app_id, _, base_url in apps]
+        outcomes = self.http.batch([('get', url) for url in urls], concurrency=concurrency)
+
+        # Failures are reported in order, as if the applications were queried one at a time
+        for (_, app_name, base_url), url, outcome in zip(apps, urls, outcomes):
+            service_check_tags = ['url:%s' % self._get_url_base(base_url)] + addl_tags
+            response = self._check_response(
+                url, SPARK_SERVICE_CHECK, service_check_tags, partial(get_outcome, *outcome)
+            )
+
+            yield app_name, self._response_to_json(response, base_url, SPARK_SERVICE_CHECK, addl_tags)
+
     @classmethod
     def _join_url_dir(cls, url, *args):
         """
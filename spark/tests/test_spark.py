@@ -613,6 +613,29 @@ def test_yarn(aggregator):
         aggregator.assert_all_metrics_covered()
 
 
+@pytest.mark.unit
+def test_yarn_concurrent_requests(aggregator):
+    instance = dict(YARN_CONFIG, tags=list(CUSTOM_TAGS), max_concurrent_requests=4)
+    with mock.patch('requests.get', yarn_requests_get_mock):
+        c = SparkCheck('spark', {}, [instance])
+        c.check(instance)
+
+        for metric, value in iteritems(SPARK_JOB_SUCCEEDED_METRIC_VALUES):
+            aggregator.assert_metric(metric, value=value, tags=SPARK_JOB_SUCCEEDED_METRIC_TAGS + CUSTOM_TAGS)
+
+        for metric, value in iteritems(SPARK_STAGE_RUNNING_METRIC_VALUES):
+            aggregator.assert_metric(metric, value=value, tags=SPARK_STAGE_RUNNING_METRIC_TAGS + CUSTOM_TAGS)
+
+        for metric, value in iteritems(SPARK_EXECUTOR_METRIC_VALUES):
+            aggregator.assert_metric(metric, value=value, tags=SPARK_METRIC_TAGS + CUSTOM_TAGS)
+
+        for metric, value in iteritems(SPARK_RDD_METRIC_VALUES):
+            aggregator.assert_metric(metric, value=value, tags=SPARK_METRIC_TAGS + CUSTOM_TAGS)
+
+        for sc in aggregator.service_checks(SPARK_SERVICE_CHECK):
+            assert sc.status == SparkCheck.OK
+
+
 @pytest.mark.unit
 def test_auth_yarn(aggregator):
     with mock.patch('requests.get', yarn_requests_auth_mock):
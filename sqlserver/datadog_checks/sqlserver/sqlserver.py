@@ -487,35 +487,38 @@ class SQLServer(AgentCheck):
             metrics_to_collect = self.instances_metrics[instance_key]
 
             with self.get_managed_cursor(instance, self.DEFAULT_DB_KEY) as cursor:
-                simple_rows = SqlSimpleMetric.fetch_all_values(cursor, instance_by_key["SqlSimpleMetric"], self.log)
-                fraction_results = SqlFractionMetric.fetch_all_values(
-                    cursor, instance_by_key["SqlFractionMetric"], self.log
-                )
-                waitstat_rows, waitstat_cols = SqlOsWaitStat.fetch_all_values(
-                    cursor, instance_by_key["SqlOsWaitStat"], self.log
-                )
-                vfs_rows, vfs_cols = SqlIoVirtualFileStat.fetch_all_values(
-                    cursor, instance_by_key["SqlIoVirtualFileStat"], self.log
-                )
-                clerk_rows, clerk_cols = SqlOsMemoryClerksStat.fetch_all_values(
-                    cursor, instance_by_key["SqlOsMemoryClerksStat"], self.log  # noqa: E501
-                )
+                with self.phase('query'):
+                    simple_rows = SqlSimpleMetric.fetch_all_values(cursor, instance_by_key["SqlSimpleMetric"], self.log)
+                    fraction_results = SqlFractionMetric.fetch_all_values(
+                        cursor, instance_by_key["SqlFractionMetric"], self.log
+                    )
+                    waitstat_rows, waitstat_cols = SqlOsWaitStat.fetch_all_values(
+                        cursor, instance_by_key["SqlOsWaitStat"], self.log
+                    )
+                    vfs_rows, vfs_cols = SqlIoVirtualFileStat.fetch_all_values(
+                        cursor, instance_by_key["SqlIoVirtualFileStat"], self.log
+                    )
+                    clerk_rows, clerk_cols = SqlOsMemoryClerksStat.fetch_all_values(
+                        cursor, instance_by_key["SqlOsMemoryClerksStat"], self.log  # noqa: E501
+                    )
 
-                for metric in metrics_to_collect:
-                    try:
-                        if type(metric) is SqlSimpleMetric:
-                            metric.fetch_metric(cursor, simple_rows, custom_tags)
-                        elif type(metric) is SqlFractionMetric or type(metric) is SqlIncrFractionMetric:
-                            metric.fetch_metric(cursor, fraction_results, custom_tags)
-                        elif type(metric) is SqlOsWaitStat:
-                            metric.fetch_metric(cursor, waitstat_rows, waitstat_cols, custom_tags)
-                        elif type(metric) is SqlIoVirtualFileStat:
-                            metric.fetch_metric(cursor, vfs_rows, vfs_cols, custom_tags)
-                        elif type(metric) is SqlOsMemoryClerksStat:
-                            metric.fetch_metric(cursor, clerk_rows, clerk_cols, custom_tags)
-
-                    except Exception as e:
-                        self.log.warning("Could not fetch metric {} : {}".format(metric.datadog_name, e))
+                with self.phase('submit') as phase:
+                    for metric in metrics_to_collect:
+                        try:
+                            if type(metric) is SqlSimpleMetric:
+                                metric.fetch_metric(cursor, simple_rows, custom_tags)
+                            elif type(metric) is SqlFractionMetric or type(metric) is SqlIncrFractionMetric:
+                                metric.fetch_metric(cursor, fraction_results, custom_tags)
+                            elif type(metric) is SqlOsWaitStat:
+                                metric.fetch_metric(cursor, waitstat_rows, waitstat_cols, custom_tags)
+                            elif type(metric) is SqlIoVirtualFileStat:
+                                metric.fetch_metric(cursor, vfs_rows, vfs_cols, custom_tags)
+                            elif type(metric) is SqlOsMemoryClerksStat:
+                                metric.fetch_metric(cursor, clerk_rows, clerk_cols, custom_tags)
+
+                        except Exception as e:
+                            self.log.warning("Could not fetch metric {} : {}".format(metric.datadog_name, e))
+                    phase.add(len(metrics_to_collect))
 
     def do_stored_procedure_check(self, instance, proc):
         """
@@ -531,29 +534,32 @@ class SQLServer(AgentCheck):
 
             try:
                 self.log.debug("Calling Stored Procedure : {}".format(proc))
-                if self._get_connector(instance) == 'adodbapi':
-                    cursor.callproc(proc)
-                else:
-                    # pyodbc does not support callproc; use execute instead.
-                    # Reference: https://github.com/mkleehammer/pyodbc/wiki/Calling-Stored-Procedures
-                    call_proc = '{{CALL {}}}'.format(proc)
-                    cursor.execute(call_proc)
+                with self.phase('query'):
+                    if self._get_connector(instance) == 'adodbapi':
+                        cursor.callproc(proc)
+                    else:
+                        # pyodbc does not support callproc; use execute instead.
+                        # Reference: https://github.com/mkleehammer/pyodbc/wiki/Calling-Stored-Procedures
+                        call_proc = '{{CALL {}}}'.format(proc)
+                        cursor.execute(call_proc)
 
-                rows = cursor.fetchall()
+                    rows = cursor.fetchall()
                 self.log.debug("Row count ({}) : {}".format(proc, cursor.rowcount))
 
-                for row in rows:
-                    tags = [] if row.tags is None or row.tags == '' else row.tags.split(',')
-                    tags.extend(custom_tags)
-
-                    if row.type.lower() in self.proc_type_mapping:
-                        self.proc_type_mapping[row.type](row.metric, row.value, tags)
-                    else:
-                        self.log.warning(
-                            '{} is not a recognised type from procedure {}, metric {}'.format(
-                                row.type, proc, row.metric
+                with self.phase('submit') as phase:
+                    for row in rows:
+                        tags = [] if row.tags is None or row.tags == '' else row.tags.split(',')
+                        tags.extend(custom_tags)
+
+                        if row.type.lower() in self.proc_type_mapping:
+                            self.proc_type_mapping[row.type](row.metric, row.value, tags)
+                        else:
+                            self.log.warning(
+                                '{} is not a recognised type from procedure {}, metric {}'.format(
+                                    row.type, proc, row.metric
+                                )
                             )
-                        )
+                    phase.add(len(rows))
 
             except Exception as e:
                 self.log.warning("Could not call procedure {}: {}".format(proc, e))
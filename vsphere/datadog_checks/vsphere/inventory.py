@@ -0,0 +1,66 @@
+# (C) Datadog, Inc. 2020
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+from pyVmomi import vmodl  # pylint: disable=E0611
+
+
+class Inventory:
+    """
+    Properties of the managed objects of a vCenter, kept up to date with a dedicated property collector:
+    the first update collects all the objects, the next ones only the changes made since the previous one.
+
+    For each object, `objects` maps: mor --> {property path: value}
+    """
+
+    def __init__(self, property_collector, filter_spec, max_objects=None):
+        self._collector = property_collector.CreatePropertyCollector()
+        # Report the whole value of the collected properties when they change
+        self._collector.CreateFilter(filter_spec, partialUpdates=False)
+        # Don't wait for changes, return the ones already there
+        self._options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=0, maxObjectUpdates=max_objects)
+        self._version = ''
+        self.objects = {}
+
+    def update(self):
+        """
+        Apply the changes made since the previous update.
+        Return the sets of objects that were added or modified, and of objects that were removed.
+        """
+        changed = set()
+        removed = set()
+        while True:
+            update_set = self._collector.WaitForUpdatesEx(self._version, self._options)
+            if update_set is None:
+                break
+
+            self._version = update_set.version
+            for filter_update in update_set.filterSet:
+                for object_update in filter_update.objectSet:
+                    obj = object_update.obj
+                    if object_update.kind == 'leave':
+                        self.objects.pop(obj, None)
+                        changed.discard(obj)
+                        removed.add(obj)
+                        continue
+
+                    properties = self.objects.setdefault(obj, {})
+                    for change in object_update.changeSet:
+                        if change.op in ('remove', 'indirectRemove'):
+                            properties.pop(change.name, None)
+                        else:
+                            properties[change.name] = change.val
+                    removed.discard(obj)
+                    changed.add(obj)
+
+            # Updates are split when there are more than `max_objects` of them
+            if not update_set.truncated:
+                break
+
+        return changed, removed
+
+    def destroy(self):
+        try:
+            self._collector.DestroyPropertyCollector()
+        except Exception:
+            # The session of the collector may be gone already
+            pass
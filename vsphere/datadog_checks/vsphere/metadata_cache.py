@@ -12,12 +12,16 @@ class MetadataCache:
     """
     Implements a thread safe storage for metrics metadata.
     For each instance key the cache maps: counter ID --> metric name, unit
+
+    The metadata and the metric IDs of an instance are replaced as a whole and never modified once
+    stored, so they are read without locking: the threads collecting metrics look up the metadata
+    of every value they submit.
     """
 
     def __init__(self):
         self._metadata = {}
         self._metric_ids = {}
-        self._lock = threading.RLock()
+        self._lock = threading.Lock()
 
     def init_instance(self, key):
         """
@@ -34,30 +38,28 @@ class MetadataCache:
         Return whether a counter_id is present for a given instance key.
         If the key is not in the cache, raises a KeyError.
         """
-        with self._lock:
-            return counter_id in self._metadata[key]
+        return counter_id in self._metadata[key]
 
     def set_metadata(self, key, metadata):
         """
         Store the metadata for the given instance key.
+        The metadata must not be modified once stored.
         """
-        with self._lock:
-            self._metadata[key] = metadata
+        self._metadata[key] = metadata
 
     def set_metric_ids(self, key, metric_ids):
         """
         Store the list of metric IDs we will want to collect for the given instance key
+        The list must not be modified once stored.
         """
-        with self._lock:
-            self._metric_ids[key] = metric_ids
+        self._metric_ids[key] = metric_ids
 
     def get_metric_ids(self, key):
         """
         Return the list of metric IDs to collect for the given instance key
         If the key is not in the cache, raises a KeyError.
         """
-        with self._lock:
-            return self._metric_ids[key]
+        return self._metric_ids[key]
 
     def get_metadata(self, key, counter_id):
         """
@@ -65,9 +67,8 @@ class MetadataCache:
         If the key is not in the cache, raises a KeyError.
         If there's no metric with the given counter_id, raises a MetadataNotFoundError.
         """
-        with self._lock:
-            metadata = self._metadata[key]
-            try:
-                return metadata[counter_id]
-            except KeyError:
-                raise MetadataNotFoundError("No metadata for counter id '{}' found in the cache.".format(counter_id))
+        metadata = self._metadata[key]
+        try:
+            return metadata[counter_id]
+        except KeyError:
+            raise MetadataNotFoundError("No metadata for counter id '{}' found in the cache.".format(counter_id))
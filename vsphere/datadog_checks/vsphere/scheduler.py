@@ -0,0 +1,109 @@
+# (C) Datadog, Inc. 2020
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import threading
+import time
+
+from datadog_checks.base.checks.libs.thread_pool import SENTINEL, Pool
+
+# Batches that can wait for a thread of the pool, per thread, before submitting more blocks
+QUEUED_BATCHES_PER_WORKER = 2
+
+
+def shard_queries(queries, batch_size, max_metrics=None):
+    """
+    Split `(mor, metric_ids)` queries in QueryPerf batches of at most `batch_size` objects and, if
+    `max_metrics` is set, less than `max_metrics` metrics: vCenter rejects the queries with more metrics
+    than its `config.vpxd.stats.maxQueryMetrics` setting. The metrics of an object with too many of them
+    are spread across several batches.
+
+    Batches are lists of `(mor, metric_ids)`, they are built as they are iterated.
+    """
+    if max_metrics == float('inf'):
+        max_metrics = None
+    chunk_size = None if max_metrics is None else max(1, max_metrics - 1)
+
+    batch = []
+    nb_metrics = 0
+    for mor, metric_ids in queries:
+        if chunk_size is None:
+            chunks = [metric_ids]
+        else:
+            chunks = [metric_ids[i : i + chunk_size] for i in range(0, len(metric_ids), chunk_size)]
+
+        for chunk in chunks:
+            too_many_metrics = max_metrics is not None and nb_metrics + len(chunk) >= max_metrics
+            if batch and (len(batch) == batch_size or too_many_metrics):
+                yield batch
+                batch = []
+                nb_metrics = 0
+
+            batch.append((mor, chunk))
+            nb_metrics += len(chunk)
+
+    if batch:
+        yield batch
+
+
+class QueryScheduler:
+    """
+    Run the QueryPerf batches of one kind of resources on a dedicated pool of threads, started when
+    the first batch is submitted.
+
+    Submitting a batch blocks while `workers * QUEUED_BATCHES_PER_WORKER` batches are already waiting
+    for a thread, so that the batches of a large vCenter are built as they are queried instead of all
+    at once. The latency of each batch and the number of pending batches when each batch is submitted
+    are kept to be reported once the collection is over.
+    """
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(workers * (1 + QUEUED_BATCHES_PER_WORKER))
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.latencies = []
+        self.queue_depths = []
+
+    def submit(self, func, *args):
+        """Run `func(*args)` in the pool, once there's room for it in the queue."""
+        if self._pool is None:
+            self._pool = Pool(self.workers, name=self.name)
+
+        self._slots.acquire()
+        with self._lock:
+            self.queue_depths.append(self._pending)
+            self._pending += 1
+        self._pool.apply_async(self._run, args=(func, args))
+
+    def _run(self, func, args):
+        start = time.time()
+        try:
+            func(*args)
+        finally:
+            latency = time.time() - start
+            with self._lock:
+                self._pending -= 1
+                self.latencies.append(latency)
+            self._slots.release()
+
+    def stop(self):
+        """Wait for the submitted batches to be done, and stop the threads."""
+        if self._pool is None:
+            return
+
+        for _ in self._pool._workers:
+            self._pool._workq.put(SENTINEL)
+        self._pool.close()
+        self._pool.join()
+        self._pool = None
+
+    def terminate(self):
+        """Stop the threads without waiting for the queued batches."""
+        if self._pool is None:
+            return
+
+        self._pool.terminate()
+        self._pool.join()
+        self._pool = None
@@ -14,7 +14,6 @@ from datetime import timedelta
 from pyVim import connect
 from pyVmomi import vim  # pylint: disable=E0611
 from pyVmomi import vmodl  # pylint: disable=E0611
-from six import itervalues
 from six.moves import range
 
 from datadog_checks.base import ensure_unicode, to_string
@@ -29,9 +28,11 @@ from .cache_config import CacheConfig
 from .common import REALTIME_RESOURCES, SOURCE_TYPE
 from .errors import BadConfigError, ConnectionError
 from .event import VSphereEvent
+from .inventory import Inventory
 from .metadata_cache import MetadataCache, MetadataNotFoundError
 from .mor_cache import MorCache, MorNotFoundError
 from .objects_queue import ObjectsQueue
+from .scheduler import QueryScheduler, shard_queries
 
 # Default vCenter sampling interval
 REAL_TIME_INTERVAL = 20
@@ -95,6 +96,8 @@ class VSphereCheck(AgentCheck):
 
     SERVICE_CHECK_NAME = 'vcenter.can_connect'
     pool = None
+    realtime_scheduler = None
+    historical_scheduler = None
 
     def __init__(self, name, init_config, agentConfig, instances):
         AgentCheck.__init__(self, name, init_config, agentConfig, instances)
@@ -139,6 +142,9 @@ class VSphereCheck(AgentCheck):
         # managed entity raw view
         self.registry = {}
 
+        # Inventories of the instances refreshed incrementally
+        self.inventories = {}
+
         # Metrics metadata, for each instance keeps the mapping: perfCounterKey -> {name, group, description}
         self.metadata_cache = MetadataCache()
         self.latest_event_query = {}
@@ -159,6 +165,11 @@ class VSphereCheck(AgentCheck):
         """
         return not is_affirmative(instance.get('collect_historical_only', False))
 
+    @staticmethod
+    def _is_incremental_inventory(instance):
+        """Whether the objects of vCenter are refreshed from the changes made since the previous refresh."""
+        return is_affirmative(instance.get('incremental_inventory', False))
+
     @staticmethod
     def _should_collect_historical(instance):
         """Whether or not this instance should collect and report historical metrics. This is true if the instance
@@ -188,6 +199,33 @@ class VSphereCheck(AgentCheck):
         self.pool.join()
         assert self.pool.get_nworkers() == 0
 
+    def start_schedulers(self):
+        """
+        Realtime and historical metrics are queried on separate pools of threads, the slower historical
+        queries answered by the vCenter database don't delay the realtime ones.
+        """
+        pool_size = int(self.init_config.get('threads_count', DEFAULT_SIZE_POOL))
+        historical_pool_size = int(self.init_config.get('historical_threads_count', pool_size))
+        self.realtime_scheduler = QueryScheduler('vsphere-realtime', pool_size)
+        self.historical_scheduler = QueryScheduler('vsphere-historical', historical_pool_size)
+
+    def stop_schedulers(self, instance):
+        """Wait for the queries to be done and report the latency of the batches and the depth of the queues."""
+        i_key = self._instance_key(instance)
+        custom_tags = instance.get('tags', []) + ['instance:{}'.format(i_key)]
+        for collection, scheduler in (('realtime', self.realtime_scheduler), ('historical', self.historical_scheduler)):
+            scheduler.stop()
+            tags = custom_tags + ['collection:{}'.format(collection)]
+            for latency in scheduler.latencies:
+                self.histogram('datadog.agent.vsphere.query_perf.time', latency, tags=tags)
+            for queue_depth in scheduler.queue_depths:
+                self.histogram('datadog.agent.vsphere.query_perf.queue_depth', queue_depth, tags=tags)
+
+    def terminate_schedulers(self):
+        for scheduler in (self.realtime_scheduler, self.historical_scheduler):
+            if scheduler is not None:
+                scheduler.terminate()
+
     def _query_event(self, instance):
         i_key = self._instance_key(instance)
         last_time = self.latest_event_query.get(i_key)
@@ -390,17 +428,15 @@ class VSphereCheck(AgentCheck):
             return parent_tags
         return []
 
-    def _collect_mors_and_attributes(self, server_instance):
+    @staticmethod
+    def _get_property_filter_spec(server_instance):
+        """Return the specification of the objects and attributes to collect from vCenter."""
         resources = list(RESOURCE_TYPE_METRICS)
         resources.extend(RESOURCE_TYPE_NO_METRIC)
 
         content = server_instance.content
         view_ref = content.viewManager.CreateContainerView(content.rootFolder, resources, True)
 
-        # Object used to query MORs as well as the attributes we require in one API call
-        # See https://code.vmware.com/apis/358/vsphere#/doc/vmodl.query.PropertyCollector.html
-        collector = content.propertyCollector
-
         # Specify the root object from where we collect the rest of the objects
         obj_spec = vmodl.query.PropertyCollector.ObjectSpec()
         obj_spec.obj = view_ref
@@ -429,6 +465,13 @@ class VSphereCheck(AgentCheck):
         filter_spec = vmodl.query.PropertyCollector.FilterSpec()
         filter_spec.objectSet = [obj_spec]
         filter_spec.propSet = property_specs
+        return filter_spec
+
+    def _collect_mors_and_attributes(self, server_instance):
+        # Object used to query MORs as well as the attributes we require in one API call
+        # See https://code.vmware.com/apis/358/vsphere#/doc/vmodl.query.PropertyCollector.html
+        collector = server_instance.content.propertyCollector
+        filter_spec = self._get_property_filter_spec(server_instance)
 
         retr_opts = vmodl.query.PropertyCollector.RetrieveOptions()
         # To limit the number of objects retrieved per call.
@@ -496,75 +539,173 @@ class VSphereCheck(AgentCheck):
         all_objects[rootFolder] = {"name": rootFolder.name, "parent": None}
 
         for obj, properties in all_objects.items():
-            instance_tags = []
-            if not self._is_excluded(obj, properties, regexes, include_only_marked) and isinstance(
-                obj, RESOURCE_TYPE_METRICS
-            ):
-                if use_guest_hostname:
-                    hostname = properties.get("guest.hostName", properties.get("name", "unknown"))
-                else:
-                    hostname = properties.get("name", "unknown")
-                if properties.get("parent"):
-                    instance_tags.extend(self._get_parent_tags(obj, all_objects))
-
-                if isinstance(obj, vim.VirtualMachine):
-                    vsphere_type = 'vsphere_type:vm'
-                    vimtype = vim.VirtualMachine
-                    mor_type = "vm"
-                    power_state = properties.get("runtime.powerState")
-                    if power_state != vim.VirtualMachinePowerState.poweredOn:
-                        self.log.debug("Skipping VM in state %s", ensure_unicode(power_state))
-                        continue
-                    host_mor = properties.get("runtime.host")
-                    host_props = all_objects.get(host_mor, {})
-                    host = "unknown"
-                    if host_mor and host_props:
-                        host = ensure_unicode(host_props.get("name", "unknown"))
-                        if self._is_excluded(host_mor, host_props, regexes, include_only_marked):
-                            self.log.debug(
-                                "Skipping VM because host %s is excluded by rule %s.", host, regexes.get('host_include')
-                            )
-                            continue
-                    instance_tags.append('vsphere_host:{}'.format(host))
-                elif isinstance(obj, vim.HostSystem):
-                    vsphere_type = 'vsphere_type:host'
-                    vimtype = vim.HostSystem
-                    mor_type = "host"
-                elif isinstance(obj, vim.Datastore):
-                    vsphere_type = 'vsphere_type:datastore'
-                    instance_tags.append(
-                        'vsphere_datastore:{}'.format(ensure_unicode(properties.get("name", "unknown")))
-                    )
-                    hostname = None
-                    vimtype = vim.Datastore
-                    mor_type = "datastore"
-                elif isinstance(obj, vim.Datacenter):
-                    vsphere_type = 'vsphere_type:datacenter'
-                    instance_tags.append(
-                        "vsphere_datacenter:{}".format(ensure_unicode(properties.get("name", "unknown")))
-                    )
-                    hostname = None
-                    vimtype = vim.Datacenter
-                    mor_type = "datacenter"
-                elif isinstance(obj, vim.ClusterComputeResource):
-                    vsphere_type = 'vsphere_type:cluster'
-                    instance_tags.append("vsphere_cluster:{}".format(ensure_unicode(properties.get("name", "unknown"))))
-                    hostname = None
-                    vimtype = vim.ClusterComputeResource
-                    mor_type = "cluster"
-                else:
-                    vsphere_type = None
+            entry = self._get_mor_entry(
+                obj, properties, all_objects, regexes, include_only_marked, tags, use_guest_hostname
+            )
+            if entry is not None:
+                vimtype, mor = entry
+                obj_list[vimtype].append(mor)
 
-                if vsphere_type:
-                    instance_tags.append(vsphere_type)
+        self.log.debug("All objects with attributes cached in %s seconds.", time.time() - start)
+        return obj_list
+
+    def _get_changed_objs(
+        self, instance, server_instance, regexes, include_only_marked, tags, use_guest_hostname=False
+    ):
+        """
+        Same as `_get_all_objs`, for the objects that changed since the previous call: the objects added or
+        modified, and the objects whose tags depend on them. The objects that were removed or are now excluded
+        are removed from the Mor cache.
 
-                obj_list[vimtype].append(
-                    {"mor_type": mor_type, "mor": obj, "hostname": hostname, "tags": tags + instance_tags}
+        The inventory is kept up to date from the changes reported by vCenter, it's only collected again
+        from scratch after an error.
+        """
+        start = time.time()
+        i_key = self._instance_key(instance)
+        inventory = self.inventories.pop(i_key, None)
+        if inventory is not None:
+            try:
+                changed, removed = inventory.update()
+            except Exception as e:
+                self.log.warning("Unable to update the inventory of instance %s, collecting it again: %s", i_key, e)
+                inventory.destroy()
+                inventory = None
+
+        resync = inventory is None
+        if resync:
+            inventory = self._create_inventory(server_instance)
+            try:
+                changed, removed = inventory.update()
+            except Exception:
+                inventory.destroy()
+                raise
+        self.inventories[i_key] = inventory
+
+        all_objects = inventory.objects
+        removed_names = {str(obj) for obj in removed}
+        if resync and self.mor_cache.contains(i_key):
+            # Objects removed while the inventory was out of date
+            names = {str(obj) for obj in all_objects}
+            removed_names.update(name for name, _ in self.mor_cache.mors(i_key) if name not in names)
+
+        obj_list = defaultdict(list)
+        if changed:
+            for obj, properties in all_objects.items():
+                if not isinstance(obj, RESOURCE_TYPE_METRICS) or not self._depends_on(obj, changed, all_objects):
+                    continue
+
+                entry = self._get_mor_entry(
+                    obj, properties, all_objects, regexes, include_only_marked, tags, use_guest_hostname
                 )
+                if entry is None:
+                    removed_names.add(str(obj))
+                else:
+                    vimtype, mor = entry
+                    obj_list[vimtype].append(mor)
 
-        self.log.debug("All objects with attributes cached in %s seconds.", time.time() - start)
+        if self.mor_cache.contains(i_key):
+            self.mor_cache.remove_mors(i_key, removed_names)
+
+        self.log.debug(
+            "%d objects changed and %d removed, updated in %s seconds.", len(changed), len(removed), time.time() - start
+        )
         return obj_list
 
+    def _create_inventory(self, server_instance):
+        inventory = Inventory(
+            server_instance.content.propertyCollector,
+            self._get_property_filter_spec(server_instance),
+            self.batch_collector_size or None,
+        )
+        # Add rootFolder since it is not explored by the propertyCollector
+        root_folder = server_instance.content.rootFolder
+        inventory.objects[root_folder] = {"name": root_folder.name, "parent": None}
+        return inventory
+
+    @staticmethod
+    def _depends_on(obj, changed, all_objects):
+        """
+        Return whether an object or its tags depend on the `changed` objects: its tags are computed from
+        its parents, and from the host of virtual machines.
+        """
+        host = all_objects.get(obj, {}).get("runtime.host")
+        if host is not None and host in changed:
+            return True
+
+        while obj is not None:
+            if obj in changed:
+                return True
+            obj = all_objects.get(obj, {}).get("parent")
+
+        return False
+
+    def _get_mor_entry(self, obj, properties, all_objects, regexes, include_only_marked, tags, use_guest_hostname):
+        """
+        Return the `(vimtype, mor)` entry of the objects queue for an object we query metrics for,
+        None if the object is excluded or has no metrics.
+        """
+        if self._is_excluded(obj, properties, regexes, include_only_marked) or not isinstance(
+            obj, RESOURCE_TYPE_METRICS
+        ):
+            return None
+
+        instance_tags = []
+        if use_guest_hostname:
+            hostname = properties.get("guest.hostName", properties.get("name", "unknown"))
+        else:
+            hostname = properties.get("name", "unknown")
+        if properties.get("parent"):
+            instance_tags.extend(self._get_parent_tags(obj, all_objects))
+
+        if isinstance(obj, vim.VirtualMachine):
+            vsphere_type = 'vsphere_type:vm'
+            vimtype = vim.VirtualMachine
+            mor_type = "vm"
+            power_state = properties.get("runtime.powerState")
+            if power_state != vim.VirtualMachinePowerState.poweredOn:
+                self.log.debug("Skipping VM in state %s", ensure_unicode(power_state))
+                return None
+            host_mor = properties.get("runtime.host")
+            host_props = all_objects.get(host_mor, {})
+            host = "unknown"
+            if host_mor and host_props:
+                host = ensure_unicode(host_props.get("name", "unknown"))
+                if self._is_excluded(host_mor, host_props, regexes, include_only_marked):
+                    self.log.debug(
+                        "Skipping VM because host %s is excluded by rule %s.", host, regexes.get('host_include')
+                    )
+                    return None
+            instance_tags.append('vsphere_host:{}'.format(host))
+        elif isinstance(obj, vim.HostSystem):
+            vsphere_type = 'vsphere_type:host'
+            vimtype = vim.HostSystem
+            mor_type = "host"
+        elif isinstance(obj, vim.Datastore):
+            vsphere_type = 'vsphere_type:datastore'
+            instance_tags.append('vsphere_datastore:{}'.format(ensure_unicode(properties.get("name", "unknown"))))
+            hostname = None
+            vimtype = vim.Datastore
+            mor_type = "datastore"
+        elif isinstance(obj, vim.Datacenter):
+            vsphere_type = 'vsphere_type:datacenter'
+            instance_tags.append("vsphere_datacenter:{}".format(ensure_unicode(properties.get("name", "unknown"))))
+            hostname = None
+            vimtype = vim.Datacenter
+            mor_type = "datacenter"
+        elif isinstance(obj, vim.ClusterComputeResource):
+            vsphere_type = 'vsphere_type:cluster'
+            instance_tags.append("vsphere_cluster:{}".format(ensure_unicode(properties.get("name", "unknown"))))
+            hostname = None
+            vimtype = vim.ClusterComputeResource
+            mor_type = "cluster"
+        else:
+            vsphere_type = None
+
+        if vsphere_type:
+            instance_tags.append(vsphere_type)
+
+        return vimtype, {"mor_type": mor_type, "mor": obj, "hostname": hostname, "tags": tags + instance_tags}
+
     @staticmethod
     def _is_excluded(obj, properties, regexes, include_only_marked):
         """
@@ -633,9 +774,14 @@ class VSphereCheck(AgentCheck):
         # Discover hosts and virtual machines
         server_instance = self._get_server_instance(instance)
         use_guest_hostname = is_affirmative(instance.get("use_guest_hostname", False))
-        all_objs = self._get_all_objs(
-            server_instance, regexes, include_only_marked, tags, use_guest_hostname=use_guest_hostname
-        )
+        if self._is_incremental_inventory(instance):
+            all_objs = self._get_changed_objs(
+                instance, server_instance, regexes, include_only_marked, tags, use_guest_hostname=use_guest_hostname
+            )
+        else:
+            all_objs = self._get_all_objs(
+                server_instance, regexes, include_only_marked, tags, use_guest_hostname=use_guest_hostname
+            )
 
         self.mor_objects_queue.fill(i_key, dict(all_objs))
         self.cache_config.set_last(CacheConfig.Morlist, i_key, time.time())
@@ -654,14 +800,13 @@ class VSphereCheck(AgentCheck):
         # For non realtime metrics, we need to specifically ask which counters are available for which entity,
         # so we call perfManager.QueryAvailablePerfMetric for each cluster, datacenter, datastore
         # This should be okay since the number of such entities shouldn't be excessively large
+        metrics = {}
         for mor in mors:
-            mor_name = str(mor['mor'])
             available_metrics = {m.counterId for m in perfManager.QueryAvailablePerfMetric(entity=mor["mor"])}
-            try:
-                self.mor_cache.set_metrics(i_key, mor_name, self._compute_needed_metrics(instance, available_metrics))
-            except MorNotFoundError:
-                self.log.error("Object '%s' is missing from the cache, skipping. ", ensure_unicode(mor_name))
-                continue
+            metrics[str(mor['mor'])] = self._compute_needed_metrics(instance, available_metrics)
+
+        for mor_name in self.mor_cache.set_metrics_batch(i_key, metrics):
+            self.log.error("Object '%s' is missing from the cache, skipping. ", ensure_unicode(mor_name))
 
         # TEST-INSTRUMENTATION
         custom_tags = instance.get('tags', []) + ['instance:{}'.format(i_key)]
@@ -680,13 +825,15 @@ class VSphereCheck(AgentCheck):
             return
 
         # Simply move the realtime mors from the queue to the cache
+        realtime_mors = {}
         for resource_type in RESOURCE_TYPE_METRICS_REALTIME:
             while self.mor_objects_queue.size(i_key, resource_type):
                 mor = self.mor_objects_queue.pop(i_key, resource_type)
                 if self._is_main_instance(instance):
-                    mor_name = str(mor['mor'])
                     mor['interval'] = REAL_TIME_INTERVAL
-                    self.mor_cache.set_mor(i_key, mor_name, mor)
+                    realtime_mors[str(mor['mor'])] = mor
+        # Store them at once, the cache is copied on every write
+        self.mor_cache.set_mors(i_key, realtime_mors)
 
         # Move the mors with historical metrics from the queue to the cache and also fetch their list of metrics.
         for resource_type in RESOURCE_TYPE_METRICS_HISTORICAL:
@@ -701,11 +848,10 @@ class VSphereCheck(AgentCheck):
                         self.log.debug("No more objects of type '%s' left in the queue", ensure_unicode(resource_type))
                         break
 
-                    mor_name = str(mor['mor'])
-                    self.mor_cache.set_mor(i_key, mor_name, mor)
-
                     hist_mors.append(mor)
 
+                self.mor_cache.set_mors(i_key, {str(mor['mor']): mor for mor in hist_mors})
+
                 # We will actually schedule jobs for non realtime resources only.
                 if self._should_collect_historical(instance):
                     self.pool.apply_async(self._process_mor_objects_queue_async, args=(instance, hist_mors))
@@ -892,13 +1038,6 @@ class VSphereCheck(AgentCheck):
             except Exception:
                 pass
 
-        # TODO: Remove me once the fix for `max_query_metrics` is here by default
-        mors_batch_method = (
-            self.mor_cache.mors_batch
-            if is_affirmative(instance.get('fix_max_query_metrics'))
-            else self.mor_cache.legacy_mors_batch
-        )
-
         vm_count = 0
         custom_tags = instance.get('tags', [])
         tags = ["vcenter_server:{}".format(ensure_unicode(instance.get('name')))] + custom_tags
@@ -912,33 +1051,43 @@ class VSphereCheck(AgentCheck):
 
         self.log.debug("Collecting metrics for %s mors", ensure_unicode(n_mors))
 
+        realtime_queries = []
+        historical_queries = []
+        realtime_metric_ids = self.metadata_cache.get_metric_ids(i_key)
+        for _, mor in self.mor_cache.mors(i_key):
+            if mor['mor_type'] == 'vm':
+                vm_count += 1
+            if mor['mor_type'] in REALTIME_RESOURCES:
+                realtime_queries.append((mor, realtime_metric_ids))
+            elif mor.get('metrics'):
+                historical_queries.append((mor, mor['metrics']))
+
         # Request metrics for several objects at once. We can limit the number of objects with batch_size
         # If batch_size is 0, process everything at once
         batch_size = self.batch_morlist_size or n_mors
-        for batch in mors_batch_method(i_key, batch_size, max_historical_metrics):
-            query_specs = []
-            for mor in itervalues(batch):
-                if mor['mor_type'] == 'vm':
-                    vm_count += 1
-                if mor['mor_type'] not in REALTIME_RESOURCES and ('metrics' not in mor or not mor['metrics']):
-                    continue
-
-                query_spec = vim.PerformanceManager.QuerySpec()
-                query_spec.entity = mor["mor"]
-                query_spec.intervalId = mor.get("interval")
-                query_spec.maxSample = 1
-                if mor['mor_type'] in REALTIME_RESOURCES:
-                    query_spec.metricId = self.metadata_cache.get_metric_ids(i_key)
-                else:
-                    query_spec.metricId = mor["metrics"]
-                query_specs.append(query_spec)
+        for batch in shard_queries(realtime_queries, batch_size):
+            self.realtime_scheduler.submit(self._collect_metrics_async, instance, self._query_specs(batch))
 
-            if query_specs:
-                self.pool.apply_async(self._collect_metrics_async, args=(instance, query_specs))
+        # Historical batches are also limited by the number of metrics vCenter accepts in a query
+        for batch in shard_queries(historical_queries, batch_size, max_historical_metrics):
+            self.historical_scheduler.submit(self._collect_metrics_async, instance, self._query_specs(batch))
 
         if self._is_main_instance(instance):
             self.gauge('vsphere.vm.count', vm_count, tags=tags)
 
+    @staticmethod
+    def _query_specs(batch):
+        query_specs = []
+        for mor, metric_ids in batch:
+            query_spec = vim.PerformanceManager.QuerySpec()
+            query_spec.entity = mor["mor"]
+            query_spec.intervalId = mor.get("interval")
+            query_spec.maxSample = 1
+            query_spec.metricId = metric_ids
+            query_specs.append(query_spec)
+
+        return query_specs
+
     def check(self, instance):
         try:
             self.exception_printed = 0
@@ -954,21 +1103,24 @@ class VSphereCheck(AgentCheck):
             # for historical resources is made asynchronously.
             self.start_pool()
             self._process_mor_objects_queue(instance)
-            # Remove old objects that might be gone from the Mor cache
-            self.mor_cache.purge(self._instance_key(instance), self.clean_morlist_interval)
+            # Remove old objects that might be gone from the Mor cache, unchanged objects aren't refreshed
+            # with an incremental inventory, the objects gone are removed as soon as they're reported
+            if not self._is_incremental_inventory(instance):
+                self.mor_cache.purge(self._instance_key(instance), self.clean_morlist_interval)
             self.stop_pool()
 
             # Second part: do the job
-            self.start_pool()
+            self.start_schedulers()
             self.collect_metrics(instance)
             if self._is_main_instance(instance):
                 self._query_event(instance)
                 self.set_external_tags(self.get_external_host_tags())
 
-            self.stop_pool()
+            self.stop_schedulers(instance)
 
             if self.exception_printed > 0:
                 self.log.error("One thread in the pool crashed, check the logs")
         except Exception:
             self.terminate_pool()
+            self.terminate_schedulers()
             raise
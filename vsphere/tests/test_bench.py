@@ -0,0 +1,56 @@
+# (C) Datadog, Inc. 2020
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import pytest
+from mock import MagicMock
+
+from datadog_checks.base.checks.libs.thread_pool import Pool
+from datadog_checks.vsphere.metadata_cache import MetadataCache
+from datadog_checks.vsphere.mor_cache import MorCache
+
+INSTANCE_KEY = 'vsphere_mock'
+MORS = 2000
+COUNTERS = 100
+BATCH_SIZE = 50
+
+
+def collect_batch(mor_cache, metadata_cache, names):
+    # The cache lookups made by `_collect_metrics_async` for a batch of objects
+    for name in names:
+        mor_cache.get_mor(INSTANCE_KEY, name)
+        for counter_id in range(COUNTERS):
+            if metadata_cache.contains(INSTANCE_KEY, counter_id):
+                metadata_cache.get_metadata(INSTANCE_KEY, counter_id)
+
+
+def store_metrics(mor_cache, names):
+    # The cache writes made by `_process_mor_objects_queue_async` for a batch of objects
+    mor_cache.set_metrics_batch(INSTANCE_KEY, {name: [] for name in names})
+
+
+@pytest.mark.parametrize('workers', [1, 4, 16], ids=['1_worker', '4_workers', '16_workers'])
+def test_cache_reads(benchmark, workers):
+    mor_cache = MorCache(MagicMock())
+    mor_cache.init_instance(INSTANCE_KEY)
+    names = ['vm-{}'.format(i) for i in range(MORS)]
+    mor_cache.set_mors(INSTANCE_KEY, {name: {'mor_type': 'vm'} for name in names})
+
+    metadata_cache = MetadataCache()
+    metadata_cache.init_instance(INSTANCE_KEY)
+    metadata_cache.set_metadata(INSTANCE_KEY, {i: {'name': 'metric', 'unit': 'number'} for i in range(COUNTERS)})
+
+    batches = [names[i : i + BATCH_SIZE] for i in range(0, MORS, BATCH_SIZE)]
+    pool = Pool(workers)
+
+    def collect():
+        results = [pool.apply_async(collect_batch, args=(mor_cache, metadata_cache, batch)) for batch in batches]
+        # Objects are refreshed while metrics are collected
+        results.extend(pool.apply_async(store_metrics, args=(mor_cache, batch)) for batch in batches[:4])
+        for result in results:
+            result.get()
+
+    try:
+        benchmark(collect)
+    finally:
+        pool.terminate()
+        pool.join()
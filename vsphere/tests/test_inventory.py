@@ -0,0 +1,51 @@
+# (C) Datadog, Inc. 2020
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import mock
+from mock import MagicMock
+
+from datadog_checks.vsphere.inventory import Inventory
+
+from .utils import object_update_mock, update_set_mock
+
+
+@mock.patch('datadog_checks.vsphere.inventory.vmodl')
+def test_inventory_update(vmodl_mock):
+    property_collector = MagicMock()
+    collector = property_collector.CreatePropertyCollector.return_value
+    inventory = Inventory(property_collector, 'filter_spec', max_objects=2)
+
+    collector.CreateFilter.assert_called_once_with('filter_spec', partialUpdates=False)
+    vmodl_mock.query.PropertyCollector.WaitOptions.assert_called_once_with(maxWaitSeconds=0, maxObjectUpdates=2)
+
+    # Updates are paginated
+    collector.WaitForUpdatesEx.side_effect = [
+        update_set_mock(
+            [
+                object_update_mock('vm1', changes={'name': 'vm1', 'runtime.host': 'host1'}),
+                object_update_mock('vm2', changes={'name': 'vm2'}),
+            ],
+            version='1',
+            truncated=True,
+        ),
+        update_set_mock([object_update_mock('host1', changes={'name': 'host1'})], version='2'),
+    ]
+    assert inventory.update() == ({'vm1', 'vm2', 'host1'}, set())
+    assert inventory.objects == {
+        'vm1': {'name': 'vm1', 'runtime.host': 'host1'},
+        'vm2': {'name': 'vm2'},
+        'host1': {'name': 'host1'},
+    }
+
+    removal = object_update_mock('vm1', kind='modify', changes={'runtime.host': None})
+    removal.changeSet[0].op = 'remove'
+    collector.WaitForUpdatesEx.side_effect = [
+        update_set_mock([removal, object_update_mock('vm2', kind='leave')], version='3')
+    ]
+    assert inventory.update() == ({'vm1'}, {'vm2'})
+    assert collector.WaitForUpdatesEx.call_args[0][0] == '2'
+    assert inventory.objects == {'vm1': {'name': 'vm1'}, 'host1': {'name': 'host1'}}
+
+    # No change
+    collector.WaitForUpdatesEx.side_effect = [None]
+    assert inventory.update() == (set(), set())
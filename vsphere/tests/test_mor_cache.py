@@ -45,6 +45,25 @@ def test_set_mor(cache):
         cache.set_mor('foo', 'mor', {})
 
 
+def test_set_mors(cache):
+    cache.init_instance('foo_instance')
+    cache.set_mors('foo_instance', {'mor1': {'foo': 'bar'}, 'mor2': {}})
+    assert sorted(cache._mor['foo_instance']) == ['mor1', 'mor2']
+    assert cache._mor['foo_instance']['mor1']['creation_time'] > 0
+
+    with pytest.raises(KeyError):
+        cache.set_mors('foo', {'mor': {}})
+
+
+def test_remove_mors(cache):
+    cache._mor['foo_instance'] = {'mor1': {}, 'mor2': {}}
+    cache.remove_mors('foo_instance', ['mor1', 'unknown'])
+    assert list(cache._mor['foo_instance']) == ['mor2']
+
+    with pytest.raises(KeyError):
+        cache.remove_mors('foo', ['mor1'])
+
+
 def test_get_mor(cache):
     with pytest.raises(KeyError):
         cache.get_mor('instance', 'mor_name')
@@ -70,6 +89,20 @@ def test_set_metrics(cache):
         cache.set_metrics('foo_instance', 'foo', [])
 
 
+def test_set_metrics_batch(cache):
+    with pytest.raises(KeyError):
+        cache.set_metrics_batch('instance', {})
+
+    mor = {'foo': 'bar'}
+    cache._mor['foo_instance'] = {'my_mor_name': mor}
+
+    missing = cache.set_metrics_batch('foo_instance', {'my_mor_name': [1, 2], 'foo': []})
+    assert missing == ['foo']
+    assert cache._mor['foo_instance']['my_mor_name'] == {'foo': 'bar', 'metrics': [1, 2]}
+    # Stored Mor objects are replaced, not modified
+    assert 'metrics' not in mor
+
+
 def test_mors(cache):
     cache._mor['foo_instance'] = {}
     for i in range(9):
@@ -80,92 +113,6 @@ def test_mors(cache):
     assert len(dict(cache.mors('foo'))) == 0
 
 
-def test_mors_batch_realtime(cache):
-    cache._mor['foo_instance'] = {}
-    for i in range(9):
-        # For the sake of this test, Mor name is `i` and Mor object is `None`
-        cache._mor['foo_instance'][i] = {'mor_type': 'vm'}
-
-    # input size is multiple of batch size
-    steps = 0
-    for mors in cache.mors_batch('foo_instance', 3):
-        assert len(mors) == 3
-        steps += 1
-    assert steps == 3
-
-    # batch size is smaller than the input size
-    out = list(cache.mors_batch('foo_instance', 5))
-    assert len(out) == 2
-    assert len(out[0]) == 5
-    assert len(out[1]) == 4
-
-    # batch size is the same as the input size
-    out = list(cache.mors_batch('foo_instance', 9))
-    assert len(out) == 1
-    assert len(out[0]) == 9
-
-    # batch size is greater than the input size
-    out = list(cache.mors_batch('foo_instance', 100))
-    assert len(out) == 1
-    assert len(out[0]) == 9
-
-
-def test_mors_batch_historical(cache):
-    cache._mor['foo_instance'] = {}
-    for i in range(9):
-        cache._mor['foo_instance'][i] = {'mor_type': 'datastore', 'metrics': range(5)}
-
-    # input size is multiple of batch size
-    steps = 0
-    for mors in cache.mors_batch('foo_instance', 3):
-        assert len(mors) == 3
-        steps += 1
-    assert steps == 3
-
-    # batch size is smaller than the input size
-    out = list(cache.mors_batch('foo_instance', 5))
-    assert len(out) == 2
-    assert len(out[0]) == 5
-    assert len(out[1]) == 4
-
-    # batch size is the same as the input size
-    out = list(cache.mors_batch('foo_instance', 9))
-    assert len(out) == 1
-    assert len(out[0]) == 9
-
-    # batch size is greater than the input size
-    out = list(cache.mors_batch('foo_instance', 100))
-    assert len(out) == 1
-    assert len(out[0]) == 9
-
-    # input size is multiple of batch size
-    steps = 0
-    for mors in cache.mors_batch('foo_instance', 3, max_historical_metrics=16):
-        assert len(mors) == 3
-        assert sum([len(mors[m]['metrics']) for m in mors]) == 15
-        steps += 1
-    assert steps == 3
-
-    steps = 0
-    for mors in cache.mors_batch('foo_instance', 3, max_historical_metrics=9):
-        assert len(mors) == 1
-        assert sum([len(mors[m]['metrics']) for m in mors]) == 5
-        steps += 1
-    assert steps == 9
-
-    steps = 0
-    for mors in cache.mors_batch('foo_instance', 3, max_historical_metrics=6):
-        assert len(mors) == 1
-        assert sum([len(mors[m]['metrics']) for m in mors]) == 5
-        steps += 1
-    assert steps == 9
-
-    steps = 0
-    for _ in cache.mors_batch('foo_instance', 3, max_historical_metrics=4):
-        steps += 1
-    assert steps == 0
-
-
 def test_purge(cache):
     cache._mor['foo_instance'] = {}
     for i in range(3):
@@ -177,3 +124,18 @@ def test_purge(cache):
     cache.purge('foo_instance', 60)
     assert len(cache._mor['foo_instance']) == 1
     assert 'hero' in cache._mor['foo_instance']
+
+
+def test_mors_snapshot(cache):
+    cache.init_instance('foo_instance')
+    cache.set_mors('foo_instance', {i: {} for i in range(3)})
+
+    # Writes made while iterating don't change the Mor objects being iterated
+    mors = cache.mors('foo_instance')
+    names = [next(mors)[0]]
+    cache.remove_mors('foo_instance', [0, 1, 2])
+    cache.set_mors('foo_instance', {i: {} for i in range(3, 6)})
+    names.extend(name for name, _ in mors)
+
+    assert sorted(names) == [0, 1, 2]
+    assert sorted(name for name, _ in cache.mors('foo_instance')) == [3, 4, 5]
@@ -0,0 +1,87 @@
+# (C) Datadog, Inc. 2020
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import threading
+
+import pytest
+
+from datadog_checks.vsphere.scheduler import QUEUED_BATCHES_PER_WORKER, QueryScheduler, shard_queries
+
+
+def test_shard_queries_batch_size():
+    queries = [('mor{}'.format(i), [1, 2]) for i in range(5)]
+
+    batches = list(shard_queries(queries, 2))
+    assert batches == [queries[:2], queries[2:4], queries[4:]]
+
+
+def test_shard_queries_max_metrics():
+    queries = [('mor1', [1, 2, 3]), ('mor2', [4, 5]), ('mor3', list(range(10)))]
+
+    batches = list(shard_queries(queries, 10, max_metrics=6))
+    assert batches == [
+        [('mor1', [1, 2, 3]), ('mor2', [4, 5])],
+        # The metrics of an object with too many of them are spread across batches
+        [('mor3', [0, 1, 2, 3, 4])],
+        [('mor3', [5, 6, 7, 8, 9])],
+    ]
+    for batch in batches:
+        assert sum(len(metric_ids) for _, metric_ids in batch) < 6
+
+    # Unlimited
+    assert list(shard_queries(queries, 10, max_metrics=float('inf'))) == [queries]
+
+
+@pytest.mark.parametrize('batch_size, sizes', [(3, [3, 3, 3]), (5, [5, 4]), (9, [9]), (100, [9])])
+def test_shard_queries_sizes(batch_size, sizes):
+    queries = [('mor{}'.format(i), list(range(5))) for i in range(9)]
+
+    assert [len(batch) for batch in shard_queries(queries, batch_size)] == sizes
+
+
+@pytest.mark.parametrize('max_metrics, objects', [(16, 3), (9, 1), (6, 1)])
+def test_shard_queries_objects_per_batch(max_metrics, objects):
+    queries = [('mor{}'.format(i), list(range(5))) for i in range(9)]
+
+    batches = list(shard_queries(queries, 3, max_metrics=max_metrics))
+    assert len(batches) == 9 // objects
+    for batch in batches:
+        assert len(batch) == objects
+        assert sum(len(metric_ids) for _, metric_ids in batch) == 5 * objects
+
+
+def test_query_scheduler():
+    scheduler = QueryScheduler('test', 2)
+    results = []
+    for i in range(10):
+        scheduler.submit(results.append, i)
+    scheduler.stop()
+
+    assert sorted(results) == list(range(10))
+    assert len(scheduler.latencies) == 10
+    assert len(scheduler.queue_depths) == 10
+
+
+def test_query_scheduler_backpressure():
+    scheduler = QueryScheduler('test', 1)
+    release = threading.Event()
+    max_pending = 1 + QUEUED_BATCHES_PER_WORKER
+
+    def submit_all():
+        for _ in range(max_pending + 1):
+            scheduler.submit(release.wait)
+
+    submitter = threading.Thread(target=submit_all)
+    submitter.start()
+    try:
+        # Submitting blocks once the queue is full
+        submitter.join(0.5)
+        assert submitter.is_alive()
+        assert len(scheduler.queue_depths) == max_pending
+    finally:
+        release.set()
+        submitter.join()
+        scheduler.stop()
+
+    assert scheduler.queue_depths[:max_pending] == list(range(max_pending))
+    assert len(scheduler.latencies) == max_pending + 1
@@ -22,7 +22,7 @@ from datadog_checks.vsphere.vsphere import (
     SHORT_ROLLUP,
 )
 
-from .utils import MockedMOR, assertMOR, disable_thread_pool, get_mocked_server
+from .utils import MockedMOR, assertMOR, disable_thread_pool, get_mocked_server, object_update_mock, update_set_mock
 
 SERVICE_CHECK_TAGS = ["vcenter_server:vsphere_mock", "vcenter_host:None", "foo:bar"]
 
@@ -316,6 +316,55 @@ def test_use_guest_hostname(vsphere, instance):
         assertMOR(vsphere, instance, name="vm4_guest", spec="vm", subset=True)
 
 
+def test__cache_morlist_raw_incremental(vsphere, instance):
+    instance['incremental_inventory'] = True
+    i_key = vsphere._instance_key(instance)
+    server_instance = vsphere._get_server_instance(instance)
+    collector = server_instance.content.propertyCollector.CreatePropertyCollector.return_value
+    initial_update = collector.WaitForUpdatesEx('', None)
+    all_mors = {update.obj.name: update.obj for update in initial_update.filterSet[0].objectSet}
+
+    with mock.patch('datadog_checks.vsphere.vsphere.vmodl'):
+        vsphere._cache_morlist_raw(instance)
+        assertMOR(vsphere, instance, spec="vm", count=3)
+        assertMOR(vsphere, instance, spec="host", count=3)
+        vsphere._process_mor_objects_queue(instance)
+        assert vsphere.mor_cache.instance_size(i_key) == 11
+
+        # Nothing changed
+        vsphere._cache_morlist_raw(instance)
+        assert sum(vsphere.mor_objects_queue.size(i_key, res_type) for res_type in RESOURCE_TYPE_METRICS) == 0
+        assert vsphere.mor_cache.instance_size(i_key) == 11
+
+        changes = update_set_mock(
+            [
+                # Renaming the host changes the tags of its VMs
+                object_update_mock(all_mors['host3'], kind='modify', changes={'name': 'host3_renamed'}),
+                object_update_mock(all_mors['vm1'], kind='leave'),
+            ],
+            version='2',
+        )
+        collector.WaitForUpdatesEx.side_effect = lambda version, options: changes if version == '1' else None
+        vsphere._cache_morlist_raw(instance)
+
+        assert sum(vsphere.mor_objects_queue.size(i_key, res_type) for res_type in RESOURCE_TYPE_METRICS) == 3
+        assertMOR(vsphere, instance, name='host3_renamed', spec='host', count=1)
+        assertMOR(vsphere, instance, spec='vm', tags=['vsphere_host:host3_renamed'], subset=True, count=2)
+        vsphere._process_mor_objects_queue(instance)
+        assert vsphere.mor_cache.instance_size(i_key) == 10
+        assert str(all_mors['vm1']) not in dict(vsphere.mor_cache.mors(i_key))
+
+        # After an error, the inventory is collected again and the objects gone meanwhile are removed
+        vsphere.mor_cache.set_mor(i_key, 'gone', {'mor_type': 'vm'})
+        collector.WaitForUpdatesEx.side_effect = [Exception('InvalidCollectorVersion'), initial_update]
+        vsphere._cache_morlist_raw(instance)
+
+        collector.DestroyPropertyCollector.assert_called_once()
+        assertMOR(vsphere, instance, spec="vm", count=3)
+        assertMOR(vsphere, instance, spec="host", count=3)
+        assert 'gone' not in dict(vsphere.mor_cache.mors(i_key))
+
+
 def test__process_mor_objects_queue(vsphere, instance):
     vsphere.log = MagicMock()
     vsphere._process_mor_objects_queue_async = MagicMock()
@@ -454,6 +503,45 @@ def test_collect_metrics(vsphere, instance):
             assert len(call_args[0][1]) == 1
 
 
+def test_collect_metrics_historical(vsphere, instance):
+    instance['collect_realtime_only'] = False
+    instance['max_query_metrics'] = 3
+    i_key = vsphere._instance_key(instance)
+    with mock.patch('datadog_checks.vsphere.vsphere.vmodl'):
+        vsphere._collect_metrics_async = MagicMock()
+        vsphere._cache_metrics_metadata(instance)
+        vsphere._cache_morlist_raw(instance)
+        vsphere._process_mor_objects_queue(instance)
+        historical = [name for name, mor in vsphere.mor_cache.mors(i_key) if mor['mor_type'] not in ('vm', 'host')]
+        metric_ids = [vim.PerformanceManager.MetricId(counterId=counter_id, instance="*") for counter_id in range(4)]
+        for name in historical:
+            vsphere.mor_cache.set_metrics(i_key, name, metric_ids)
+
+        vsphere.realtime_scheduler.submit = MagicMock()
+        vsphere.collect_metrics(instance)
+
+    assert vsphere.realtime_scheduler.submit.call_count == 1
+    # Historical queries are sharded to stay below the limit of vCenter
+    metric_counts = []
+    for call_args in vsphere._collect_metrics_async.call_args_list:
+        query_specs = call_args[0][1]
+        metric_counts.append(sum(len(query_spec.metricId) for query_spec in query_specs))
+    assert all(count < 3 for count in metric_counts)
+    assert sum(metric_counts) == 4 * len(historical)
+
+
+def test_stop_schedulers(vsphere, instance, aggregator):
+    vsphere.realtime_scheduler.latencies = [0.1, 0.2]
+    vsphere.realtime_scheduler.queue_depths = [0, 1]
+    vsphere.stop_schedulers(instance)
+
+    tags = ['foo:bar', 'instance:vsphere_mock', 'collection:realtime']
+    aggregator.assert_metric('datadog.agent.vsphere.query_perf.time', tags=tags, count=2)
+    aggregator.assert_metric('datadog.agent.vsphere.query_perf.queue_depth', tags=tags, count=2)
+    historical_tags = tags[:2] + ['collection:historical']
+    aggregator.assert_metric('datadog.agent.vsphere.query_perf.time', tags=historical_tags, count=0)
+
+
 def test__collect_metrics_async_compatibility(vsphere, instance):
     server_instance = vsphere._get_server_instance(instance)
     server_instance.content.perfManager.QueryPerf.return_value = [MagicMock(value=[MagicMock()])]
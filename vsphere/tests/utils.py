@@ -60,25 +60,54 @@ def create_topology(topology_json):
         return objects
 
 
-def retrieve_properties_mock(all_mors):
-    objects = []
-    properties_res = MagicMock(objects=objects, token=None)
+def mor_prop_set(mor):
+    """
+    Return the mocked properties collected for a Mor.
+    """
+    prop_set = []
     mor_properties = ["name", "parent", "customValue", "runtime_powerState", "runtime_host", "guest_hostName"]
-    for mor in all_mors:
-        prop_set = []
-        for prop_name in mor_properties:
-            try:
-                prop = MagicMock()
-                prop.val = getattr(mor, prop_name)
-                prop.name = prop_name.replace("_", ".")
-                prop_set.append(prop)
-            except AttributeError:
-                # Only VMs have powerState or host attribute
-                continue
+    for prop_name in mor_properties:
+        try:
+            prop = MagicMock()
+            prop.val = getattr(mor, prop_name)
+            prop.name = prop_name.replace("_", ".")
+            prop_set.append(prop)
+        except AttributeError:
+            # Only VMs have powerState or host attribute
+            continue
+
+    return prop_set
 
-        objects.append(MagicMock(obj=mor, propSet=prop_set))
 
-    return properties_res
+def retrieve_properties_mock(all_mors):
+    objects = [MagicMock(obj=mor, propSet=mor_prop_set(mor)) for mor in all_mors]
+    return MagicMock(objects=objects, token=None)
+
+
+def object_update_mock(mor, kind='enter', changes=None):
+    """
+    Return a mocked update of the property collector for a Mor: `changes` maps property names to their
+    new value, by default all the properties of the Mor are set.
+    """
+    if changes is None:
+        change_set = mor_prop_set(mor)
+        for change in change_set:
+            change.op = 'assign'
+    else:
+        change_set = []
+        for name, val in changes.items():
+            change = MagicMock(op='assign', val=val)
+            change.name = name
+            change_set.append(change)
+
+    return MagicMock(obj=mor, kind=kind, changeSet=change_set if kind != 'leave' else [])
+
+
+def update_set_mock(object_updates, version='1', truncated=False):
+    """
+    Return a mocked update set returned by `WaitForUpdatesEx`.
+    """
+    return MagicMock(version=version, truncated=truncated, filterSet=[MagicMock(objectSet=object_updates)])
 
 
 def assertMOR(check, instance, name=None, spec=None, tags=None, count=None, subset=False):
@@ -121,6 +150,9 @@ def disable_thread_pool(check):
     check.pool = MagicMock(apply_async=lambda func, args: func(*args))
     check.pool._workq.qsize.return_value = 0
     check.pool.get_nworkers.return_value = 0
+    check.start_schedulers = MagicMock()
+    check.realtime_scheduler = MagicMock(submit=lambda func, *args: func(*args), latencies=[], queue_depths=[])
+    check.historical_scheduler = MagicMock(submit=lambda func, *args: func(*args), latencies=[], queue_depths=[])
     return check
 
 
@@ -135,6 +167,11 @@ def get_mocked_server():
     eventmanager_mock = MagicMock(latestEvent=event_mock)
     property_collector_mock = MagicMock()
     property_collector_mock.RetrievePropertiesEx.return_value = retrieve_properties_mock(all_mors)
+    # The first update of an incremental inventory collects all the objects, there's no change afterwards
+    initial_update = update_set_mock([object_update_mock(mor) for mor in all_mors if mor is not root_folder_mock])
+    property_collector_mock.CreatePropertyCollector.return_value.WaitForUpdatesEx.side_effect = (
+        lambda version, options: initial_update if version == '' else None
+    )
     content_mock = MagicMock(
         eventManager=eventmanager_mock, propertyCollector=property_collector_mock, rootFolder=root_folder_mock
     )